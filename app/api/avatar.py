@@ -3,24 +3,17 @@
 User avatar upload endpoint.
 """
 
-import os
-import uuid
-from pathlib import Path
 from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from PIL import Image
-import io
 
-from app.core.db import get_db
+from app.core.db import SessionLocal, get_db
 from app.models.orm import User
 from app.auth.permissions import AuthContext, get_auth_context
+from app.services import avatar_images
 
 router = APIRouter(prefix="/api/users", tags=["avatar"])
 
-# Directory to store avatars
-AVATAR_DIR = Path("static/avatars")
-AVATAR_DIR.mkdir(parents=True, exist_ok=True)
-
 # Allowed file types
 ALLOWED_EXTENSIONS = {"png", "jpg", "jpeg", "gif", "webp"}
 MAX_FILE_SIZE = 5 * 1024 * 1024  # 5MB
@@ -31,16 +24,39 @@ def is_allowed_file(filename: str) -> bool:
     return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
+def _release_avatar(db: Session, user_id: int, avatar_url: str | None) -> None:
+    """Delete an avatar's files unless another user shares them (same content hash)."""
+    if not avatar_url:
+        return
+    shared = db.query(User.id).filter(User.avatar_url == avatar_url, User.id != user_id).first()
+    if not shared:
+        avatar_images.remove_files(avatar_url)
+
+
+def _set_avatar(user_id: int, avatar_url: str) -> None:
+    """Store the new avatar URL and release the old one's files (own session, threadpool)."""
+    with SessionLocal() as db:
+        user = db.query(User).filter(User.id == user_id).first()
+        if not user:
+            return
+        old_url = user.avatar_url
+        user.avatar_url = avatar_url
+        db.commit()
+        # Delete old avatar files (unless unchanged or shared)
+        if old_url and old_url != avatar_url:
+            _release_avatar(db, user_id, old_url)
+
+
 @router.post("/me/avatar")
 async def upload_avatar(
     file: UploadFile = File(...),
     auth: AuthContext = Depends(get_auth_context),
-    db: Session = Depends(get_db)
 ):
     """
     Upload profile picture for the current user.
-    Accepts images up to 5MB.
-    Returns the avatar URL.
+    Accepts images up to 5MB. Decoding and resizing run in a worker process
+    (avatar_images); the sizes are served under content-hash names.
+    Returns the avatar URL and its size variants.
     """
     # Validate file type
     if not file.filename or not is_allowed_file(file.filename):
@@ -49,8 +65,8 @@ async def upload_avatar(
             detail=f"Invalid file type. Allowed: {', '.join(ALLOWED_EXTENSIONS)}"
         )
     
-    # Read file content
-    content = await file.read()
+    # Read at most one byte past the limit
+    content = await file.read(MAX_FILE_SIZE + 1)
     
     # Check file size
     if len(content) > MAX_FILE_SIZE:
@@ -59,49 +75,19 @@ async def upload_avatar(
             detail=f"File too large. Maximum size: {MAX_FILE_SIZE // (1024*1024)}MB"
         )
     
-    # Validate it's actually an image
     try:
-        img = Image.open(io.BytesIO(content))
-        img.verify()
-    except Exception:
+        avatar_url = await avatar_images.process_upload(content)
+    except avatar_images.InvalidImage:
         raise HTTPException(
             status_code=400,
             detail="Invalid image file"
         )
     
-    # Reopen image for processing (verify() closes it)
-    img = Image.open(io.BytesIO(content))
-    
-    # Resize to max 512x512 while maintaining aspect ratio
-    img.thumbnail((512, 512), Image.Resampling.LANCZOS)
-    
-    # Generate unique filename
-    file_ext = file.filename.rsplit(".", 1)[1].lower()
-    unique_filename = f"{uuid.uuid4().hex}.{file_ext}"
-    file_path = AVATAR_DIR / unique_filename
-    
-    # Save the resized image
-    img.save(file_path, optimize=True, quality=85)
-    
-    # Delete old avatar if exists
-    user = db.query(User).filter(User.id == auth.user_id).first()
-    if user and user.avatar_url:
-        old_path = Path(user.avatar_url.lstrip("/"))
-        if old_path.exists():
-            try:
-                old_path.unlink()
-            except Exception:
-                pass  # Ignore deletion errors
-    
-    # Update user record
-    avatar_url = f"/static/avatars/{unique_filename}"
-    if user:
-        user.avatar_url = avatar_url
-        db.commit()
-        db.refresh(user)
+    await run_in_threadpool(_set_avatar, auth.user_id, avatar_url)
     
     return {
         "avatar_url": avatar_url,
+        "avatar_variants": avatar_images.variants(avatar_url),
         "message": "Avatar uploaded successfully"
     }
 
@@ -119,16 +105,10 @@ def delete_avatar(
     if not user or not user.avatar_url:
         raise HTTPException(status_code=404, detail="No avatar to delete")
     
-    # Delete file from disk
-    avatar_path = Path(user.avatar_url.lstrip("/"))
-    if avatar_path.exists():
-        try:
-            avatar_path.unlink()
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Failed to delete avatar file: {e}")
-    
-    # Remove from database
+    # Remove from database, then the files (kept if another user shares them)
+    avatar_url = user.avatar_url
     user.avatar_url = None
     db.commit()
+    _release_avatar(db, user.id, avatar_url)
     
     return {"message": "Avatar deleted successfully"}
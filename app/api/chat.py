@@ -16,9 +16,9 @@ from app.core import sessions  # legacy memory store
 from app.core.db import get_db
 from app.models import chat as chat_models
 from app.models.chat import ChatRequest, SurveyRequest, SurveySubmitRequest, StaffMessage
-from app.models.orm import Survey, Organization
 from app.services import lead_service, chat_store, event_bus, takeover
 from app.services import scoring_service
+from app.services import flow_graph, flow_sessions, survey_cache
 
 logger = logging.getLogger("ace.api.chat")
 router = APIRouter()
@@ -49,16 +49,18 @@ def make_response(
         "imageUrl": image_url,
     }
 
+# Global FLOW never changes at runtime -> compile once at import
+COMPILED_FLOW = flow_graph.compile_flow(FLOW, version=("global", FLOW.get("version")))
+
 def get_node_by_id(node_id: str) -> Dict[str, Any] | None:
-    return next((n for n in FLOW["nodes"] if n["id"] == node_id), None)
+    return COMPILED_FLOW.node(node_id)
 
 def _trace(sid: str, stage: str, node_id: str | None, state: dict, msg: str = ""):
     logger.info("[FLOW] sid=%s %s node=%s waiting_input=%s awaiting_node=%s msg='%s'",
                 sid, stage, node_id, state.get("waiting_input"), state.get("awaiting_node"), msg)
 
 def _ensure_lead(sid: str):
-    leads = lead_service.get_all_leads()
-    lead = next((l for l in leads if l.id == sid), None)
+    lead = lead_service.get_lead(sid)
     if lead:
         return lead
     from app.models.lead import Lead
@@ -84,14 +86,15 @@ def _ensure_lead(sid: str):
 def _touch_lead_message(sid: str, message: str | None):
     lead = _ensure_lead(sid)
     if message:
-        lead.lastMessage = message
-    lead.lastSeenSec = _now()
+        lead_service.update_lead(lead, lastMessage=message, lastSeenSec=_now())
+    else:
+        lead_service.update_lead(lead, lastSeenSec=_now())
 
-def _append_lead_notes(sid: str, note: str):
+def _append_lead_notes(sid: str, note: str, kind: str = "note"):
     lead = _ensure_lead(sid)
     if not note:
         return
-    lead.notes = (" | ".join([p for p in [lead.notes, note] if p])).strip(" |")
+    lead_service.append_note(lead, note, kind)
 
 def _apply_score_to_lead(sid: str, result: dict | None, *, silent: bool = False):
     """
@@ -104,12 +107,12 @@ def _apply_score_to_lead(sid: str, result: dict | None, *, silent: bool = False)
 
     interest = (result or {}).get("interest")
     if isinstance(interest, str) and interest:
-        lead.interest = interest
+        lead_service.update_lead(lead, interest=interest)
 
     comp = (result or {}).get("compatibility")
     try:
         if comp is not None:
-            lead.score = max(0, min(100, int(round(float(comp)))))
+            lead_service.update_lead(lead, score=max(0, min(100, int(round(float(comp))))))
     except Exception:
         pass
 
@@ -118,11 +121,11 @@ def _apply_score_to_lead(sid: str, result: dict | None, *, silent: bool = False)
 
     # Only set lastMessage on final compute_fit (silent=False), and NEVER include reasons
     if not silent and pitch:
-        lead.lastMessage = pitch
+        lead_service.update_lead(lead, lastMessage=pitch)
 
     # Keep internal breadcrumb for dashboard/audit
     try:
-        _append_lead_notes(sid, f"Score: {lead.score} | interest: {lead.interest}" + (f" | reasons: {reasons}" if reasons else ""))
+        _append_lead_notes(sid, f"Score: {lead.score} | interest: {lead.interest}" + (f" | reasons: {reasons}" if reasons else ""), "score")
     except Exception:
         pass
 
@@ -156,7 +159,7 @@ def _execute_action_node(sid: str, node: Dict[str, Any], flow_sessions: Dict[str
 
         qual_pairs = "; ".join(f"{k}={v}" for k, v in qual.items())
         if qual_pairs:
-            _append_lead_notes(sid, f"qual: {qual_pairs}")
+            _append_lead_notes(sid, f"qual: {qual_pairs}", "qual")
 
         result = scoring_service.score_from_qual(qual)
         _apply_score_to_lead(sid, result, silent=False)
@@ -175,7 +178,7 @@ def _execute_action_node(sid: str, node: Dict[str, Any], flow_sessions: Dict[str
             )
         if next_key:
             _set_node(flow_sessions, sid, next_key)
-            nxt = get_node_by_id(next_key)
+            nxt = COMPILED_FLOW.next_node(node_id)
             base = format_node(nxt, story_complete=False)
             base["reply"] = (reply + "\n\n" + (base.get("reply") or "")).strip()
             return base
@@ -187,8 +190,9 @@ def handle_flow(req: ChatRequest, flow_sessions: Dict[str, Dict[str, Any]]) -> d
     sid = req.sid
     msg = (req.message or "").strip()
 
-    if sid not in flow_sessions:
-        flow_sessions[sid] = {"node": "welcome"}
+    # a session without a node (e.g. only an A/B variant from the landing page) starts at welcome too
+    if not (flow_sessions.get(sid) or {}).get("node"):
+        _set_node(flow_sessions, sid, "welcome")  # persisted by the caller's save()
         node = get_node_by_id("welcome")
         _trace(sid, "init", "welcome", flow_sessions[sid], msg)
         return format_node(node, story_complete=False)
@@ -203,8 +207,7 @@ def handle_flow(req: ChatRequest, flow_sessions: Dict[str, Dict[str, Any]]) -> d
         return make_response("⚠️ Napaka v pogovornem toku.", ui={}, chat_mode="guided", story_complete=True)
 
     if "choices" in node:
-        chosen = next((c for c in node["choices"]
-                       if c.get("title") == msg or c.get("payload") == msg), None)
+        chosen = COMPILED_FLOW.match_choice(node_key, msg)
         if chosen:
             # Capture structured signals
             choice_action = (chosen.get("action") or "").strip()
@@ -214,12 +217,12 @@ def handle_flow(req: ChatRequest, flow_sessions: Dict[str, Dict[str, Any]]) -> d
                 q.update(payload)
                 if payload:
                     pairs = "; ".join(f"{k}={v}" for k, v in payload.items())
-                    _append_lead_notes(sid, f"qual: {pairs}")
+                    _append_lead_notes(sid, f"qual: {pairs}", "qual")
                 # Real-time scoring (silent)
                 _realtime_score(sid, q)
 
             next_key = chosen.get("next")
-            next_node = get_node_by_id(next_key) if next_key else None
+            next_node = COMPILED_FLOW.choice_next(chosen) if next_key else None
             if not next_node:
                 _set_node(flow_sessions, sid, next_key or "done")
                 _trace(sid, "choice->missing_next", next_key, flow_sessions[sid], msg)
@@ -259,11 +262,11 @@ def handle_flow(req: ChatRequest, flow_sessions: Dict[str, Dict[str, Any]]) -> d
             state.pop("awaiting_node", None)
 
         if node.get("action") == "store_answer":
-            _append_lead_notes(sid, msg)
+            _append_lead_notes(sid, msg, "answer")
             _touch_lead_message(sid, msg)
 
         if next_key:
-            next_node = get_node_by_id(next_key)
+            next_node = COMPILED_FLOW.next_node(current_id)
             _set_node(flow_sessions, sid, next_key)
 
             if next_node and next_node.get("openInput"):
@@ -280,7 +283,7 @@ def handle_flow(req: ChatRequest, flow_sessions: Dict[str, Dict[str, Any]]) -> d
 
         _trace(sid, "dup_or_mismatch", current_id, state, msg)
         if next_key:
-            next_node = get_node_by_id(next_key)
+            next_node = COMPILED_FLOW.next_node(current_id)
             _set_node(flow_sessions, sid, next_key)
             if next_node and next_node.get("action"):
                 _trace(sid, "dup_or_mismatch->action(exec)", next_key, flow_sessions[sid])
@@ -317,14 +320,16 @@ def format_node(node: Dict[str, Any] | None, story_complete: bool) -> Dict[str,
 
     return make_response(reply or "", ui=ui, chat_mode=mode, story_complete=story_complete)
 
-# ---------------- In-memory flow sessions ----------------
-FLOW_SESSIONS: Dict[str, Dict[str, Any]] = {}
+# ---------------- Flow sessions (bounded local LRU + durable DB tier) ----------------
+FLOW_SESSIONS = flow_sessions.shared_store()
 
 # ---------------- Route impls ----------------
 async def _chat_impl(req: ChatRequest):
     sid = req.sid
     message = (req.message or "").strip()
     logger.info("POST /chat sid=%s len=%d", sid, len(message or ""))
+    await FLOW_SESSIONS.arefresh(sid)
+    await lead_service.preload(sid)
 
     if message.startswith("/contact"):
         try:
@@ -359,6 +364,7 @@ async def _chat_impl(req: ChatRequest):
                 if next_node and next_node.get("openInput"):
                     _set_node(FLOW_SESSIONS, sid, next_key, waiting_input=True, awaiting_node=next_key)
                 _trace(sid, "contact->advance", next_key, FLOW_SESSIONS[sid], "advance after /contact")
+                await FLOW_SESSIONS.asave(sid)
                 return format_node(next_node, story_complete=False)
 
             return make_response("Kontakt shranjen ✅ — nadaljujeva. 🔥", ui=None, chat_mode="guided", story_complete=False)
@@ -380,7 +386,7 @@ async def _chat_impl(req: ChatRequest):
     _touch_lead_message(sid, message)
 
     try:
-        user_msg = chat_store.append_message(sid, role="user", text=message)
+        user_msg = chat_store.append_message(sid, role="user", text=message, org=req.tenant_slug)
         await event_bus.publish(sid, "message.created", user_msg)
     except Exception:
         logger.exception("persist/publish user message failed sid=%s", sid)
@@ -392,6 +398,7 @@ async def _chat_impl(req: ChatRequest):
 
     try:
         result = handle_flow(req, FLOW_SESSIONS)
+        await FLOW_SESSIONS.asave(sid)
     except Exception:
         logger.exception("flow error sid=%s", sid)
         raise
@@ -399,7 +406,7 @@ async def _chat_impl(req: ChatRequest):
     reply_text = (result.get("reply") or "").strip()
     if reply_text:
         try:
-            assistant_msg = chat_store.append_message(sid, role="assistant", text=reply_text)
+            assistant_msg = chat_store.append_message(sid, role="assistant", text=reply_text, org=req.tenant_slug)
             await event_bus.publish(sid, "message.created", assistant_msg)
             _touch_lead_message(sid, reply_text)
         except Exception:
@@ -421,6 +428,8 @@ async def _chat_stream_impl(req: ChatRequest):
     sid = req.sid
     message = (req.message or "").strip()
     logger.info("POST /chat/stream sid=%s len=%d", sid, len(message or ""))
+    await FLOW_SESSIONS.arefresh(sid)
+    await lead_service.preload(sid)
 
     if message.startswith("/contact"):
         try:
@@ -455,6 +464,7 @@ async def _chat_stream_impl(req: ChatRequest):
                 if next_node and next_node.get("openInput"):
                     _set_node(FLOW_SESSIONS, sid, next_key, waiting_input=True, awaiting_node=next_key)
                 _trace(sid, "contact->advance(stream)", next_key, FLOW_SESSIONS[sid], "advance after /contact")
+                await FLOW_SESSIONS.asave(sid)
                 reply_text = (format_node(next_node, story_complete=False).get("reply") or "").strip()
 
                 async def ok():
@@ -487,7 +497,7 @@ async def _chat_stream_impl(req: ChatRequest):
     _touch_lead_message(sid, message)
 
     try:
-        user_msg = chat_store.append_message(sid, role="user", text=message)
+        user_msg = chat_store.append_message(sid, role="user", text=message, org=req.tenant_slug)
         await event_bus.publish(sid, "message.created", user_msg)
     except Exception:
         logger.exception("persist/publish user message failed (stream) sid=%s", sid)
@@ -500,6 +510,7 @@ async def _chat_stream_impl(req: ChatRequest):
 
     try:
         result = handle_flow(req, FLOW_SESSIONS)
+        await FLOW_SESSIONS.asave(sid)
     except Exception:
         logger.exception("flow error (stream) sid=%s", sid)
         raise
@@ -520,7 +531,7 @@ async def _chat_stream_impl(req: ChatRequest):
 
     if reply_text:
         try:
-            assistant_msg = chat_store.append_message(sid, role="assistant", text=reply_text)
+            assistant_msg = chat_store.append_message(sid, role="assistant", text=reply_text, org=req.tenant_slug)
             await event_bus.publish(sid, "message.created", assistant_msg)
             _touch_lead_message(sid, reply_text)
         except Exception:
@@ -541,6 +552,7 @@ async def chat_stream_slash(req: ChatRequest):
 async def _survey_impl(body: SurveyRequest):
     sid = body.sid
     logger.info("POST /chat/survey sid=%s", sid)
+    await lead_service.preload(sid)
 
     if takeover.is_active(sid):
         return {"ok": True, "human_mode": True}
@@ -554,11 +566,11 @@ async def _survey_impl(body: SurveyRequest):
     survey_text = " | ".join(parts) if parts else "No answers provided."
 
     _ensure_lead(sid)
-    _append_lead_notes(sid, survey_text)
+    _append_lead_notes(sid, survey_text, "survey")
     _touch_lead_message(sid, getattr(body, "question2", None) or getattr(body, "question1", None) or getattr(body, "industry", None) or "")
 
     try:
-        user_msg = chat_store.append_message(sid, role="user", text=f"[Survey] {survey_text}")
+        user_msg = chat_store.append_message(sid, role="user", text=f"[Survey] {survey_text}", org=body.tenant_slug)
         await event_bus.publish(sid, "message.created", user_msg)
     except Exception:
         logger.exception("persist/publish survey message failed sid=%s", sid)
@@ -567,7 +579,7 @@ async def _survey_impl(body: SurveyRequest):
     story_complete = True
 
     try:
-        assistant_msg = chat_store.append_message(sid, role="assistant", text=reply)
+        assistant_msg = chat_store.append_message(sid, role="assistant", text=reply, org=body.tenant_slug)
         await event_bus.publish(sid, "message.created", assistant_msg)
         _touch_lead_message(sid, reply)
     except Exception:
@@ -595,6 +607,7 @@ async def _staff_impl(body: StaffMessage):
     text = (body.text or "").strip()
 
     takeover.enable(sid)
+    await lead_service.preload(sid)
 
     if not text:
         return {"ok": False}
@@ -603,7 +616,7 @@ async def _staff_impl(body: StaffMessage):
 
     saved = None
     try:
-        saved = chat_store.append_message(sid, role="staff", text=text)
+        saved = chat_store.append_message(sid, role="staff", text=text, org=body.tenant_slug)
         sessions.add_chat(sid, "staff", text)
         await event_bus.publish(sid, "message.created", saved)
     except Exception:
@@ -620,6 +633,22 @@ async def staff_message_slash(body: StaffMessage):
     return await _staff_impl(body)
 
 # ---- survey/submit (NEW structured survey system) ----
+def _compiled_survey_flow(db: Session | None, org_slug: str | None, survey_slug: str | None) -> flow_graph.CompiledFlow:
+    """
+    Compiled flow of the live survey identified by (org_slug, survey_slug),
+    via survey_cache (no DB reads once warm); falls back to the global FLOW.
+    """
+    d = survey_cache.resolve(db, org_slug, survey_slug)
+    if d is None or d.compiled is None:
+        return COMPILED_FLOW
+    return d.compiled
+
+def _survey_answer_score(compiled: flow_graph.CompiledFlow, node_id: str, value: Any) -> Optional[int]:
+    """Score of one survey answer: the answer's own score, else the flow's choice score."""
+    if isinstance(value, dict) and 'score' in value:
+        return value['score']
+    return compiled.answer_score(node_id, value)
+
 async def _survey_submit_impl(body: SurveySubmitRequest, db: Session = None):
     """
     Submit survey answer for a specific node.
@@ -634,6 +663,7 @@ async def _survey_submit_impl(body: SurveySubmitRequest, db: Session = None):
     
     logger.info("POST /survey/submit sid=%s node=%s progress=%d org=%s survey=%s", 
                 sid, node_id, progress, org_slug, survey_slug)
+    await lead_service.preload(sid)
     
     # Check takeover - if human mode, pause survey
     if takeover.is_active(sid):
@@ -659,72 +689,46 @@ async def _survey_submit_impl(body: SurveySubmitRequest, db: Session = None):
     lead = _ensure_lead(sid)
     if isinstance(answer, dict):
         if 'email' in answer and answer['email']:
-            lead.emailText = answer['email']
-            lead.email = True
+            lead_service.update_lead(lead, emailText=answer['email'], email=True)
             logger.info("Extracted email from answer: %s", answer['email'])
         if 'phone' in answer and answer['phone']:
-            lead.phoneText = answer['phone']
-            lead.phone = True
+            lead_service.update_lead(lead, phoneText=answer['phone'], phone=True)
             logger.info("Extracted phone from answer: %s", answer['phone'])
         # Also check text field for email/phone-type questions
         if 'text' in answer and answer['text']:
             text = str(answer['text']).strip()
             # Simple detection: if contains @, treat as email
             if '@' in text and '.' in text:
-                lead.emailText = text
-                lead.email = True
+                lead_service.update_lead(lead, emailText=text, email=True)
                 logger.info("Extracted email from text field: %s", text)
             # If looks like phone (mostly digits/spaces/dashes)
             elif text and len([c for c in text if c.isdigit()]) >= 8:
-                lead.phoneText = text
-                lead.phone = True
+                lead_service.update_lead(lead, phoneText=text, phone=True)
                 logger.info("Extracted phone from text field: %s", text)
     
+    # Survey flow (falls back to global FLOW); resolved once for both scoring passes
+    compiled = COMPILED_FLOW
+    try:
+        compiled = _compiled_survey_flow(db, org_slug, survey_slug)
+    except Exception as e:
+        logger.warning("Failed to resolve survey flow org=%s survey=%s: %s", org_slug, survey_slug, e)
+
     # Extract score directly from answer (chatbot includes it)
     answer_score = 0
     try:
         if isinstance(answer, dict) and 'score' in answer:
             answer_score = answer['score']
             logger.info("Extracted score from answer: %d", answer_score)
-        # Fallback: try to load from flow if score not in answer
-        elif db and org_slug and survey_slug:
-            # Fetch survey from database
-            org = db.query(Organization).filter(
-                Organization.slug == org_slug,
-                Organization.active == True
-            ).first()
-            
-            if org:
-                survey = db.query(Survey).filter(
-                    Survey.slug == survey_slug,
-                    Survey.organization_id == org.id,
-                    Survey.status == "live"
-                ).first()
-                
-                if survey and survey.flow_json:
-                    # Get node from survey flow
-                    survey_flow = survey.flow_json
-                    flow_nodes = survey_flow.get('nodes', [])
-                    flow_node = next((n for n in flow_nodes if n.get('id') == node_id), None)
-                    logger.info("Loaded flow node from survey database: %s", node_id)
-        
-        # Fallback to global FLOW if survey-specific flow not found
-        if not flow_node:
-            flow_node = get_node_by_id(node_id)
-            logger.info("Using global FLOW for node: %s", node_id)
-        
-        if flow_node:
-            if isinstance(answer, str) and flow_node.get('choices'):
-                # Multiple choice - find the matching choice and get its score
-                for choice in flow_node['choices']:
-                    if choice.get('title') == answer:
-                        answer_score = choice.get('score', 0)
-                        logger.info("Choice answer score for '%s': %d", answer, answer_score)
-                        break
-            elif flow_node.get('openInput'):
-                # Open-ended question - use base score
-                answer_score = flow_node.get('score', 0)
-                logger.info("Open input base score: %d", answer_score)
+        else:
+            # Fallback: score from the survey flow (or global FLOW)
+            node_flow = compiled
+            if node_flow.node(node_id) is None and node_flow is not COMPILED_FLOW:
+                node_flow = COMPILED_FLOW
+                logger.info("Using global FLOW for node: %s", node_id)
+            node_score = node_flow.answer_score(node_id, answer)
+            if node_score is not None:
+                answer_score = node_score
+                logger.info("Flow answer score for node %s: %d", node_id, answer_score)
     except Exception as e:
         logger.warning("Failed to get score for answer: %s", e)
     
@@ -732,61 +736,22 @@ async def _survey_submit_impl(body: SurveySubmitRequest, db: Session = None):
     all_answers = body.all_answers if body.all_answers else {node_id: answer}
     lead = lead_service.update_survey_progress(sid, progress, all_answers)
     
-    # Recalculate TOTAL score from ALL answers using survey-specific flow
-    # This ensures score is calculated properly even if user goes back/forth
+    # TOTAL score over ALL answers using survey-specific flow
+    # Changed answers replace their node's contribution, so going back/forth stays correct
     try:
         lead = _ensure_lead(sid)
-        total_score = 50  # Start at base 50
-        answer_count = 0
-        
-        # Load survey flow to get all node scores
-        survey_flow_nodes = []
-        if db and org_slug and survey_slug:
-            org = db.query(Organization).filter(
-                Organization.slug == org_slug,
-                Organization.active == True
-            ).first()
-            if org:
-                survey = db.query(Survey).filter(
-                    Survey.slug == survey_slug,
-                    Survey.organization_id == org.id,
-                    Survey.status == "live"
-                ).first()
-                if survey and survey.flow_json:
-                    survey_flow_nodes = survey.flow_json.get('nodes', [])
-        
-        # Fallback to global FLOW
-        if not survey_flow_nodes:
-            survey_flow_nodes = FLOW.get('nodes', [])
-        
-        # Calculate total score from all survey answers
-        for ans_node_id, ans_value in (lead.survey_answers or {}).items():
-            # Extract score from answer object if available
-            if isinstance(ans_value, dict) and 'score' in ans_value:
-                total_score += ans_value['score']
-                answer_count += 1
-                continue
-            
-            # Fallback: Find the node definition and match answer text
-            node_def = next((n for n in survey_flow_nodes if n.get('id') == ans_node_id), None)
-            if not node_def:
-                continue
-            
-            # Get score for this answer
-            if isinstance(ans_value, str) and node_def.get('choices'):
-                # Multiple choice - find matching choice score
-                for choice in node_def['choices']:
-                    if choice.get('title') == ans_value:
-                        total_score += choice.get('score', 0)
-                        answer_count += 1
-                        break
-            elif node_def.get('openInput'):
-                # Open-ended or contact question - use base score
-                total_score += node_def.get('score', 0)
-                answer_count += 1
+        # Per-node contributions: only answers that changed since the last
+        # submit are rescored (full rescore when the survey flow changes)
+        scored = lead_service.survey_score(
+            lead,
+            lambda ans_node_id, ans_value: _survey_answer_score(compiled, ans_node_id, ans_value),
+            version=compiled.version,
+        )
+        total_score = 50 + scored.total  # Start at base 50
+        answer_count = scored.count
         
         # Just use the total score directly
-        lead.score = total_score
+        lead_service.update_lead(lead, score=total_score)
         
         # Update interest level based on score
         if lead.score >= 20:
@@ -803,7 +768,7 @@ async def _survey_submit_impl(body: SurveySubmitRequest, db: Session = None):
     
     # Store answer in notes for audit trail
     answer_str = json.dumps(answer) if not isinstance(answer, str) else answer
-    _append_lead_notes(sid, f"Survey [{node_id}]: {answer_str}")
+    _append_lead_notes(sid, f"Survey [{node_id}]: {answer_str}", "survey")
     
     # Publish event for real-time dashboard updates with score
     try:
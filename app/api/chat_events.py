@@ -6,7 +6,7 @@ import logging
 import time
 from typing import Any
 
-from fastapi import APIRouter, Query
+from fastapi import APIRouter, Header, Query
 from fastapi.responses import HTMLResponse, StreamingResponse
 from pydantic import BaseModel
 
@@ -16,6 +16,7 @@ logger = logging.getLogger("ace.api.chat_events")
 router = APIRouter()
 
 HEARTBEAT_SECS = 15.0
+RETRY_MS = 2000  # EventSource reconnect delay (it resends Last-Event-ID)
 
 
 class EmitRequest(BaseModel):
@@ -26,36 +27,74 @@ class EmitRequest(BaseModel):
 
 # ------------------------ SSE (kept, optional) -------------------------------
 
-async def _sse_stream(topic: str):
-    q = await event_bus.subscribe(topic)
-    logger.info("SSE connect topic=%s", topic)
+def _frame(name: str, data: Any, seq: int | None = None) -> str:
+    head = f"id: {seq}\n" if seq is not None else ""
+    return f"{head}event: {name}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def sse_stream(topic: str, last_event_id: int | None = None, policy: str | None = None):
+    """SSE frames of a bus topic, replaying history after `last_event_id` (also used by /kpis/stream)."""
+    # subscribe before reading history so nothing falls in between
+    q = await event_bus.subscribe(topic, policy=policy)
+    logger.info("SSE connect topic=%s last_event_id=%s policy=%s", topic, last_event_id, q.policy)
+    sent_seq = 0
     try:
-        yield ":ok\n\n"
+        yield f"retry: {RETRY_MS}\n:ok\n\n"
+        if last_event_id is not None:
+            backlog, complete = event_bus.resume_since(topic, last_event_id)
+            if not complete:
+                # history no longer reaches back: the client has to reload
+                yield _frame("reset", {"topic": topic, "since": last_event_id})
+            for evt in backlog:
+                sent_seq = evt["_seq"]
+                yield _frame(evt.get("type", "message"), evt, sent_seq)
+            logger.info("SSE resume topic=%s from=%d replayed=%d", topic, last_event_id, len(backlog))
+            sent_seq = max(sent_seq, last_event_id)
         last_hb = time.time()
         while True:
             try:
                 evt = await asyncio.wait_for(q.get(), timeout=HEARTBEAT_SECS)
-                data = json.dumps(evt, ensure_ascii=False)
-                name = evt.get("type", "message")
-                yield f"event: {name}\n"
-                yield f"data: {data}\n\n"
             except asyncio.TimeoutError:
                 now = time.time()
                 if now - last_hb >= HEARTBEAT_SECS:
                     hb = {"ts": now, "topic": topic}
-                    yield "event: heartbeat\n"
-                    yield f"data: {json.dumps(hb)}\n\n"
+                    yield _frame("heartbeat", hb)
                     last_hb = now
+                continue
+            except event_bus.SubscriberLagged:
+                # end the stream; EventSource reconnects with Last-Event-ID and
+                # the history ring fills the gap
+                yield _frame("lagged", {"topic": topic, "resume_from": sent_seq})
+                logger.warning("SSE lagged topic=%s resume_from=%d", topic, sent_seq)
+                return
+            seq = event_bus.seq_of(topic, evt)
+            if seq is not None:
+                if seq <= sent_seq:
+                    continue  # already replayed from history
+                sent_seq = seq
+            yield _frame(evt.get("type", "message"), evt, seq)
     finally:
         await event_bus.unsubscribe(topic, q)
-        logger.info("SSE disconnect topic=%s", topic)
+        logger.info("SSE disconnect topic=%s stats=%s", topic, q.stats())
 
 
 @router.get("/events", name="chat_events_stream")
-async def chat_events_stream(sid: str = Query("*", min_length=1)):
+async def chat_events_stream(
+    sid: str = Query("*", min_length=1),
+    policy: str | None = Query(None, description="drop_oldest | coalesce | disconnect"),
+    last_event_id: int | None = Query(None, ge=0),
+    last_event_id_header: str | None = Header(None, alias="Last-Event-ID"),
+):
+    """
+    SSE stream of a topic. Each event carries `id: <seq>`; a reconnecting
+    EventSource sends it back as Last-Event-ID (or pass ?last_event_id=) and
+    the missed events are replayed from history.
+    """
+    if last_event_id is None and last_event_id_header and last_event_id_header.strip().isdigit():
+        last_event_id = int(last_event_id_header.strip())
     logger.info("GET /chat-events/events sid=%s (open)", sid)
     return StreamingResponse(
-        _sse_stream(sid),
+        sse_stream(sid, last_event_id, policy),
         media_type="text/event-stream",
         headers={
             "Cache-Control": "no-cache",
@@ -66,8 +105,15 @@ async def chat_events_stream(sid: str = Query("*", min_length=1)):
 
 
 @router.get("/events/", include_in_schema=False, name="chat_events_stream_slash")
-async def chat_events_stream_slash(sid: str = Query("*", min_length=1)):
-    return await chat_events_stream(sid=sid)
+async def chat_events_stream_slash(
+    sid: str = Query("*", min_length=1),
+    policy: str | None = Query(None),
+    last_event_id: int | None = Query(None, ge=0),
+    last_event_id_header: str | None = Header(None, alias="Last-Event-ID"),
+):
+    return await chat_events_stream(
+        sid=sid, policy=policy, last_event_id=last_event_id, last_event_id_header=last_event_id_header
+    )
 
 
 # ------------------------ LONG-POLL (no duplicates) --------------------------
@@ -85,8 +131,6 @@ def chat_events_since(
     include_broadcast = (sid == "*")
     items = event_bus.collect_since(sid, since, limit=limit, include_broadcast=include_broadcast)
     next_seq = max([e.get("_seq", since) for e in items], default=since)
-    for e in items:
-        e.pop("_topic", None)
     logger.info("GET /chat-events/since sid=%s since=%d -> %d ev, next=%d", sid, since, len(items), next_seq)
     return {"ok": True, "events": items, "next": next_seq}
 
@@ -108,8 +152,6 @@ async def chat_events_poll(
         sid, since, timeout=timeout, limit=limit, include_broadcast=include_broadcast
     )
     next_seq = max([e.get("_seq", since) for e in items], default=since)
-    for e in items:
-        e.pop("_topic", None)
     logger.info("GET /chat-events/poll sid=%s since=%d timeout=%.1f -> %d ev, next=%d",
                 sid, since, timeout, len(items), next_seq)
     return {"ok": True, "events": items, "next": next_seq}
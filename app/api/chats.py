@@ -1,33 +1,79 @@
 # app/api/chats.py
-from fastapi import APIRouter, Query
+import base64
+
+from fastapi import APIRouter, HTTPException, Query, Response
 from app.services import chat_store
-from app.core import sessions  # legacy fallback
 import logging
 
 logger = logging.getLogger("ace.api.chats")
 router = APIRouter()
 
-def _get_chats(sid: str | None):
+MAX_PAGE = 1000
+
+
+def _encode_cursor(pos: chat_store.Pos) -> str:
+    raw = f"{pos[0]}|{pos[1]}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str | None) -> chat_store.Pos | None:
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        ts, _, idx = raw.partition("|")
+        return int(ts), max(0, int(idx))
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _positions(before: str | None, after: str | None, before_ts: int | None, after_ts: int | None):
+    """Opaque cursors win; before_ts/after_ts keep their strict per-second meaning."""
+    legacy_before, legacy_after = chat_store.pos_from_ts(before_ts, after_ts)
+    return _decode_cursor(before) or legacy_before, _decode_cursor(after) or legacy_after
+
+
+def _page_headers(response: Response, page: chat_store.ChatPage) -> list:
+    """
+    The page's messages; X-Before-Cursor / X-After-Cursor go back as
+    `before` / `after` to fetch the older / newer page.
+    """
+    if page.before is not None:
+        response.headers["X-Before-Cursor"] = _encode_cursor(page.before)
+    if page.after is not None:
+        response.headers["X-After-Cursor"] = _encode_cursor(page.after)
+    return page.messages
+
+
+def _sid_chats(
+    response: Response,
+    sid: str,
+    before: chat_store.Pos | None,
+    after: chat_store.Pos | None,
+    limit: int | None,
+):
     """
-    Core handler for both /chats and /chats/.
-    - If sid is provided: list messages for that sid (persistent first, legacy fallback).
-    - If sid is missing: flat list across all sids (keeps previous UI behavior).
+    Messages of one sid. Without a cursor/limit: the full history (previous
+    behavior). With one: a page, oldest first. `before` walks back, `after`
+    walks forward; pass the X-Before-Cursor / X-After-Cursor of the previous
+    page.
     """
-    if sid:
-        items = chat_store.list_messages(sid)
-        if items:
-            return items
-        logger.info("chats: fallback to legacy sessions for sid=%s", sid)
-        return sessions.get_chats_for_sid(sid)
+    if before is None and after is None and limit is None:
+        return chat_store.list_messages(sid)
+    page = chat_store.page_messages(sid, before=before, after=after, limit=min(limit or 200, MAX_PAGE))
+    return _page_headers(response, page)
 
-    flat = chat_store.list_all_flat()
-    if flat:
-        return flat
-    logger.info("chats: flat fallback to legacy sessions (no persistent data yet)")
-    return sessions.get_all_chats()
 
 @router.get("/", name="get_chats_slash")
-def get_chats_slash(sid: str | None = Query(None)):
+def get_chats_slash(
+    response: Response,
+    sid: str | None = Query(None),
+    before: str | None = Query(None),
+    after: str | None = Query(None),
+    before_ts: int | None = Query(None),
+    after_ts: int | None = Query(None),
+    limit: int | None = Query(None, ge=1, le=MAX_PAGE),
+):
     """
     Returns ONLY messages for the given sid.
     If sid is missing, returns an empty list (no global history).
@@ -35,11 +81,36 @@ def get_chats_slash(sid: str | None = Query(None)):
     if not sid:
         logger.info("chats: sid missing -> return [] (no flat history)")
         return []
-    return chat_store.list_messages(sid)
+    return _sid_chats(response, sid, *_positions(before, after, before_ts, after_ts), limit)
 
 @router.get("", include_in_schema=False, name="get_chats_no_slash")
-def get_chats_no_slash(sid: str | None = Query(None)):
+def get_chats_no_slash(
+    response: Response,
+    sid: str | None = Query(None),
+    before: str | None = Query(None),
+    after: str | None = Query(None),
+    before_ts: int | None = Query(None),
+    after_ts: int | None = Query(None),
+    limit: int | None = Query(None, ge=1, le=MAX_PAGE),
+):
     if not sid:
         logger.info("chats: sid missing (no-slash) -> []")
         return []
-    return chat_store.list_messages(sid)
+    return _sid_chats(response, sid, *_positions(before, after, before_ts, after_ts), limit)
+
+@router.get("/all", name="get_chats_all")
+def get_chats_all(
+    response: Response,
+    before: str | None = Query(None),
+    after: str | None = Query(None),
+    before_ts: int | None = Query(None),
+    after_ts: int | None = Query(None),
+    limit: int = Query(200, ge=1, le=MAX_PAGE),
+):
+    """
+    Messages across all sids (dashboard "all chats"), oldest first.
+    Newest page by default; page back with `before` = X-Before-Cursor, poll
+    forward with `after` = X-After-Cursor of the previous page.
+    """
+    before_pos, after_pos = _positions(before, after, before_ts, after_ts)
+    return _page_headers(response, chat_store.page_all(limit, before=before_pos, after=after_pos))
@@ -1,16 +1,13 @@
 from fastapi import APIRouter
 import logging
 
+from app.services import lead_service
+
 router = APIRouter()
 logger = logging.getLogger("ace")
 
 @router.get("/")
 async def get_funnel():
-    funnel = {
-        "awareness": 0,
-        "interest": 0,
-        "meeting": 0,
-        "close": 0
-    }
+    funnel = lead_service.get_funnel()
     logger.info(f"Returning funnel: {funnel}")
     return funnel
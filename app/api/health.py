@@ -6,6 +6,7 @@ from typing import List, Dict, Any
 from fastapi import APIRouter, Query, Request
 import pydantic  # type: ignore
 
+from app.core.password_pool import pool as password_pool
 from app.models import chat as chat_models
 from app.services import chat_store
 from app.services import event_bus  # for /health/events
@@ -86,6 +87,22 @@ def events_health():
     """
     s = event_bus.stats()
     total = s.pop("__total__", 0)
+    long_polls = s.pop("__long_polls__", 0)
     topics = [{"topic": k, "subscribers": v} for k, v in sorted(s.items())]
-    logger.info("GET /health/events total=%d topics=%d", total, len(topics))
-    return {"ok": True, "total": total, "topics": topics}
+    logger.info("GET /health/events total=%d topics=%d long_polls=%d", total, len(topics), long_polls)
+    return {
+        "ok": True,
+        "total": total,
+        "topics": topics,
+        "long_polls": long_polls,
+        "transport": event_bus.transport_stats(),
+        "subscribers": event_bus.subscriber_stats()[:50],
+    }
+
+
+@router.get("/passwords")
+def passwords_health():
+    """Password hashing pool: queue depth, wait/run times, rejections."""
+    s = password_pool.stats()
+    logger.info("GET /health/passwords in_flight=%d queued=%d", s["in_flight"], s["queued"])
+    return {"ok": True, **s}
@@ -1,17 +1,40 @@
 from fastapi import APIRouter
+from fastapi.responses import StreamingResponse
+import json
 import logging
 
+from app.api.chat_events import sse_stream
+from app.services import event_bus, lead_service
+
 router = APIRouter()
 logger = logging.getLogger("ace")
 
 @router.get("/")
 async def get_kpis():
-    kpis = {
-        "visitors": 0,
-        "interactions": 0,
-        "contacts": 0,
-        "avgResponseSec": 0,
-        "activeLeads": 0
-    }
+    kpis = lead_service.get_kpis()
     logger.info(f"Returning KPIs: {kpis}")
     return kpis
+
+
+async def _kpi_stream():
+    # remember the topic position first: deltas published after it are replayed
+    # on top of the snapshot (they carry absolute values, so overlap is harmless)
+    seq = event_bus.last_seq(lead_service.KPI_TOPIC)
+    snap = {"version": lead_service.aggregates_version(), **lead_service.kpi_snapshot()}
+    yield f"event: kpi.snapshot\ndata: {json.dumps(snap, ensure_ascii=False)}\n\n"
+    async for frame in sse_stream(lead_service.KPI_TOPIC, last_event_id=seq, policy="coalesce"):
+        yield frame
+
+
+@router.get("/stream")
+async def stream_kpis():
+    """
+    SSE: one `kpi.snapshot` (kpis + funnel + objections), then `kpi.delta`
+    events with only the fields that changed.
+    """
+    logger.info("GET /kpis/stream (open)")
+    return StreamingResponse(
+        _kpi_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -1,9 +1,9 @@
 from __future__ import annotations
-from fastapi import APIRouter
+from fastapi import APIRouter, Query
 import logging
 from app.services import lead_service
 from app.models.lead import Lead
-from typing import List
+from typing import List, Optional
 
 router = APIRouter()
 logger = logging.getLogger("ace")
@@ -14,10 +14,24 @@ async def get_leads():
     logger.info(f"Returning {len(leads)} leads")
     return leads
 
+@router.get("/{lead_id}/notes")
+def get_lead_notes(
+    lead_id: str,
+    before: Optional[int] = Query(None, ge=1),
+    limit: int = Query(50, ge=1, le=500),
+):
+    """
+    Full note history of a lead, newest first. Page back by passing the
+    returned `next_before` as `before`; it is null on the last page.
+    Sync on purpose: older pages may come from the lead_notes table.
+    """
+    items, next_before = lead_service.get_notes(lead_id, before=before, limit=limit)
+    return {"lead_id": lead_id, "items": items, "next_before": next_before}
+
 @router.delete("/{lead_id}")
 async def delete_lead(lead_id: str):
     """Delete a lead by ID."""
-    deleted = lead_service.delete_lead(lead_id)
+    deleted = await lead_service.adelete_lead(lead_id)
     if deleted:
         logger.info(f"Deleted lead {lead_id}")
         return {"success": True, "message": f"Lead {lead_id} deleted"}
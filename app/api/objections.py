@@ -1,11 +1,13 @@
 from fastapi import APIRouter
 import logging
 
+from app.services import lead_service
+
 router = APIRouter()
 logger = logging.getLogger("ace")
 
 @router.get("/")
 async def get_objections():
-    objections = []
+    objections = lead_service.get_objections()
     logger.info(f"Returning objections: {objections}")
     return objections
@@ -9,6 +9,7 @@ from sqlalchemy.orm import Session
 
 from app.core.db import get_db
 from app.models.orm import Organization, User
+from app.services import avatar_images
 
 router = APIRouter(prefix="/api/organizations", tags=["public"])
 
@@ -23,7 +24,9 @@ def get_organization_avatar(
     This is public so chatbots can display the agent's photo.
     
     Returns the avatar_url of the first active admin user found,
-    or null if no avatar is set.
+    or null if no avatar is set. For avatars uploaded with size variants,
+    avatar_variants maps size -> WebP URL (plus "fallback") and
+    avatar_thumb_url is the smallest one, which is what the chatbot shows.
     """
     # Find organization
     org = db.query(Organization).filter(
@@ -43,8 +46,12 @@ def get_organization_avatar(
     ).first()
     
     if admin_with_avatar:
+        avatar_url = admin_with_avatar.avatar_url
+        variants = avatar_images.variants(avatar_url)
         return {
-            "avatar_url": admin_with_avatar.avatar_url,
+            "avatar_url": avatar_url,
+            "avatar_thumb_url": avatar_images.thumb(avatar_url),
+            "avatar_variants": variants,
             "organization_name": org.name
         }
     
@@ -58,6 +65,8 @@ def get_organization_avatar(
     if any_admin:
         return {
             "avatar_url": None,
+            "avatar_thumb_url": None,
+            "avatar_variants": {},
             "organization_name": org.name
         }
     
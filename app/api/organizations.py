@@ -14,7 +14,7 @@ from app.models.schemas import (
     OrganizationUpdate,
     OrganizationResponse
 )
-from app.auth.permissions import AuthContext, require_org_admin
+from app.auth.permissions import AuthContext, invalidate_org, require_org_admin
 
 router = APIRouter(prefix="/api/organizations", tags=["organizations"])
 
@@ -182,5 +182,6 @@ def delete_organization(
     
     db.delete(org)
     db.commit()
+    invalidate_org(org_id)
     
     return None
@@ -7,14 +7,16 @@ These are accessible without authentication for customers to fill out surveys.
 import random
 from typing import Dict, Any
 from datetime import datetime
-from fastapi import APIRouter, HTTPException, Depends, Response
+from fastapi import APIRouter, HTTPException, Depends, Header, Query, Response
+from sqlalchemy import literal, literal_column, select, true
 from sqlalchemy.orm import Session
 
-from app.core.db import get_db
+from app.core.db import dialect_insert, get_db
 from app.models.orm import Survey, SurveyResponse as SurveyResponseModel
 from app.models.schemas import SurveyResponseCreate, SurveyResponseUpdate, SurveyResponseDetail
 
 from app.models.orm import Organization
+from app.services import ab_assign, flow_sessions, survey_cache, survey_stats
 
 router = APIRouter(prefix="/s", tags=["public-surveys"])
 
@@ -46,144 +48,85 @@ def list_public_surveys(db: Session = Depends(get_db)):
     ]
 
 
+def _page_response(page, if_none_match: str | None) -> Response:
+    """Pre-serialized survey page; 304 when the client already has this ETag."""
+    etag, body = page
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if if_none_match:
+        tags = {t.strip().removeprefix("W/") for t in if_none_match.split(",")}
+        if "*" in tags or etag in tags:
+            return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
 @router.get("/{org_slug}/{survey_slug}")
 def get_survey_by_slug(
     org_slug: str,
     survey_slug: str,
-    db: Session = Depends(get_db)
-) -> Dict[str, Any]:
+    sid: str | None = Query(None),
+    db: Session = Depends(get_db),
+    if_none_match: str | None = Header(None),
+) -> Response:
     """
     Get survey flow by organization slug and survey slug.
     Returns the survey flow JSON for the customer to fill out.
+    Served from survey_cache (no DB reads once warm), with ETag / If-None-Match.
+    With `sid`, the A/B variant is sticky for that visitor (ab_assign, remembered
+    in the visitor's flow session).
     """
-    # Find organization by slug
-    org = db.query(Organization).filter(
-        Organization.slug == org_slug,
-        Organization.active == True
-    ).first()
-    
-    if not org:
+    survey = survey_cache.public_page(db, org_slug, survey_slug)
+    if survey.missing == "org":
         raise HTTPException(status_code=404, detail="Organization not found")
-    
-    # Find survey by slug (must be live and belong to org)
-    survey = db.query(Survey).filter(
-        Survey.slug == survey_slug,
-        Survey.organization_id == org.id,
-        Survey.status == "live"
-    ).first()
-    
-    if not survey:
+    if survey.missing:
         raise HTTPException(status_code=404, detail="Survey not found or not active")
     
-    # For A/B tests, randomly assign variant
+    # For A/B tests: sticky hash assignment per visitor, random without a sid
     if survey.survey_type == "ab_test":
-        variant = random.choice(["a", "b"])
-        flow = survey.variant_a_flow if variant == "a" else survey.variant_b_flow
-        
-        return {
-            "survey_id": survey.id,
-            "name": survey.name,
-            "slug": survey.slug,
-            "org_slug": org.slug,
-            "survey_type": survey.survey_type,
-            "variant": variant,
-            "flow": flow
-        }
+        if sid and survey.buckets is not None:
+            variant = ab_assign.assign(survey.survey_id, sid, survey.buckets, flow_sessions.shared_store())
+        else:
+            variant = random.choice(["a", "b"])
+        return _page_response(survey.pages[variant], if_none_match)
     
     # Regular survey
-    return {
-        "survey_id": survey.id,
-        "name": survey.name,
-        "slug": survey.slug,
-        "org_slug": org.slug,
-        "survey_type": survey.survey_type,
-        "variant": None,
-        "flow": survey.flow_json
-    }
+    return _page_response(survey.pages[None], if_none_match)
+
+
+def _variant_page(variant: str, org_slug: str, survey_slug: str, db: Session, if_none_match: str | None) -> Response:
+    survey = survey_cache.public_page(db, org_slug, survey_slug)
+    if survey.missing == "org":
+        raise HTTPException(status_code=404, detail="Organization not found")
+    if survey.missing or survey.survey_type != "ab_test":
+        raise HTTPException(status_code=404, detail="A/B test survey not found or not active")
+    if variant not in survey.configured:
+        raise HTTPException(status_code=500, detail=f"Variant {variant.upper()} not configured")
+    return _page_response(survey.pages[variant], if_none_match)
 
 
 @router.get("/{org_slug}/{survey_slug}/a")
 def get_survey_variant_a(
     org_slug: str,
     survey_slug: str,
-    db: Session = Depends(get_db)
-) -> Dict[str, Any]:
+    db: Session = Depends(get_db),
+    if_none_match: str | None = Header(None),
+) -> Response:
     """
     Get A/B test variant A explicitly.
     """
-    # Find organization
-    org = db.query(Organization).filter(
-        Organization.slug == org_slug,
-        Organization.active == True
-    ).first()
-    
-    if not org:
-        raise HTTPException(status_code=404, detail="Organization not found")
-    
-    survey = db.query(Survey).filter(
-        Survey.slug == survey_slug,
-        Survey.organization_id == org.id,
-        Survey.status == "live",
-        Survey.survey_type == "ab_test"
-    ).first()
-    
-    if not survey:
-        raise HTTPException(status_code=404, detail="A/B test survey not found or not active")
-    
-    if not survey.variant_a_flow:
-        raise HTTPException(status_code=500, detail="Variant A not configured")
-    
-    return {
-        "survey_id": survey.id,
-        "name": survey.name,
-        "slug": survey.slug,
-        "org_slug": org.slug,
-        "survey_type": survey.survey_type,
-        "variant": "a",
-        "flow": survey.variant_a_flow
-    }
+    return _variant_page("a", org_slug, survey_slug, db, if_none_match)
 
 
 @router.get("/{org_slug}/{survey_slug}/b")
 def get_survey_variant_b(
     org_slug: str,
     survey_slug: str,
-    db: Session = Depends(get_db)
-) -> Dict[str, Any]:
+    db: Session = Depends(get_db),
+    if_none_match: str | None = Header(None),
+) -> Response:
     """
     Get A/B test variant B explicitly.
     """
-    # Find organization
-    org = db.query(Organization).filter(
-        Organization.slug == org_slug,
-        Organization.active == True
-    ).first()
-    
-    if not org:
-        raise HTTPException(status_code=404, detail="Organization not found")
-    
-    survey = db.query(Survey).filter(
-        Survey.slug == survey_slug,
-        Survey.organization_id == org.id,
-        Survey.status == "live",
-        Survey.survey_type == "ab_test"
-    ).first()
-    
-    if not survey:
-        raise HTTPException(status_code=404, detail="A/B test survey not found or not active")
-    
-    if not survey.variant_b_flow:
-        raise HTTPException(status_code=500, detail="Variant B not configured")
-    
-    return {
-        "survey_id": survey.id,
-        "name": survey.name,
-        "slug": survey.slug,
-        "org_slug": org.slug,
-        "survey_type": survey.survey_type,
-        "variant": "b",
-        "flow": survey.variant_b_flow
-    }
+    return _variant_page("b", org_slug, survey_slug, db, if_none_match)
 
 
 @router.post("/{org_slug}/{survey_slug}/submit", response_model=SurveyResponseDetail, status_code=201)
@@ -196,93 +139,100 @@ def submit_survey_response(
     """
     Submit a survey response.
     Creates a new response or updates existing one based on SID.
+    One statement: a CTE reads (and on Postgres locks) the visitor's previous
+    row, feeds the INSERT .. ON CONFLICT (survey_id, sid) DO UPDATE, and
+    RETURNING hands back the written row with the previous score for the
+    stats rollup. The survey itself comes from survey_cache.
     """
-    # Find organization
-    org = db.query(Organization).filter(
-        Organization.slug == org_slug,
-        Organization.active == True
-    ).first()
-    
-    if not org:
+    survey = survey_cache.public_page(db, org_slug, survey_slug)
+    if survey.missing == "org":
         raise HTTPException(status_code=404, detail="Organization not found")
-    
-    # Find survey by slug
-    survey = db.query(Survey).filter(
-        Survey.slug == survey_slug,
-        Survey.organization_id == org.id,
-        Survey.status == "live"
-    ).first()
-    
-    if not survey:
+    if survey.missing:
         raise HTTPException(status_code=404, detail="Survey not found or not active")
     
     # Verify survey_id matches
-    if payload.survey_id != survey.id:
+    if payload.survey_id != survey.survey_id:
         raise HTTPException(
             status_code=400,
             detail="Survey ID mismatch"
         )
     
-    # Check if response already exists for this SID
-    existing_response = db.query(SurveyResponseModel).filter(
-        SurveyResponseModel.survey_id == survey.id,
-        SurveyResponseModel.sid == payload.sid
-    ).first()
-    
-    if existing_response:
-        # Update existing response
-        if payload.survey_answers:
-            existing_response.survey_answers = payload.survey_answers
-        if payload.name:
-            existing_response.name = payload.name
-        if payload.email:
-            existing_response.email = payload.email
-        if payload.phone:
-            existing_response.phone = payload.phone
-        
-        # Calculate score based on answers
-        score = calculate_survey_score(payload.survey_answers)
-        existing_response.score = score
-        existing_response.interest = calculate_interest_level(score)
-        
-        # Update progress
-        total_questions = count_survey_questions(survey)
-        answered_questions = len(payload.survey_answers)
-        existing_response.survey_progress = int((answered_questions / total_questions) * 100) if total_questions > 0 else 0
-        
-        db.commit()
-        db.refresh(existing_response)
-        
-        return existing_response
-    
-    # Create new response
+    # Calculate score and progress based on answers
     score = calculate_survey_score(payload.survey_answers)
-    interest = calculate_interest_level(score)
-    
-    total_questions = count_survey_questions(survey)
     answered_questions = len(payload.survey_answers)
-    progress = int((answered_questions / total_questions) * 100) if total_questions > 0 else 0
-    
-    response = SurveyResponseModel(
-        survey_id=survey.id,
-        organization_id=survey.organization_id,
-        sid=payload.sid,
-        variant=payload.variant,
-        survey_answers=payload.survey_answers,
-        name=payload.name,
-        email=payload.email,
-        phone=payload.phone,
-        score=score,
-        interest=interest,
-        survey_started_at=datetime.utcnow(),
-        survey_progress=progress
+    progress = int((answered_questions / survey.questions) * 100) if survey.questions > 0 else 0
+    now = datetime.utcnow()
+    
+    table = SurveyResponseModel.__table__
+    postgres = db.get_bind().dialect.name == "postgresql"
+    values = {
+        "survey_id": survey.survey_id,
+        "organization_id": survey.org_id,
+        "sid": payload.sid,
+        "variant": payload.variant,
+        "survey_answers": payload.survey_answers,
+        "name": payload.name,
+        "email": payload.email,
+        "phone": payload.phone,
+        "score": score,
+        "interest": calculate_interest_level(score),
+        "survey_started_at": now,
+        "survey_progress": progress,
+        "notes": "",
+        "created_at": now,
+        "updated_at": now,
+    }
+    # MATERIALIZED + joined into the INSERT's source: read once, before the
+    # write (FOR UPDATE waits for a concurrent resubmit and sees its score)
+    prev = (
+        select(table.c.score)
+        .where(table.c.survey_id == survey.survey_id, table.c.sid == payload.sid)
+        .with_for_update()
+        .cte("prev")
+        .prefix_with("MATERIALIZED")
     )
-    
-    db.add(response)
+    one = select(literal(1).label("one")).subquery("one")
+    source = (
+        select(*(literal(v, table.c[k].type).label(k) for k, v in values.items()))
+        .select_from(one.outerjoin(prev, true()))
+        .where(true())  # SQLite: keeps ON CONFLICT from parsing as a join constraint
+    )
+    stmt = dialect_insert(table, db.get_bind()).from_select(list(values), source)
+    # Existing response: answers/contact only overwrite when provided
+    update = {
+        "score": stmt.excluded.score,
+        "interest": stmt.excluded.interest,
+        "survey_progress": stmt.excluded.survey_progress,
+        "updated_at": stmt.excluded.updated_at,
+    }
+    if payload.survey_answers:
+        update["survey_answers"] = stmt.excluded.survey_answers
+    for field in ("name", "email", "phone"):
+        if getattr(payload, field):
+            update[field] = stmt.excluded[field]
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.survey_id, table.c.sid],
+        set_=update,
+    )
+    returning = [*table.c, select(prev.c.score).scalar_subquery().label("old_score")]
+    if postgres:
+        # xmax is 0 only on a freshly inserted row version
+        returning.append(literal_column("(xmax = 0)").label("inserted"))
+    stmt = stmt.returning(*returning).add_cte(prev)
+    
+    row = dict(db.execute(stmt).mappings().one())
+    old_score = row.pop("old_score")
+    created = row.pop("inserted") if postgres else old_score is None
+    if created or old_score is not None:
+        survey_stats.record_submit(db, row, created=created, old_score=old_score or 0)
+    elif row["survey_completed_at"] is not None:
+        # Postgres: a concurrent first submit inserted the row after this
+        # statement's snapshot and it was completed before we got the row;
+        # the score we replaced is unknown, so recount this survey's rollup
+        survey_stats.rebuild(db, survey.survey_id)
     db.commit()
-    db.refresh(response)
     
-    return response
+    return row
 
 
 @router.post("/{survey_slug}/complete", response_model=SurveyResponseDetail)
@@ -313,9 +263,11 @@ def complete_survey(
         raise HTTPException(status_code=404, detail="Survey response not found")
     
     # Mark as completed
+    previous_completed_at = response.survey_completed_at
     response.survey_completed_at = datetime.utcnow()
     response.survey_progress = 100
     
+    survey_stats.record_completion(db, response, previous_completed_at=previous_completed_at)
     db.commit()
     db.refresh(response)
     
@@ -366,22 +318,4 @@ def calculate_interest_level(score: int) -> str:
 
 def count_survey_questions(survey: Survey) -> int:
     """Count number of questions in a survey flow"""
-    if survey.survey_type == "regular" and survey.flow_json:
-        flow = survey.flow_json
-    elif survey.survey_type == "ab_test":
-        # Use variant A for counting (both should have same number)
-        flow = survey.variant_a_flow
-    else:
-        return 0
-    
-    if not flow or not isinstance(flow, dict):
-        return 0
-    
-    # Count nodes (questions)
-    nodes = flow.get("nodes", [])
-    if isinstance(nodes, list):
-        return len(nodes)
-    elif isinstance(nodes, dict):
-        return len(nodes)
-    
-    return 0
+    return survey_cache.count_questions(survey)
@@ -4,11 +4,13 @@ Survey management API endpoints.
 Supports regular surveys and A/B testing.
 """
 
+import base64
 from typing import List
 from datetime import datetime
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import tuple_
 from sqlalchemy.orm import Session
-from sqlalchemy import func, Float
 
 from app.core.db import get_db
 from app.models.orm import Survey, SurveyResponse
@@ -20,6 +22,7 @@ from app.models.schemas import (
     SurveyResponseDetail
 )
 from app.auth.permissions import AuthContext, require_org_admin, require_org_user
+from app.services import survey_cache, survey_export, survey_stats
 
 router = APIRouter(prefix="/api/organizations/{org_id}/surveys", tags=["surveys"])
 
@@ -119,6 +122,7 @@ def create_survey(
     db.add(survey)
     db.commit()
     db.refresh(survey)
+    survey_cache.invalidate(org_id=org_id, survey_id=survey.id)
     
     return survey
 
@@ -221,6 +225,7 @@ def update_survey(
     
     db.commit()
     db.refresh(survey)
+    survey_cache.invalidate(org_id=org_id, survey_id=survey_id)
     
     return survey
 
@@ -273,6 +278,7 @@ def publish_survey(
     
     db.commit()
     db.refresh(survey)
+    survey_cache.invalidate(org_id=org_id, survey_id=survey_id)
     
     return survey
 
@@ -307,6 +313,7 @@ def archive_survey(
     
     db.commit()
     db.refresh(survey)
+    survey_cache.invalidate(org_id=org_id, survey_id=survey_id)
     
     return survey
 
@@ -315,12 +322,14 @@ def archive_survey(
 def get_survey_stats(
     org_id: int,
     survey_id: int,
+    refresh: bool = False,
     auth: AuthContext = Depends(require_org_user),
     db: Session = Depends(get_db)
 ):
     """
     Get statistics for a survey.
     Includes A/B test comparison if applicable.
+    Served from the survey_stats rollup; `refresh=true` recomputes it from the responses.
     """
     # Verify user belongs to the organization
     if auth.organization_id != org_id:
@@ -337,94 +346,45 @@ def get_survey_stats(
     if not survey:
         raise HTTPException(status_code=404, detail="Survey not found")
     
-    # Get total responses
-    total_responses = db.query(func.count(SurveyResponse.id)).filter(
-        SurveyResponse.survey_id == survey_id
-    ).scalar() or 0
-    
-    # Get completed responses
-    completed_responses = db.query(func.count(SurveyResponse.id)).filter(
-        SurveyResponse.survey_id == survey_id,
-        SurveyResponse.survey_completed_at.isnot(None)
-    ).scalar() or 0
-    
-    # Get average score
-    avg_score = db.query(func.avg(SurveyResponse.score)).filter(
-        SurveyResponse.survey_id == survey_id,
-        SurveyResponse.survey_completed_at.isnot(None)
-    ).scalar() or 0.0
-    
-    # Get average completion time
-    avg_time_result = db.query(
-        func.avg(
-            func.cast(
-                func.julianday(SurveyResponse.survey_completed_at) -
-                func.julianday(SurveyResponse.survey_started_at),
-                Float
-            ) * 24 * 60
-        )
-    ).filter(
-        SurveyResponse.survey_id == survey_id,
-        SurveyResponse.survey_completed_at.isnot(None)
-    ).scalar()
-    
-    avg_completion_time = float(avg_time_result) if avg_time_result else None
+    # Rollup rows (built on first read with one grouped query)
+    summary = survey_stats.stats(db, survey_id, refresh=refresh)
     
     stats = SurveyStats(
         survey_id=survey_id,
-        total_responses=total_responses,
-        completed_responses=completed_responses,
-        avg_score=float(avg_score),
-        avg_completion_time_minutes=avg_completion_time
+        total_responses=summary["total_responses"],
+        completed_responses=summary["completed_responses"],
+        avg_score=summary["avg_score"],
+        avg_completion_time_minutes=summary["avg_completion_time_minutes"]
     )
     
     # A/B test specific stats
     if survey.survey_type == "ab_test":
-        # Variant A stats
-        variant_a_count = db.query(func.count(SurveyResponse.id)).filter(
-            SurveyResponse.survey_id == survey_id,
-            SurveyResponse.variant == "a"
-        ).scalar() or 0
-        
-        variant_a_avg = db.query(func.avg(SurveyResponse.score)).filter(
-            SurveyResponse.survey_id == survey_id,
-            SurveyResponse.variant == "a",
-            SurveyResponse.survey_completed_at.isnot(None)
-        ).scalar() or 0.0
-        
-        # Variant B stats
-        variant_b_count = db.query(func.count(SurveyResponse.id)).filter(
-            SurveyResponse.survey_id == survey_id,
-            SurveyResponse.variant == "b"
-        ).scalar() or 0
-        
-        variant_b_avg = db.query(func.avg(SurveyResponse.score)).filter(
-            SurveyResponse.survey_id == survey_id,
-            SurveyResponse.variant == "b",
-            SurveyResponse.survey_completed_at.isnot(None)
-        ).scalar() or 0.0
-        
-        stats.variant_a_responses = variant_a_count
-        stats.variant_b_responses = variant_b_count
-        stats.variant_a_avg_score = float(variant_a_avg)
-        stats.variant_b_avg_score = float(variant_b_avg)
+        empty = {"responses": 0, "avg_score": 0.0}
+        variant_a = summary["variants"].get("a", empty)
+        variant_b = summary["variants"].get("b", empty)
+        stats.variant_a_responses = variant_a["responses"]
+        stats.variant_b_responses = variant_b["responses"]
+        stats.variant_a_avg_score = variant_a["avg_score"]
+        stats.variant_b_avg_score = variant_b["avg_score"]
     
     return stats
 
 
-@router.get("/{survey_id}/responses", response_model=List[SurveyResponseDetail])
-def get_survey_responses(
-    org_id: int,
-    survey_id: int,
-    skip: int = 0,
-    limit: int = 100,
-    auth: AuthContext = Depends(require_org_user),
-    db: Session = Depends(get_db)
-):
-    """
-    Get all responses for a survey.
-    Accessible by any authenticated user in the organization.
-    """
+def _encode_cursor(created_at: datetime, response_id: int) -> str:
+    raw = f"{created_at.isoformat()}|{response_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        ts, _, rid = raw.partition("|")
+        return datetime.fromisoformat(ts), int(rid)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _org_survey(db: Session, auth: AuthContext, org_id: int, survey_id: int) -> Survey:
     # Verify user belongs to the organization
     if auth.organization_id != org_id:
         raise HTTPException(
@@ -440,14 +400,73 @@ def get_survey_responses(
     
     if not survey:
         raise HTTPException(status_code=404, detail="Survey not found")
+    return survey
+
+
+@router.get("/{survey_id}/responses", response_model=List[SurveyResponseDetail])
+def get_survey_responses(
+    org_id: int,
+    survey_id: int,
+    response: Response,
+    skip: int = 0,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: str | None = None,
+    auth: AuthContext = Depends(require_org_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Get all responses for a survey, newest first.
+    Accessible by any authenticated user in the organization.
+    Keyset-paginated on (created_at, id): pass the X-Next-Cursor header of a
+    page as `cursor` to get the next one (header absent on the last page).
+    `skip` (OFFSET) still works for old clients but gets slower on deep pages.
+    """
+    _org_survey(db, auth, org_id, survey_id)
     
-    responses = db.query(SurveyResponse).filter(
+    query = db.query(SurveyResponse).filter(
         SurveyResponse.survey_id == survey_id
-    ).order_by(SurveyResponse.created_at.desc()).offset(skip).limit(limit).all()
+    )
+    if cursor:
+        created_at, response_id = _decode_cursor(cursor)
+        query = query.filter(
+            tuple_(SurveyResponse.created_at, SurveyResponse.id) < tuple_(created_at, response_id)
+        )
+    elif skip:
+        query = query.offset(skip)
+    
+    responses = query.order_by(
+        SurveyResponse.created_at.desc(), SurveyResponse.id.desc()
+    ).limit(limit).all()
+    
+    if len(responses) == limit:
+        last = responses[-1]
+        response.headers["X-Next-Cursor"] = _encode_cursor(last.created_at, last.id)
     
     return responses
 
 
+@router.get("/{survey_id}/responses/export")
+def export_survey_responses(
+    org_id: int,
+    survey_id: int,
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    auth: AuthContext = Depends(require_org_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Stream every response of a survey as CSV or NDJSON (oldest first).
+    Constant memory: rows come from a server-side cursor and are written as they are read.
+    """
+    survey = _org_survey(db, auth, org_id, survey_id)
+    
+    filename = f"survey-{survey.slug}-responses.{format}"
+    return StreamingResponse(
+        survey_export.iter_export(survey_id, format),
+        media_type=survey_export.FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
 @router.delete("/{survey_id}", status_code=204)
 def delete_survey(
     org_id: int,
@@ -482,7 +501,9 @@ def delete_survey(
             detail="Cannot delete a live survey. Archive it first."
         )
     
+    survey_stats.forget(db, survey_id)
     db.delete(survey)
     db.commit()
+    survey_cache.invalidate(org_id=org_id, survey_id=survey_id)
     
     return None
@@ -11,8 +11,8 @@ from sqlalchemy.orm import Session
 from app.core.db import get_db
 from app.models.orm import User
 from app.models.schemas import UserCreate, UserUpdate, UserResponse
-from app.auth.permissions import AuthContext, require_org_admin
-from app.auth.security import hash_password
+from app.auth.permissions import AuthContext, invalidate_user, require_org_admin
+from app.auth.security import hash_password_pooled
 
 router = APIRouter(prefix="/api/organizations/{org_id}/users", tags=["users"])
 
@@ -88,8 +88,8 @@ def create_user(
             detail=f"Email '{payload.email}' already exists"
         )
     
-    # Hash password
-    hashed_pw = hash_password(payload.password)
+    # Hash password (on the password pool; this worker thread just waits)
+    hashed_pw = hash_password_pooled(payload.password)
     
     # Create user
     user = User(
@@ -202,7 +202,7 @@ def update_user(
         user.email = payload.email
     
     if payload.password is not None:
-        user.hashed_password = hash_password(payload.password)
+        user.hashed_password = hash_password_pooled(payload.password)
     
     if payload.role is not None:
         user.role = payload.role
@@ -217,6 +217,7 @@ def update_user(
         user.is_active = payload.is_active
     
     db.commit()
+    invalidate_user(user_id)
     db.refresh(user)
     
     return user
@@ -270,5 +271,6 @@ def delete_user(
     
     db.delete(user)
     db.commit()
+    invalidate_user(user_id)
     
     return None
@@ -1,16 +1,51 @@
 # app/auth/permissions.py
 """
 Authentication and authorization dependencies for protected routes.
+
+get_auth_context() needs no DB round-trip in the common case: token
+verification is cached in security.verify_token, and whether a user exists
+and is active is cached here for ACE_AUTH_USER_TTL seconds (default 30).
+Changes to a user must call invalidate_user() (invalidate_org() when a whole
+organization goes); other workers pick the change up within the TTL.
 """
 
-from typing import Optional, Literal
+import os
+from typing import Optional, Literal, Tuple
 from fastapi import Depends, HTTPException, Header
 from sqlalchemy.orm import Session
 
 from .security import verify_token
+from app.core.cache import TTLCache
 from app.core.db import get_db
 from app.models.orm import User, Organization
 
+USER_CACHE_TTL = float(os.getenv("ACE_AUTH_USER_TTL", "30"))
+
+# user_id -> (exists and is_active, organization_id)
+_user_state = TTLCache(maxsize=10000, ttl=USER_CACHE_TTL)
+
+
+def _user_active(db: Session, user_id: int) -> bool:
+    state: Optional[Tuple[bool, Optional[int]]] = _user_state.get(user_id)
+    if state is None:
+        row = db.query(User.is_active, User.organization_id).filter(User.id == user_id).first()
+        state = (bool(row and row.is_active), row.organization_id if row else None)
+        if USER_CACHE_TTL > 0:
+            _user_state.set(user_id, state)
+    return state[0]
+
+
+def invalidate_user(user_id: int) -> None:
+    """Forget the cached active state of a user (updated, deactivated, deleted)."""
+    _user_state.pop(user_id)
+
+
+def invalidate_org(organization_id: int) -> None:
+    """Forget the cached state of every user of an organization."""
+    for user_id, (_, org_id) in _user_state.items():
+        if org_id == organization_id:
+            _user_state.pop(user_id)
+
 
 class AuthContext:
     """User authentication context"""
@@ -94,9 +129,8 @@ def get_auth_context(
     if not all([user_id, username, organization_id, role]):
         raise HTTPException(status_code=401, detail="Invalid token payload")
     
-    # Verify user exists and is active
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user or not user.is_active:
+    # Verify user exists and is active (cached, see invalidate_user)
+    if not _user_active(db, user_id):
         raise HTTPException(status_code=401, detail="User not found or inactive")
     
     return AuthContext(
@@ -1,11 +1,14 @@
 import logging
 from datetime import datetime
+from typing import Optional, Tuple
+
 from fastapi import APIRouter, HTTPException, Header, Depends
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
 
-from .security import create_token, verify_token, verify_password
-from app.core.db import get_db
+from .security import create_token, verify_token, verify_password_async
+from app.core.db import SessionLocal, get_db
 from app.models.orm import User
 
 router = APIRouter(prefix="/api/auth", tags=["auth"])
@@ -17,58 +20,72 @@ class LoginIn(BaseModel):
     password: str
 
 
+def _find_login_user(username: str) -> Optional[Tuple[int, str]]:
+    with SessionLocal() as db:
+        user = db.query(User).filter(User.username == username).first()
+        if not user or not user.is_active:
+            return None
+        return user.id, user.hashed_password
+
+
+def _complete_login(user_id: int) -> dict:
+    with SessionLocal() as db:
+        user = db.get(User, user_id)
+        # Update last login
+        user.last_login = datetime.utcnow()
+        db.commit()
+
+        # Get organization info
+        org_slug = user.organization.slug if user.organization else None
+
+        # Create JWT token
+        token = create_token(
+            {
+                "sub": user.username,
+                "user_id": user.id,
+                "role": user.role,
+                "organization_id": user.organization_id,
+                "organization_slug": org_slug,
+                # Backward compatibility
+                "tenant_id": user.organization_id,
+                "tenant_slug": org_slug
+            }
+        )
+
+        logger.info("Login success for user '%s' (role=%s)", user.username, user.role)
+
+        return {
+            "token": token,
+            "user": {
+                "id": user.id,
+                "username": user.username,
+                "email": user.email,
+                "role": user.role,
+                "organization_id": user.organization_id,
+                "organization_slug": org_slug,
+                "avatar_url": user.avatar_url,
+                # Backward compatibility
+                "tenant_id": user.organization_id,
+                "tenant_slug": org_slug,
+            },
+        }
+
+
 @router.post("/login")
-def login(payload: LoginIn, db: Session = Depends(get_db)):
-    # Find user by username
-    user = db.query(User).filter(User.username == payload.username).first()
-    
-    if not user or not user.is_active:
+async def login(payload: LoginIn):
+    # db work runs in the threadpool with its own short sessions, bcrypt on
+    # the password pool: no connection is held while the password is checked
+    found = await run_in_threadpool(_find_login_user, payload.username)
+    if found is None:
         logger.info("Login failed for user '%s' (not found or inactive)", payload.username)
         raise HTTPException(status_code=401, detail="Invalid credentials")
-    
-    # Verify password
-    if not verify_password(payload.password, user.hashed_password):
+    user_id, hashed_password = found
+
+    if not await verify_password_async(payload.password, hashed_password):
         logger.info("Login failed for user '%s' (invalid password)", payload.username)
         raise HTTPException(status_code=401, detail="Invalid credentials")
-    
-    # Update last login
-    user.last_login = datetime.utcnow()
-    db.commit()
-    
-    # Get organization info
-    org_slug = user.organization.slug if user.organization else None
-    
-    # Create JWT token
-    token = create_token(
-        {
-            "sub": user.username,
-            "user_id": user.id,
-            "role": user.role,
-            "organization_id": user.organization_id,
-            "organization_slug": org_slug,
-            # Backward compatibility
-            "tenant_id": user.organization_id,
-            "tenant_slug": org_slug
-        }
-    )
-    
-    logger.info("Login success for user '%s' (role=%s)", user.username, user.role)
-    
-    return {
-        "token": token,
-        "user": {
-            "id": user.id,
-            "username": user.username,
-            "email": user.email,
-            "role": user.role,
-            "organization_id": user.organization_id,
-            "organization_slug": org_slug,
-            "avatar_url": user.avatar_url,
-            # Backward compatibility
-            "tenant_id": user.organization_id,
-            "tenant_slug": org_slug,
-        },
-    }
+
+    return await run_in_threadpool(_complete_login, user_id)
 
 
 @router.get("/me")
@@ -1,14 +1,21 @@
 import os
 import time
+import hashlib
 import jwt
 import logging
 from typing import Optional
 import bcrypt
 
+from app.core.cache import TTLCache
+from app.core.password_pool import pool as _password_pool
+
 # Do NOT import/modify your config.py for secrets; keep it self-contained
 SECRET_KEY = os.getenv("ACE_SECRET", "dev-secret-change-me")  # override in prod
 JWT_EXPIRE_MIN = int(os.getenv("ACE_JWT_EXPIRE_MIN", "1440"))  # 1 day
 ALGO = "HS256"
+BCRYPT_ROUNDS = int(os.getenv("ACE_BCRYPT_ROUNDS", "12"))  # bcrypt cost factor
+# Verified tokens (sha256 of the token -> claims), each kept until its own exp
+TOKEN_CACHE_SIZE = int(os.getenv("ACE_JWT_CACHE_SIZE", "10000"))
 
 logger = logging.getLogger("ace.auth")
 
@@ -17,7 +24,7 @@ def hash_password(password: str) -> str:
     """
     Hash a password using bcrypt.
     """
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(rounds=BCRYPT_ROUNDS)
     hashed = bcrypt.hashpw(password.encode('utf-8'), salt)
     return hashed.decode('utf-8')
 
@@ -33,6 +40,21 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
         return False
 
 
+def hash_password_pooled(password: str) -> str:
+    """hash_password on the password pool, blocking (sync endpoints: bcrypt CPU stays bounded)."""
+    return _password_pool.call(hash_password, password)
+
+
+async def hash_password_async(password: str) -> str:
+    """hash_password on the password pool (keeps bcrypt off the event loop)."""
+    return await _password_pool.run(hash_password, password)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """verify_password on the password pool (keeps bcrypt off the event loop)."""
+    return await _password_pool.run(verify_password, plain_password, hashed_password)
+
+
 def create_token(payload: dict) -> str:
     now = int(time.time())
     exp = now + JWT_EXPIRE_MIN * 60
@@ -41,10 +63,30 @@ def create_token(payload: dict) -> str:
     return token
 
 
+_verified = TTLCache(maxsize=TOKEN_CACHE_SIZE)
+
+
+def _token_key(token: str) -> bytes:
+    return hashlib.sha256(token.encode("utf-8")).digest()
+
+
 def verify_token(token: str) -> Optional[dict]:
+    """
+    Decode and verify a JWT. Valid tokens are cached by hash until they
+    expire, so repeated requests with the same token skip the signature check.
+    """
+    key = _token_key(token)
+    data = _verified.get(key)
+    if data is not None:
+        return dict(data)
     try:
         data = jwt.decode(token, SECRET_KEY, algorithms=[ALGO])
-        return data
     except Exception as e:
         logger.warning("Token verification failed: %s", e)
         return None
+    exp = data.get("exp")
+    if isinstance(exp, (int, float)):
+        remaining = exp - time.time()
+        if remaining > 0:
+            _verified.set(key, dict(data), ttl=remaining)
+    return data
@@ -47,3 +47,18 @@ def session_scope() -> Generator[Session, None, None]:
         raise
     finally:
         db.close()
+
+
+def dialect_insert(table, bind=None):
+    """
+    Dialect-specific INSERT construct (supports .on_conflict_do_update()).
+    Works for SQLite (dev) and PostgreSQL (prod).
+    """
+    name = (bind or engine).dialect.name
+    if name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise NotImplementedError(f"upsert not supported for dialect '{name}'")
+    return insert(table)
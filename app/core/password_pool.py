@@ -0,0 +1,145 @@
+# app/core/password_pool.py
+"""
+Dedicated, bounded worker pool for password hashing (bcrypt).
+
+bcrypt costs ~250ms of CPU per call at the default cost. Run inline, a login
+burst holds the event loop or the shared threadpool that every sync endpoint
+uses. Here it runs on its own few workers instead; async callers await the
+result (security.*_async), and at most QUEUE_MAX calls may wait, beyond that
+PasswordPoolBusy is raised (the API answers 503) instead of queueing without
+bound.
+
+Threads are the default: bcrypt releases the GIL while hashing. "process"
+moves the work to worker processes (the callables must be picklable, i.e.
+module-level functions).
+
+Env:
+  ACE_PASSWORD_POOL         "thread" (default) | "process"
+  ACE_PASSWORD_WORKERS      workers (default: CPU count, at most 4)
+  ACE_PASSWORD_QUEUE_MAX    calls allowed to wait for a worker (default 64)
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger("ace.password_pool")
+
+KIND = os.getenv("ACE_PASSWORD_POOL", "thread").strip().lower()
+WORKERS = int(os.getenv("ACE_PASSWORD_WORKERS", str(min(4, os.cpu_count() or 1))))
+QUEUE_MAX = int(os.getenv("ACE_PASSWORD_QUEUE_MAX", "64"))
+
+
+class PasswordPoolBusy(RuntimeError):
+    """Too many password hashing calls are already waiting."""
+
+
+def _timed(fn: Callable[..., Any], args: tuple, submitted: float) -> tuple:
+    # monotonic: comparable with the submitting process's clock (process pool)
+    started = time.monotonic()
+    result = fn(*args)
+    return result, started - submitted, time.monotonic() - started
+
+
+class PasswordPool:
+    def __init__(self, workers: int = WORKERS, queue_max: int = QUEUE_MAX, kind: str = KIND):
+        self.workers = max(1, workers)
+        self.queue_max = max(0, queue_max)
+        self.kind = "process" if kind == "process" else "thread"
+        self._executor: Optional[Executor] = None
+        self._lock = threading.Lock()
+        self.in_flight = 0  # submitted and not finished (running + waiting)
+        self.completed = 0
+        self.rejected = 0
+        self.failed = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.run_total = 0.0
+
+    def _ensure_executor(self) -> Executor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    if self.kind == "process":
+                        self._executor = ProcessPoolExecutor(max_workers=self.workers)
+                    else:
+                        self._executor = ThreadPoolExecutor(
+                            max_workers=self.workers, thread_name_prefix="password"
+                        )
+        return self._executor
+
+    @property
+    def queued(self) -> int:
+        """Calls waiting for a worker."""
+        return max(0, self.in_flight - self.workers)
+
+    def submit(self, fn: Callable[..., Any], *args: Any) -> "Future[Any]":
+        executor = self._ensure_executor()
+        with self._lock:
+            if self.in_flight - self.workers >= self.queue_max:
+                self.rejected += 1
+                raise PasswordPoolBusy(f"{self.queued} password operations waiting")
+            self.in_flight += 1
+        try:
+            inner = executor.submit(_timed, fn, args, time.monotonic())
+        except Exception:
+            with self._lock:
+                self.in_flight -= 1
+            raise
+        outer: "Future[Any]" = Future()
+        inner.add_done_callback(lambda f: self._done(f, outer))
+        return outer
+
+    def _done(self, inner: "Future[tuple]", outer: "Future[Any]") -> None:
+        with self._lock:
+            self.in_flight -= 1
+            exc = inner.exception()
+            if exc is None:
+                result, waited, ran = inner.result()
+                self.completed += 1
+                self.wait_total += waited
+                self.wait_max = max(self.wait_max, waited)
+                self.run_total += ran
+            else:
+                self.failed += 1
+        if exc is None:
+            outer.set_result(result)
+        else:
+            outer.set_exception(exc)
+
+    def call(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """Blocking call (scripts, sync code paths)."""
+        return self.submit(fn, *args).result()
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        return await asyncio.wrap_future(self.submit(fn, *args))
+
+    def stats(self) -> Dict[str, Any]:
+        done = self.completed or 1
+        return {
+            "kind": self.kind,
+            "workers": self.workers,
+            "queue_max": self.queue_max,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "avg_wait_ms": round(self.wait_total / done * 1000, 2),
+            "max_wait_ms": round(self.wait_max * 1000, 2),
+            "avg_run_ms": round(self.run_total / done * 1000, 2),
+        }
+
+    def shutdown(self, wait: bool = True) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+
+pool = PasswordPool()
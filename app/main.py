@@ -1,5 +1,6 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from fastapi.staticfiles import StaticFiles
 import logging
 import os
@@ -9,7 +10,9 @@ from app.middleware.request_logger import RequestLoggerMiddleware
 from app.api import agent, chat_events
 from app.api import health
 from app.api import survey_flow
+from app.core.password_pool import PasswordPoolBusy, pool as password_pool
 from app.services.bootstrap_db import create_all
+from app.services import avatar_images, chat_store, event_bus, lead_notes, lead_service
 
 # New multi-tenant API endpoints
 from app.api import organizations, users, surveys, public_survey, avatar, org_avatar
@@ -37,6 +40,14 @@ logger.info("Starting Omsoft ACE Backend with LOG_LEVEL=%s", LOG_LEVEL)
 app = FastAPI(title="Omsoft ACE Backend")
 app.add_middleware(RequestLoggerMiddleware)
 
+
+@app.exception_handler(PasswordPoolBusy)
+async def _password_pool_busy(request: Request, exc: PasswordPoolBusy) -> JSONResponse:
+    # login / user-create burst beyond ACE_PASSWORD_QUEUE_MAX: shed load, client retries
+    logger.warning("password pool busy: %s %s (%s)", request.method, request.url.path, exc)
+    return JSONResponse({"detail": "Too many concurrent logins, retry shortly"}, status_code=503,
+                        headers={"Retry-After": "1"})
+
 # ---- CORS -------------------------------------------------------------------
 app.add_middleware(
     CORSMiddleware,
@@ -57,6 +68,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # pagination cursors and ETags are read by the portal / survey client
+    expose_headers=["X-Next-Cursor", "X-Before-Cursor", "X-After-Cursor", "ETag"],
 )
 
 # ---- Routers (EXISTING – unchanged) ----------------------------------------
@@ -98,6 +111,8 @@ logger.info("Routers registered.")
 
 # ---- Static Files -----------------------------------------------------------
 # Mount static directory for avatars and other files
+# Avatars are content-addressed (avatar_images): served with immutable caching
+app.mount("/static/avatars", avatar_images.ImmutableStaticFiles(directory=avatar_images.AVATAR_DIR), name="avatars")
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
 # ---- Startup ----------------------------------------------------------------
@@ -108,3 +123,29 @@ def _startup() -> None:
     # Mount static per-instance chat UIs at /instances/<slug>/chatbot – NEW
     mount_instance_chatbots(app)
     logger.info("Startup completed.")
+
+
+@app.on_event("startup")
+async def _startup_event_bus() -> None:
+    # Follow other workers' events from the start (cross-process transport)
+    await event_bus.start()
+
+
+@app.on_event("startup")
+async def _startup_lead_store() -> None:
+    # Warm leads from the db tier and start the write-behind flusher
+    await lead_service.start_store()
+    # Background writer for note history spilled to the lead_notes table
+    await lead_notes.notes.start()
+
+
+@app.on_event("shutdown")
+async def _shutdown() -> None:
+    await event_bus.close()
+    # Drain buffered chat_store writes before the worker exits
+    chat_store.close()
+    await lead_service.close_store()
+    await lead_notes.notes.close()
+    password_pool.shutdown(wait=False)
+    avatar_images.shutdown()
+    logger.info("Shutdown completed.")
@@ -1,49 +1,216 @@
 # app/middleware/request_logger.py
+"""
+Pure ASGI request logging.
+
+Requests and responses stream through untouched: the middleware only
+observes the ASGI messages as they pass, so uploads and SSE streams are never
+buffered. Per request it logs one line when the response is finished:
+  method, path, status, duration, bytes in/out, X-Req-Id, X-Sid
+and, when enabled, the first BODY_BYTES of textual request bodies (JSON,
+form, text; never multipart uploads). Body capture is off by default and
+never applies to BODY_SKIP paths (logins, user admin); values of
+password / token / secret fields are masked in what is captured.
+
+Records go to the "ace.http" logger through a QueueHandler that enqueues
+them unformatted (the stock prepare() would format on the event loop), so
+formatting and I/O of the log line happen on a listener thread.
+The queue is bounded; when it is full, lines are dropped (and counted)
+rather than blocking requests.
+
+Sampling: a SAMPLE fraction of requests is logged; errors (status >= 400)
+and requests slower than SLOW_MS are always logged.
+
+Env:
+  ACE_REQUEST_LOG_BODY_BYTES   request body prefix to capture (default 0 = off)
+  ACE_REQUEST_LOG_BODY_SKIP    comma-separated path prefixes whose bodies are
+                               never captured (default: auth and user admin)
+  ACE_REQUEST_LOG_SAMPLE       fraction of ordinary requests logged (default 1.0)
+  ACE_REQUEST_LOG_SLOW_MS      always log requests slower than this (default 1000)
+  ACE_REQUEST_LOG_QUEUE        max queued log records (default 10000)
+"""
+from __future__ import annotations
+
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import threading
 import time
-from starlette.requests import Request
-from starlette.types import ASGIApp, Receive, Scope, Send
+from typing import Optional
 
-class RequestLoggerMiddleware:
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+BODY_BYTES = int(os.getenv("ACE_REQUEST_LOG_BODY_BYTES", "0"))
+BODY_SKIP = tuple(
+    p.strip() for p in os.getenv(
+        "ACE_REQUEST_LOG_BODY_SKIP", "/api/auth/,/api/admin/users,/api/organizations/"
+    ).split(",") if p.strip()
+)
+SAMPLE = float(os.getenv("ACE_REQUEST_LOG_SAMPLE", "1.0"))
+SLOW_MS = float(os.getenv("ACE_REQUEST_LOG_SLOW_MS", "1000"))
+QUEUE_MAX = int(os.getenv("ACE_REQUEST_LOG_QUEUE", "10000"))
+
+TEXTUAL_TYPES = ("application/json", "application/x-www-form-urlencoded", "text/")
+# "password": "...", password=... (JSON or form; the value may be cut off by the prefix)
+_SECRET_FIELD = re.compile(
+    r'("[^"]*(?:password|passwd|secret|token)[^"]*"\s*:\s*)"(?:[^"\\]|\\.)*"?'
+    r'|(\b[\w.-]*(?:password|passwd|secret|token)[\w.-]*=)[^&]*',
+    re.IGNORECASE,
+)
+
+
+def redact(body: str) -> str:
+    """Mask the values of password / token / secret fields."""
+    return _SECRET_FIELD.sub(lambda m: f'{m.group(1)}"***"' if m.group(1) else f"{m.group(2)}***", body)
+
+logger = logging.getLogger("ace.http")
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that drops records instead of blocking when the queue is
+    full, and leaves formatting to the listener's handlers.
     """
-    Logs every HTTP request with:
-      - method, path, status, duration
-      - X-Req-Id (from client) and X-Sid (session id)
-      - request body (safe for small JSON posts)
 
-    Safe body-read: resets request receive buffer after reading.
+    dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # in-process queue: no pickling, and the record's args are plain values
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_handler: Optional[_DroppingQueueHandler] = None
+_setup_lock = threading.Lock()
+
+
+def _ensure_queue_logging() -> None:
+    """
+    Route "ace.http" through a queue to the root logger's handlers (as set
+    up by logging.basicConfig in app.main). Done on first use, so the root
+    handlers exist by then.
     """
-    def __init__(self, app: ASGIApp):
+    global _listener, _handler
+    if _listener is not None:
+        return
+    with _setup_lock:
+        if _listener is not None:
+            return
+        targets = list(logging.getLogger().handlers) or [logging.StreamHandler()]
+        q: "queue.Queue[logging.LogRecord]" = queue.Queue(maxsize=max(1, QUEUE_MAX))
+        _handler = _DroppingQueueHandler(q)
+        logger.addHandler(_handler)
+        logger.propagate = False
+        _listener = logging.handlers.QueueListener(q, *targets, respect_handler_level=True)
+        _listener.start()
+        atexit.register(close)
+
+
+def close() -> None:
+    """Flush queued log lines and stop the listener thread."""
+    global _listener, _handler
+    with _setup_lock:
+        listener, _listener = _listener, None
+        if listener is not None:
+            listener.stop()
+        if _handler is not None:
+            logger.removeHandler(_handler)
+            logger.propagate = True
+            _handler = None
+
+
+def dropped() -> int:
+    return _handler.dropped if _handler is not None else 0
+
+
+def _header(scope: Scope, name: bytes) -> str:
+    for k, v in scope.get("headers") or ():
+        if k == name:
+            return v.decode("latin-1")
+    return ""
+
+
+class RequestLoggerMiddleware:
+    def __init__(
+        self,
+        app: ASGIApp,
+        *,
+        body_bytes: int = BODY_BYTES,
+        body_skip: tuple = BODY_SKIP,
+        sample: float = SAMPLE,
+        slow_ms: float = SLOW_MS,
+    ):
         self.app = app
+        self.body_bytes = max(0, body_bytes)
+        self.body_skip = tuple(body_skip)
+        self.sample = sample
+        self.slow_ms = slow_ms
 
-    async def __call__(self, scope: Scope, receive: Receive, send: Send):
-        if scope["type"] != "http":
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not logger.isEnabledFor(logging.INFO):
             await self.app(scope, receive, send)
             return
+        _ensure_queue_logging()
 
-        request = Request(scope, receive=receive)
-        start = time.time()
-
-        # Read body safely
-        body_bytes = await request.body()
-        # Restore body so downstream handlers can read it
-        async def _receive():
-            return {"type": "http.request", "body": body_bytes, "more_body": False}
-        scope["_body"] = body_bytes  # optional debug
-        # Call downstream app with restored body
-        async def send_wrapper(message):
-            await send(message)
-
-        rid = request.headers.get("x-req-id", "-")
-        sid = request.headers.get("x-sid", "-")
-        path = request.url.path
+        start = time.perf_counter()
+        content_type = _header(scope, b"content-type").lower()
+        capture = self.body_bytes if content_type.startswith(TEXTUAL_TYPES) else 0
+        if capture and scope.get("path", "").startswith(self.body_skip):
+            capture = 0
+        prefix = bytearray()
+        state = {"in": 0, "out": 0, "status": 0}
 
-        print(f"[HTTP ►] rid={rid} sid={sid} {request.method} {path} body={body_bytes.decode('utf-8', 'ignore')}")
+        async def receive_wrapper() -> Message:
+            message = await receive()
+            if message["type"] == "http.request":
+                chunk = message.get("body", b"")
+                state["in"] += len(chunk)
+                if len(prefix) < capture:
+                    prefix.extend(chunk[: capture - len(prefix)])
+            return message
 
-        async def receive_wrapper():
-            return await _receive()
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                state["status"] = message["status"]
+            elif message["type"] == "http.response.body":
+                state["out"] += len(message.get("body", b""))
+            await send(message)
 
-        await self.app(scope, receive_wrapper, send_wrapper)
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        except Exception:
+            if not state["status"]:
+                state["status"] = 500
+            raise
+        finally:
+            self._log(scope, state, prefix, (time.perf_counter() - start) * 1000)
 
-        dur_ms = (time.time() - start) * 1000
-        # We can't directly read status here; rely on access logs or add a Response wrapper if needed
-        print(f"[HTTP ◄] rid={rid} sid={sid} {path} done in {dur_ms:.1f}ms")
+    def _log(self, scope: Scope, state: dict, prefix: bytearray, dur_ms: float) -> None:
+        status = state["status"]
+        if status < 400 and dur_ms < self.slow_ms and random.random() >= self.sample:
+            return
+        body = redact(prefix.decode("utf-8", "replace"))
+        if state["in"] > len(prefix) and body:
+            body += "…"
+        logger.log(
+            logging.WARNING if status >= 500 else logging.INFO,
+            "rid=%s sid=%s %s %s -> %s %.1fms in=%dB out=%dB%s",
+            _header(scope, b"x-req-id") or "-",
+            _header(scope, b"x-sid") or "-",
+            scope.get("method", "-"),
+            scope.get("path", "-"),
+            status or "-",
+            dur_ms,
+            state["in"],
+            state["out"],
+            f" body={body!r}" if body else "",
+        )
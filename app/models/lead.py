@@ -1,6 +1,6 @@
 from __future__ import annotations
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import List, Optional
 
 
 class Lead(BaseModel):
@@ -23,7 +23,11 @@ class Lead(BaseModel):
 
     lastMessage: str = ""
     lastSeenSec: int = 0
-    notes: str = ""
+    notes: str = ""  # summary of the newest notes; full history: GET /leads/{id}/notes
+    notesCount: int = 0
+    # sticky flags over the full note history (lead_service); stored, not served
+    notesClosing: bool = Field(False, exclude=True)
+    notesObjections: List[str] = Field(default_factory=list, exclude=True)
 
     # Survey tracking
     survey_started_at: Optional[str] = None  # ISO datetime string
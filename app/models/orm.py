@@ -5,10 +5,12 @@ from datetime import datetime
 from typing import Optional
 
 from sqlalchemy import (
+    BigInteger,
     Boolean,
     CheckConstraint,
     Column,
     DateTime,
+    Float,
     ForeignKey,
     Integer,
     String,
@@ -193,6 +195,9 @@ class SurveyResponse(Base):
         CheckConstraint("variant IS NULL OR variant IN ('a', 'b')", name="chk_responses_variant"),
         CheckConstraint("interest IN ('Low', 'Medium', 'High')", name="chk_responses_interest"),
         Index("ix_responses_survey_completed", "survey_id", "survey_completed_at"),
+        Index("ix_responses_survey_created_id", "survey_id", "created_at", "id"),
+        # one response per visitor and survey (submit upserts on it)
+        Index("uq_responses_survey_sid", "survey_id", "sid", unique=True),
         Index("ix_responses_org_score", "organization_id", "score"),
     )
 
@@ -243,10 +248,12 @@ class Message(Base):
     __table_args__ = (
         CheckConstraint("role in ('user','assistant','staff')", name="chk_messages_role"),
         Index("ix_messages_conv_ts", "conversation_id", "ts_epoch"),
+        # GET /chats/all: newest messages across conversations, keyset on (ts_epoch, id)
+        Index("ix_messages_ts_id", "ts_epoch", "id"),
     )
 
 
-# ---------- Leads (DEPRECATED - keeping for backward compatibility) ----------
+# ---------- Leads (durable tier of lead_service, see services/lead_store_db) ----------
 class Lead(Base):
     __tablename__ = "leads"
 
@@ -271,9 +278,14 @@ class Lead(Base):
     phone: Mapped[bool] = mapped_column(Boolean, default=False)
     email: Mapped[bool] = mapped_column(Boolean, default=False)
     adsExp: Mapped[bool] = mapped_column(Boolean, default=False)
+    phoneText: Mapped[str] = mapped_column(String(64), default="")
+    emailText: Mapped[str] = mapped_column(String(255), default="")
     lastMessage: Mapped[str] = mapped_column(Text, default="")
     lastSeenSec: Mapped[int] = mapped_column(Integer, default=0)
-    notes: Mapped[str] = mapped_column(Text, default="")
+    notes: Mapped[str] = mapped_column(Text, default="")  # summary; history in lead_notes
+    notesCount: Mapped[int] = mapped_column(Integer, default=0)
+    notesClosing: Mapped[bool] = mapped_column(Boolean, default=False)
+    notesObjections: Mapped[str] = mapped_column(Text, default="")  # objection labels, one per line
     # Survey tracking
     survey_started_at: Mapped[Optional[datetime]] = mapped_column(DateTime)
     survey_completed_at: Mapped[Optional[datetime]] = mapped_column(DateTime)
@@ -294,7 +306,9 @@ class Lead(Base):
 
     __table_args__ = (
         Index("ix_leads_org_stage", "organization_id", "stage"),
-        Index("ix_leads_org_sid", "organization_id", "sid"),
+        # write-behind upserts from lead_service (lead_store_db)
+        Index("uq_leads_org_sid", "organization_id", "sid", unique=True),
+        Index("ix_leads_org_seen", "organization_id", "lastSeenSec"),
     )
 
 
@@ -312,3 +326,46 @@ class Event(Base):
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
 
     conversation: Mapped[Conversation] = relationship("Conversation", back_populates="events")
+
+
+# ---------- Flow sessions (chat flow engine state per visitor sid) ----------
+class FlowSession(Base):
+    __tablename__ = "flow_sessions"
+
+    sid: Mapped[str] = mapped_column(String(64), primary_key=True)
+    # {"node": ..., "waiting_input": ..., "awaiting_node": ..., "qual": {...}}
+    state: Mapped[dict] = mapped_column(JSON)
+    # bumped on every write; lets workers detect changes made by other workers
+    version: Mapped[int] = mapped_column(Integer, default=1)
+    updated_at: Mapped[int] = mapped_column(Integer, index=True)  # epoch seconds
+
+
+# ---------- Lead notes (entries spilled from the in-memory per-lead ring) ----------
+class LeadNote(Base):
+    __tablename__ = "lead_notes"
+    __table_args__ = (UniqueConstraint("lead_id", "seq", name="uq_lead_notes_lead_seq"),)
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    lead_id: Mapped[str] = mapped_column(String(64))  # lead id == visitor sid
+    seq: Mapped[int] = mapped_column(Integer)  # per-lead, 1-based
+    ts: Mapped[int] = mapped_column(Integer)  # epoch seconds
+    kind: Mapped[str] = mapped_column(String(32))  # "score" | "qual" | "answer" | "survey" | ...
+    text: Mapped[str] = mapped_column(Text)
+
+
+# ---------- Survey stats rollup (maintained on response submit / completion) ----------
+class SurveyStatsRollup(Base):
+    __tablename__ = "survey_stats"
+
+    survey_id: Mapped[int] = mapped_column(
+        ForeignKey("surveys.id", ondelete="CASCADE"), primary_key=True
+    )
+    # "" for regular surveys / responses without a variant, else "a" | "b"
+    variant: Mapped[str] = mapped_column(String(1), primary_key=True, default="")
+    responses: Mapped[int] = mapped_column(Integer, default=0)
+    completed: Mapped[int] = mapped_column(Integer, default=0)
+    completed_score_sum: Mapped[int] = mapped_column(BigInteger, default=0)
+    # completions with a start time, and their summed duration
+    timed_completions: Mapped[int] = mapped_column(Integer, default=0)
+    completion_seconds_sum: Mapped[float] = mapped_column(Float, default=0.0)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
@@ -16,7 +16,9 @@ from sqlalchemy.exc import IntegrityError
 from app.core import config as user_config
 from app.services.db import SessionLocal
 from app.models import User, Tenant, ConversationFlow
-from app.services.security import hash_password, verify_password
+from fastapi.concurrency import run_in_threadpool
+
+from app.services.security import hash_password_pooled, verify_password_async
 
 logger = logging.getLogger("ace.portal")
 
@@ -54,26 +56,32 @@ auth_router = APIRouter(prefix="/api/auth", tags=["PortalAuth"])
 public_router = APIRouter(tags=["PortalPublic"])
 
 # -------------------- AUTH (DB-backed) --------------------
-@auth_router.post("/login")
-def login(payload: dict):
-    username = (payload or {}).get("username", "")
-    password = (payload or {}).get("password", "")
-    if not username or not password:
-        raise HTTPException(status_code=400, detail="Missing credentials")
-
+def _login_user(username: str) -> Optional[dict]:
     with SessionLocal() as db:
         u = db.execute(select(User).where(User.username == username)).scalar_one_or_none()
-        if not u or not verify_password(password, u.password_hash):
-            raise HTTPException(status_code=401, detail="Invalid credentials")
-
+        if not u:
+            return None
         tenant_slug = None
         if u.tenant_id:
             t = db.get(Tenant, u.tenant_id)
             tenant_slug = t.slug if t else None
+        return {"username": u.username, "role": u.role, "tenant_slug": tenant_slug, "password_hash": u.password_hash}
+
+@auth_router.post("/login")
+async def login(payload: dict):
+    username = (payload or {}).get("username", "")
+    password = (payload or {}).get("password", "")
+    if not username or not password:
+        raise HTTPException(status_code=400, detail="Missing credentials")
+
+    # db read in the threadpool (session closed again), then bcrypt on the password pool
+    found = await run_in_threadpool(_login_user, username)
+    if not found or not await verify_password_async(password, found.pop("password_hash")):
+        raise HTTPException(status_code=401, detail="Invalid credentials")
 
-        token = _create_token({"sub": u.username, "role": u.role, "tenant_slug": tenant_slug})
-        logger.info("Portal login success for '%s' (role=%s)", u.username, u.role)
-        return {"token": token, "user": {"username": u.username, "role": u.role, "tenant_slug": tenant_slug}}
+    token = _create_token({"sub": found["username"], "role": found["role"], "tenant_slug": found["tenant_slug"]})
+    logger.info("Portal login success for '%s' (role=%s)", found["username"], found["role"])
+    return {"token": token, "user": found}
 
 @auth_router.get("/me")
 def me(authorization: str | None = Header(default=None)):
@@ -152,7 +160,7 @@ def create_customer(payload: dict, authorization: str | None = Header(default=No
         if isinstance(cu, dict) and cu.get("username") and cu.get("password"):
             u = User(
                 username=cu["username"],
-                password_hash=hash_password(cu["password"]),
+                password_hash=hash_password_pooled(cu["password"]),
                 role=cu.get("role", "manager"),
                 tenant_id=t.id
             )
@@ -263,7 +271,7 @@ def admin_create_user(payload: dict, authorization: str | None = Header(default=
                 raise HTTPException(status_code=404, detail="tenant_slug not found")
             tenant_id = t.id
 
-        u = User(username=username, password_hash=hash_password(password), role=role, tenant_id=tenant_id)
+        u = User(username=username, password_hash=hash_password_pooled(password), role=role, tenant_id=tenant_id)
         db.add(u)
         try:
             db.commit()
@@ -285,7 +293,7 @@ def admin_update_user(username: str, payload: dict, authorization: str | None =
             raise HTTPException(status_code=404, detail="User not found")
 
         if "password" in payload and payload["password"]:
-            u.password_hash = hash_password(payload["password"])
+            u.password_hash = hash_password_pooled(payload["password"])
         if "role" in payload:
             if payload["role"] not in ("admin", "manager"):
                 raise HTTPException(status_code=400, detail="role must be 'admin' or 'manager'")
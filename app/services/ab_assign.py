@@ -0,0 +1,126 @@
+# app/services/ab_assign.py
+"""
+Sticky A/B variant assignment.
+
+A visitor (sid) is hashed into one of BUCKETS buckets, salted with the survey
+id so assignments of different surveys are independent. Each variant owns a
+contiguous bucket range sized by its traffic weight; the ranges are
+precomputed once per survey (Buckets), so a decision is one hash plus a
+bisect, for any number of variants.
+
+The hash is only the first-visit decision. The result is remembered in the
+visitor's flow session ("ab" -> {survey_id: variant}), so later requests skip
+the decision and a visitor keeps their variant even if the split is changed
+mid-test. Without a session store the hash alone is still sticky for as long
+as the split is unchanged; a split change then moves only the visitors whose
+bucket changes owner (scripts/bench_ab_split.py --resplit reports the share).
+
+Weights: a variant flow may carry a top-level "traffic_weight"; otherwise
+ACE_AB_SPLIT ("a:50,b:50") applies, and variants missing from it get an equal
+share.
+
+Env:
+  ACE_AB_SPLIT    default split, "variant:weight,..." (default a:50,b:50)
+
+scripts/bench_ab_split.py simulates visitors to check the split offline.
+"""
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+from bisect import bisect_right
+from itertools import accumulate
+from typing import Any, Dict, Iterable, List, MutableMapping, Optional, Tuple
+
+logger = logging.getLogger("ace.ab_assign")
+
+BUCKETS = 10000
+DEFAULT_SPLIT = os.getenv("ACE_AB_SPLIT", "a:50,b:50")
+SESSION_KEY = "ab"
+
+
+def parse_split(spec: str) -> Dict[str, float]:
+    """Parse "a:70,b:30" into {"a": 70.0, "b": 30.0}; malformed parts are skipped."""
+    out: Dict[str, float] = {}
+    for part in (spec or "").split(","):
+        name, _, weight = part.partition(":")
+        try:
+            w = float(weight)
+        except ValueError:
+            continue
+        if name.strip() and w >= 0:
+            out[name.strip()] = w
+    return out
+
+
+class Buckets:
+    """Variant per bucket range, from weights (order of `weights` is kept)."""
+
+    __slots__ = ("variants", "bounds")
+
+    def __init__(self, weights: Iterable[Tuple[str, float]]):
+        items = [(v, float(w)) for v, w in weights if w > 0]
+        if not items:
+            raise ValueError("at least one variant needs a positive weight")
+        total = sum(w for _, w in items)
+        self.variants: List[str] = [v for v, _ in items]
+        # exclusive upper bucket of each variant; the last one is always BUCKETS
+        bounds = [round(BUCKETS * c / total) for c in accumulate(w for _, w in items)]
+        bounds[-1] = BUCKETS
+        self.bounds: List[int] = bounds
+
+    def pick(self, bucket: int) -> str:
+        return self.variants[bisect_right(self.bounds, bucket)]
+
+    def shares(self) -> Dict[str, float]:
+        """Configured share of traffic per variant (0..1)."""
+        lo, out = 0, {}
+        for v, hi in zip(self.variants, self.bounds):
+            out[v] = (hi - lo) / BUCKETS
+            lo = hi
+        return out
+
+
+def buckets_for(flows: Dict[str, Any], default_split: str = DEFAULT_SPLIT) -> Buckets:
+    """Buckets for the configured variant flows {"a": flow, "b": flow, ...}."""
+    split = parse_split(default_split)
+    weights: List[Tuple[str, float]] = []
+    for v, flow in flows.items():
+        w = flow.get("traffic_weight") if isinstance(flow, dict) else None
+        if not isinstance(w, (int, float)) or w < 0:
+            w = split.get(v, 1.0 if not split else sum(split.values()) / len(split))
+        weights.append((v, float(w)))
+    return Buckets(weights)
+
+
+def bucket_of(sid: str, salt: Any = "") -> int:
+    digest = hashlib.blake2b(f"{salt}:{sid}".encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % BUCKETS
+
+
+def assign(
+    survey_id: Any,
+    sid: str,
+    buckets: Buckets,
+    sessions: Optional[MutableMapping[str, Dict[str, Any]]] = None,
+) -> str:
+    """
+    Variant of `sid` for `survey_id`: the one remembered in the session if it
+    is still a configured variant, else the hash decision (then remembered).
+    """
+    key = str(survey_id)
+    if sessions is not None:
+        remembered = ((sessions.get(sid) or {}).get(SESSION_KEY) or {}).get(key)
+        if remembered in buckets.variants:
+            return remembered
+    variant = buckets.pick(bucket_of(sid, survey_id))
+    if sessions is not None:
+        sessions.setdefault(sid, {}).setdefault(SESSION_KEY, {})[key] = variant
+        save = getattr(sessions, "save", None)
+        if save is not None:
+            try:
+                save(sid)
+            except Exception:
+                logger.exception("ab_assign: session save failed sid=%s", sid)
+    return variant
@@ -0,0 +1,225 @@
+# app/services/avatar_images.py
+"""
+Avatar image pipeline, off the event loop.
+
+An upload is decoded once, in a worker process (ProcessPoolExecutor), and
+written as a set of square-bounded sizes in WebP plus a PNG fallback of the
+largest size:
+  static/avatars/<hash>-64.webp  <hash>-128.webp  <hash>-512.webp  <hash>-512.png
+<hash> is a digest of the uploaded bytes, so identical uploads share files
+(the work is skipped when they already exist) and every URL is immutable:
+/static/avatars is served with a one-year immutable Cache-Control.
+
+A worker that dies (e.g. killed while decoding a hostile file) breaks the
+pool; the pool is then replaced and the upload retried once. An upload that
+breaks a fresh pool too, or cannot be decoded, is an InvalidImage (400).
+
+User.avatar_url keeps pointing at the PNG fallback (readable everywhere);
+variants() lists the WebP sizes actually stored for its hash (read from the
+file names, cached per hash), so changing ACE_AVATAR_SIZES never advertises
+sizes an older upload was not rendered at. Legacy avatars (<uuid>.<ext>)
+have no variants.
+
+Env:
+  ACE_AVATAR_WORKERS       worker processes (default 2)
+  ACE_AVATAR_SIZES         WebP sizes in px (default 64,128,512)
+  ACE_AVATAR_MAX_PIXELS    pixel limit, checked before decoding (default 40M)
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import io
+import logging
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from starlette.staticfiles import StaticFiles
+
+from app.core.cache import TTLCache
+
+logger = logging.getLogger("ace.avatar_images")
+
+AVATAR_DIR = Path("static/avatars")
+AVATAR_DIR.mkdir(parents=True, exist_ok=True)
+AVATAR_URL_PREFIX = "/static/avatars/"
+WORKERS = int(os.getenv("ACE_AVATAR_WORKERS", "2"))
+SIZES = tuple(sorted(int(s) for s in os.getenv("ACE_AVATAR_SIZES", "64,128,512").split(",") if s.strip()))
+MAX_PIXELS = int(os.getenv("ACE_AVATAR_MAX_PIXELS", str(40_000_000)))
+WEBP_QUALITY = 82
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+_HASHED = re.compile(r"^([0-9a-f]{20})-(\d+)\.(webp|png)$")
+# hash -> WebP sizes on disk; the TTL bounds staleness across workers
+_stored: TTLCache = TTLCache(maxsize=4096, ttl=300)
+
+
+class InvalidImage(ValueError):
+    """Upload could not be decoded as an image."""
+
+
+def content_hash(content: bytes) -> str:
+    return hashlib.blake2b(content, digest_size=10).hexdigest()
+
+
+def file_names(digest: str, sizes: Sequence[int] = SIZES) -> List[str]:
+    return [f"{digest}-{s}.webp" for s in sizes] + [f"{digest}-{max(sizes)}.png"]
+
+
+def render(content: bytes, out_dir: str, digest: str, sizes: Sequence[int] = SIZES) -> List[str]:
+    """
+    Decode `content` once and write every size (runs in a worker process).
+    Smaller sizes are resized from the previous, larger result. Dimensions
+    come from the header: anything over MAX_PIXELS is rejected before decoding.
+    """
+    from PIL import Image, ImageOps
+
+    Image.MAX_IMAGE_PIXELS = MAX_PIXELS
+    try:
+        img = Image.open(io.BytesIO(content))
+    except Exception as e:
+        raise InvalidImage(str(e)) from None
+    width, height = img.size
+    if width * height > MAX_PIXELS:
+        raise InvalidImage(f"image too large: {width}x{height} exceeds {MAX_PIXELS} pixels")
+    try:
+        img.load()
+        img = ImageOps.exif_transpose(img)
+        img = img.convert("RGBA" if "A" in img.getbands() or img.mode == "P" else "RGB")
+    except Exception as e:
+        raise InvalidImage(str(e)) from None
+
+    out = Path(out_dir)
+    names = []
+    for size in sorted(sizes, reverse=True):
+        img.thumbnail((size, size), Image.Resampling.LANCZOS)
+        if size == max(sizes):
+            name = f"{digest}-{size}.png"
+            _write(out / name, img, "PNG", optimize=True)
+            names.append(name)
+        name = f"{digest}-{size}.webp"
+        _write(out / name, img, "WEBP", quality=WEBP_QUALITY, method=4)
+        names.append(name)
+    return names
+
+
+def _write(path: Path, img, fmt: str, **opts) -> None:
+    # write-then-rename: a concurrent request never serves a half-written file
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    img.save(tmp, fmt, **opts)
+    os.replace(tmp, path)
+
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+def _pool() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=max(1, WORKERS))
+    return _executor
+
+
+def _replace_pool(broken: ProcessPoolExecutor) -> None:
+    """Drop a broken pool (once, however many uploads saw it break)."""
+    global _executor
+    if _executor is broken:
+        _executor = None
+        broken.shutdown(wait=False, cancel_futures=True)
+
+
+async def process_upload(content: bytes) -> str:
+    """Render all sizes of an upload; returns the avatar URL (PNG fallback)."""
+    digest = content_hash(content)
+    names = file_names(digest)
+    if not all((AVATAR_DIR / n).exists() for n in names):
+        loop = asyncio.get_running_loop()
+        for attempt in (1, 2):
+            pool = _pool()
+            try:
+                await loop.run_in_executor(pool, render, content, str(AVATAR_DIR), digest, SIZES)
+                break
+            except BrokenProcessPool:
+                logger.warning("avatar worker pool broke hash=%s attempt=%d; replacing it", digest, attempt)
+                _replace_pool(pool)
+        else:
+            raise InvalidImage("image could not be processed")
+        logger.info("avatar rendered hash=%s bytes=%d sizes=%s", digest, len(content), SIZES)
+        _stored.pop(digest)
+    return AVATAR_URL_PREFIX + names[-1]
+
+
+def stored_sizes(digest: str) -> Tuple[int, ...]:
+    """WebP sizes rendered for `digest`, ascending, as found on disk."""
+    sizes = _stored.get(digest)
+    if sizes is None:
+        found = (_HASHED.match(p.name) for p in AVATAR_DIR.glob(f"{digest}-*.webp"))
+        sizes = tuple(sorted(int(m.group(2)) for m in found if m))
+        _stored.set(digest, sizes)
+    return sizes
+
+
+def variants(avatar_url: Optional[str]) -> Dict[str, str]:
+    """
+    {"64": url, "128": url, "512": url, "fallback": url} for a hashed avatar,
+    else {}. Sizes are the ones stored for it, smallest first.
+    """
+    digest = _digest_of(avatar_url)
+    if digest is None:
+        return {}
+    out = {str(s): f"{AVATAR_URL_PREFIX}{digest}-{s}.webp" for s in stored_sizes(digest)}
+    out["fallback"] = avatar_url
+    return out
+
+
+def thumb(avatar_url: Optional[str]) -> Optional[str]:
+    """Smallest stored variant of an avatar, else the avatar URL itself."""
+    return next(iter(variants(avatar_url).values()), avatar_url)
+
+
+def _digest_of(avatar_url: Optional[str]) -> Optional[str]:
+    if not avatar_url or not avatar_url.startswith(AVATAR_URL_PREFIX):
+        return None
+    m = _HASHED.match(avatar_url[len(AVATAR_URL_PREFIX):])
+    return m.group(1) if m else None
+
+
+def files_of(avatar_url: Optional[str]) -> List[Path]:
+    """Files on disk behind an avatar URL (all sizes for hashed avatars)."""
+    if not avatar_url or not avatar_url.startswith(AVATAR_URL_PREFIX):
+        return []
+    digest = _digest_of(avatar_url)
+    if digest is None:
+        return [AVATAR_DIR / avatar_url[len(AVATAR_URL_PREFIX):]]
+    return [p for p in AVATAR_DIR.glob(f"{digest}-*") if _HASHED.match(p.name)]
+
+
+def remove_files(avatar_url: Optional[str]) -> None:
+    digest = _digest_of(avatar_url)
+    if digest is not None:
+        _stored.pop(digest)
+    for path in files_of(avatar_url):
+        try:
+            path.unlink(missing_ok=True)
+        except OSError:
+            logger.warning("avatar file not removed: %s", path)
+
+
+def shutdown() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+class ImmutableStaticFiles(StaticFiles):
+    """StaticFiles for content-addressed files: cache forever."""
+
+    def file_response(self, *args, **kwargs):
+        response = super().file_response(*args, **kwargs)
+        response.headers["Cache-Control"] = IMMUTABLE
+        return response
@@ -0,0 +1,311 @@
+# app/services/chat_log.py
+"""
+Segmented, indexed on-disk chat log used by chat_store.
+
+Layout (next to ACE_CHAT_STORE_PATH, e.g. data/chat_store.jsonl):
+  data/chat_store.jsonl              legacy single file (segment 0, read-only)
+  data/chat_store.000001.jsonl ...   rotating append-only JSONL segments
+  data/chat_store.idx.sqlite         index: sid -> (segment, offset, length)
+
+Reads seek straight to a session's records via the index (mmap per segment),
+so nothing has to be parsed at startup. Only the tail of the active segment
+that is not yet indexed (crash between write and index commit) is rescanned.
+
+Writes come from a single writer per process (chat_store's background
+writer); segment appends take an flock so several workers on one box can
+share the directory safely.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import mmap
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+try:  # POSIX only; without it we assume a single writer process
+    import fcntl  # type: ignore
+except Exception:  # pragma: no cover
+    fcntl = None  # type: ignore
+
+logger = logging.getLogger("ace.chat_log")
+
+# (sid, timestamp, encoded JSONL line)
+Entry = Tuple[str, int, bytes]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS seg (
+    seg INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    indexed_bytes INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS msg (
+    id INTEGER PRIMARY KEY,
+    sid TEXT NOT NULL,
+    seg INTEGER NOT NULL,
+    off INTEGER NOT NULL,
+    len INTEGER NOT NULL,
+    ts INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_msg_sid ON msg (sid, id);
+CREATE INDEX IF NOT EXISTS ix_msg_ts ON msg (ts, id);
+CREATE TABLE IF NOT EXISTS sess (
+    sid TEXT PRIMARY KEY,
+    n INTEGER NOT NULL DEFAULT 0,
+    last_ts INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+
+def _valid(msg: dict) -> bool:
+    return bool(
+        msg.get("sid")
+        and msg.get("role")
+        and isinstance(msg.get("text"), str)
+        and isinstance(msg.get("timestamp"), int)
+    )
+
+
+def _decode(raw: bytes) -> Optional[dict]:
+    try:
+        msg = json.loads(raw)
+    except Exception:
+        return None
+    if not isinstance(msg, dict) or not _valid(msg):
+        return None
+    return {"sid": msg["sid"], "role": msg["role"], "text": msg["text"], "timestamp": msg["timestamp"]}
+
+
+class SegmentedChatLog:
+    shared = False  # one box, one writer per process -> chat_store may cache sessions
+
+    def __init__(self, legacy_path: str, *, segment_max_bytes: int = 64 * 1024 * 1024):
+        self.legacy_path = legacy_path
+        self.dir = os.path.dirname(legacy_path) or "."
+        base = os.path.basename(legacy_path)
+        self.base = base[:-len(".jsonl")] if base.endswith(".jsonl") else base
+        self.index_path = os.path.join(self.dir, f"{self.base}.idx.sqlite")
+        self.segment_max_bytes = max(1024, segment_max_bytes)
+        self._tls = threading.local()
+        self._write_lock = threading.Lock()
+        self._seg_names: Dict[int, str] = {}
+        os.makedirs(self.dir, exist_ok=True)
+
+        conn = self._conn()
+        conn.executescript(_SCHEMA)
+        conn.commit()
+        self._open()
+
+    # ------------------------------------------------------------ plumbing --
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._tls, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.index_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._tls.conn = conn
+        return conn
+
+    def _seg_path(self, seg: int) -> str:
+        name = self._seg_names.get(seg)
+        if name is None:
+            row = self._conn().execute("SELECT name FROM seg WHERE seg=?", (seg,)).fetchone()
+            name = row[0] if row else f"{self.base}.{seg:06d}.jsonl"
+            self._seg_names[seg] = name
+        return os.path.join(self.dir, name)
+
+    def _open(self) -> None:
+        conn = self._conn()
+        # legacy single-file store becomes read-only segment 0
+        if os.path.exists(self.legacy_path):
+            conn.execute(
+                "INSERT OR IGNORE INTO seg (seg, name, indexed_bytes) VALUES (0, ?, 0)",
+                (os.path.basename(self.legacy_path),),
+            )
+        rows = conn.execute("SELECT seg, name, indexed_bytes FROM seg ORDER BY seg").fetchall()
+        for seg, name, indexed in rows:
+            self._seg_names[seg] = name
+            path = os.path.join(self.dir, name)
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+            if size > indexed:
+                # legacy import (once) or crash recovery of an un-indexed tail
+                n = self._index_tail(seg, indexed, size)
+                logger.info("chat_log: indexed %d messages from %s [%d..%d]", n, name, indexed, size)
+
+    def _index_tail(self, seg: int, start: int, end: int) -> int:
+        path = self._seg_path(seg)
+        rows: List[Tuple[str, int, int, int, int]] = []
+        with open(path, "rb") as f:
+            f.seek(start)
+            off = start
+            while off < end:
+                raw = f.readline()
+                if not raw:
+                    break
+                if not raw.endswith(b"\n"):
+                    break  # partial line (writer mid-append); pick it up next time
+                msg = _decode(raw)
+                if msg is not None:
+                    rows.append((msg["sid"], seg, off, len(raw), msg["timestamp"]))
+                off += len(raw)
+        self._commit_index(seg, rows, off)
+        return len(rows)
+
+    def _commit_index(self, seg: int, rows: Sequence[Tuple[str, int, int, int, int]], indexed_bytes: int) -> None:
+        conn = self._conn()
+        per_sid: Dict[str, Tuple[int, int]] = {}
+        for sid, _seg, _off, _len, ts in rows:
+            n, last = per_sid.get(sid, (0, 0))
+            per_sid[sid] = (n + 1, max(last, ts))
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany("INSERT INTO msg (sid, seg, off, len, ts) VALUES (?, ?, ?, ?, ?)", rows)
+            conn.executemany(
+                "INSERT INTO sess (sid, n, last_ts) VALUES (?, ?, ?) "
+                "ON CONFLICT(sid) DO UPDATE SET n = n + excluded.n, last_ts = MAX(last_ts, excluded.last_ts)",
+                [(sid, n, last) for sid, (n, last) in per_sid.items()],
+            )
+            conn.execute("UPDATE seg SET indexed_bytes=? WHERE seg=?", (indexed_bytes, seg))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _active_segment(self, conn: sqlite3.Connection) -> Tuple[int, str]:
+        row = conn.execute("SELECT seg, name FROM seg WHERE seg > 0 ORDER BY seg DESC LIMIT 1").fetchone()
+        if row is None:
+            return self._new_segment(conn, 1)
+        seg, name = row
+        if os.path.exists(os.path.join(self.dir, name)) and \
+                os.path.getsize(os.path.join(self.dir, name)) >= self.segment_max_bytes:
+            return self._new_segment(conn, seg + 1)
+        return seg, name
+
+    def _new_segment(self, conn: sqlite3.Connection, seg: int) -> Tuple[int, str]:
+        name = f"{self.base}.{seg:06d}.jsonl"
+        conn.execute("INSERT OR IGNORE INTO seg (seg, name, indexed_bytes) VALUES (?, ?, 0)", (seg, name))
+        self._seg_names[seg] = name
+        logger.info("chat_log: new segment %s", name)
+        return seg, name
+
+    # --------------------------------------------------------------- write --
+    def append(self, entries: Iterable[Entry], *, fsync: bool = False) -> None:
+        """Append a batch (one write + one index transaction)."""
+        entries = list(entries)
+        if not entries:
+            return
+        with self._write_lock:
+            conn = self._conn()
+            seg, name = self._active_segment(conn)
+            path = os.path.join(self.dir, name)
+            with open(path, "ab") as f:
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+                try:
+                    f.seek(0, os.SEEK_END)
+                    start = f.tell()
+                    # another worker may have appended since our last index commit
+                    indexed = conn.execute("SELECT indexed_bytes FROM seg WHERE seg=?", (seg,)).fetchone()[0]
+                    if start > indexed:
+                        self._index_tail(seg, indexed, start)
+                    rows = []
+                    off = start
+                    for sid, ts, line in entries:
+                        rows.append((sid, seg, off, len(line), ts))
+                        off += len(line)
+                    f.write(b"".join(line for _, _, line in entries))
+                    f.flush()
+                    if fsync:
+                        os.fsync(f.fileno())
+                    self._commit_index(seg, rows, off)
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def append_messages(self, items: Iterable[Tuple[Optional[str], dict]], *, fsync: bool = False) -> None:
+        """chat_store batch entry point; (org, message) pairs, org is not stored."""
+        self.append(
+            [
+                (m["sid"], m["timestamp"], (json.dumps(m, ensure_ascii=False) + "\n").encode("utf-8"))
+                for _, m in items
+            ],
+            fsync=fsync,
+        )
+
+    # ---------------------------------------------------------------- read --
+    def _read_locations(self, locs: Sequence[Tuple[int, int, int]]) -> List[dict]:
+        out: List[dict] = []
+        maps: Dict[int, Tuple[object, object]] = {}
+        try:
+            for seg, off, ln in locs:
+                if seg not in maps:
+                    f = open(self._seg_path(seg), "rb")
+                    try:
+                        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                    except ValueError:  # empty file
+                        f.close()
+                        continue
+                    maps[seg] = (f, mm)
+                mm = maps[seg][1]
+                msg = _decode(mm[off:off + ln])  # type: ignore[index]
+                if msg is not None:
+                    out.append(msg)
+        finally:
+            for f, mm in maps.values():
+                mm.close()  # type: ignore[attr-defined]
+                f.close()  # type: ignore[attr-defined]
+        return out
+
+    def read_sid(self, sid: str) -> List[dict]:
+        locs = self._conn().execute(
+            "SELECT seg, off, len FROM msg WHERE sid=? ORDER BY id", (sid,)
+        ).fetchall()
+        return self._read_locations(locs)
+
+    def read_recent(
+        self, limit: int, *, before_ts: Optional[int] = None, after_ts: Optional[int] = None
+    ) -> List[dict]:
+        """
+        `limit` messages across all sessions via ix_msg_ts, oldest first: the
+        newest ones (older than `before_ts`), or with `after_ts` the oldest
+        ones newer than it.
+        """
+        where, args = [], []
+        if before_ts is not None:
+            where.append("ts < ?")
+            args.append(int(before_ts))
+        if after_ts is not None:
+            where.append("ts > ?")
+            args.append(int(after_ts))
+        order = "ASC" if after_ts is not None else "DESC"
+        sql = "SELECT seg, off, len FROM msg"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += f" ORDER BY ts {order}, id {order} LIMIT ?"
+        locs = self._conn().execute(sql, (*args, int(limit))).fetchall()
+        if after_ts is None:
+            locs.reverse()
+        return self._read_locations(locs)
+
+    def count_at(self, ts: int, *, sid: Optional[str] = None) -> int:
+        """Messages stamped with second `ts` (of one sid, if given)."""
+        sql, args = "SELECT COUNT(*) FROM msg WHERE ts=?", [int(ts)]
+        if sid is not None:
+            sql += " AND sid=?"
+            args.append(sid)
+        return int(self._conn().execute(sql, args).fetchone()[0])
+
+    def sids(self) -> List[str]:
+        return [r[0] for r in self._conn().execute("SELECT sid FROM sess ORDER BY last_ts DESC")]
+
+    def counts(self) -> Tuple[int, int]:
+        row = self._conn().execute("SELECT COUNT(*), COALESCE(SUM(n), 0) FROM sess").fetchone()
+        return int(row[0]), int(row[1])
+
+    def segments(self) -> int:
+        return int(self._conn().execute("SELECT COUNT(*) FROM seg").fetchone()[0])
+
+    def stats(self) -> Dict[str, object]:
+        return {"backend": "file", "path": self.legacy_path, "segments": self.segments()}
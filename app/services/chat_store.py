@@ -1,13 +1,20 @@
 # app/services/chat_store.py
 from __future__ import annotations
 
-import json
+import atexit
+import heapq
 import os
+import queue
 import threading
 import time
-from typing import Dict, List, Optional, TypedDict, Literal
+from collections import deque
+from itertools import islice
+from typing import Any, Callable, Deque, Dict, List, NamedTuple, Optional, Tuple, TypedDict, Literal
 import logging
 
+from app.core.cache import TTLCache
+from app.services.chat_log import SegmentedChatLog
+
 logger = logging.getLogger("ace.chat_store")
 
 Role = Literal["user", "assistant", "staff"]
@@ -19,14 +26,47 @@ class ChatMessage(TypedDict):
     timestamp: int  # epoch seconds
 
 
-# Store path (configurable)
+# Store path (configurable). Segments + index live next to it (see chat_log).
 STORE_PATH = os.getenv(
     "ACE_CHAT_STORE_PATH",
     os.path.join(os.getcwd(), "data", "chat_store.jsonl")
 )
 
-_index: Dict[str, List[ChatMessage]] = {}
+# Background writer tuning
+#   ACE_CHAT_STORE_BATCH      max lines per write() (default 256)
+#   ACE_CHAT_STORE_FLUSH_MS   max time a line waits in the queue (default 200ms)
+#   ACE_CHAT_STORE_FSYNC      none | batch | interval (default interval)
+#   ACE_CHAT_STORE_FSYNC_SECS fsync period for "interval" (default 1s)
+BATCH_MAX = int(os.getenv("ACE_CHAT_STORE_BATCH", "256"))
+FLUSH_INTERVAL = float(os.getenv("ACE_CHAT_STORE_FLUSH_MS", "200")) / 1000.0
+FSYNC_POLICY = os.getenv("ACE_CHAT_STORE_FSYNC", "interval").strip().lower()
+FSYNC_SECS = float(os.getenv("ACE_CHAT_STORE_FSYNC_SECS", "1"))
+
+# Storage layout
+#   ACE_CHAT_STORE_SEGMENT_MB    rotate segments at this size (default 64MB)
+#   ACE_CHAT_STORE_HOT_SESSIONS  sessions kept in memory (LRU, default 2000)
+SEGMENT_MAX_BYTES = int(float(os.getenv("ACE_CHAT_STORE_SEGMENT_MB", "64")) * 1024 * 1024)
+HOT_SESSIONS = int(os.getenv("ACE_CHAT_STORE_HOT_SESSIONS", "2000"))
+
+# Backend
+#   ACE_CHAT_STORE_BACKEND  file (default, segmented JSONL) | db (conversations/messages tables)
+#   ACE_CHAT_DEFAULT_ORG    org slug for messages appended without one (db backend)
+BACKEND = os.getenv("ACE_CHAT_STORE_BACKEND", "file").strip().lower()
+DEFAULT_ORG = os.getenv("ACE_CHAT_DEFAULT_ORG", "").strip() or None
+
 _lock = threading.RLock()
+# sid -> full message list, only for recently used sessions
+_hot = TTLCache(maxsize=HOT_SESSIONS)
+# sid -> messages queued for the writer but not yet on disk / indexed
+_pending: Dict[str, Deque[ChatMessage]] = {}
+# the same messages across all sids, in append (= commit) order
+_queued: Deque[ChatMessage] = deque()
+# held by the writer while committing a batch (and by readers as a fallback)
+_commit_lock = threading.Lock()
+# commit generation, bumped under _lock before and after each batch (odd while
+# a batch is being written): readers read the log without _commit_lock and
+# retry if a commit overlapped, so they see every message once (disk XOR pending)
+_commit_gen = 0
 
 
 def _ensure_store_dir():
@@ -35,46 +75,197 @@ def _ensure_store_dir():
         os.makedirs(d, exist_ok=True)
 
 
-def _load_once() -> None:
-    if _index:  # already loaded
-        return
+def _make_log():
+    if BACKEND in ("db", "sql", "postgres", "postgresql"):
+        from app.services.chat_store_db import DBChatLog
+
+        logger.info("chat_store: db backend default_org=%s", DEFAULT_ORG)
+        return DBChatLog(default_org=DEFAULT_ORG)
     _ensure_store_dir()
-    if not os.path.exists(STORE_PATH):
-        logger.info("chat_store: no file, starting empty path=%s", STORE_PATH)
-        return
-    loaded = 0
-    bad = 0
-    try:
-        with open(STORE_PATH, "r", encoding="utf-8") as f:
-            for line in f:
-                line = line.strip()
-                if not line:
-                    continue
-                try:
-                    msg = json.loads(line)
-                    sid = msg.get("sid")
-                    role = msg.get("role")
-                    text = msg.get("text")
-                    ts = msg.get("timestamp")
-                    if not (sid and role and isinstance(text, str) and isinstance(ts, int)):
-                        bad += 1
-                        continue
-                    _index.setdefault(sid, []).append({
-                        "sid": sid, "role": role, "text": text, "timestamp": ts
-                    })  # type: ignore
-                    loaded += 1
-                except Exception:
-                    bad += 1
-                    continue
-        logger.info("chat_store: loaded=%d bad=%d path=%s", loaded, bad, STORE_PATH)
-    except Exception as e:
-        logger.exception("chat_store: load error: %s", e)
-
-
-_load_once()
-
-
-def append_message(sid: str, role: Role, text: str, *, ts: Optional[int] = None) -> ChatMessage:
+    return SegmentedChatLog(STORE_PATH, segment_max_bytes=SEGMENT_MAX_BYTES)
+
+
+_log = None  # created on first use, so importing the module touches no files
+_log_lock = threading.Lock()
+
+
+def _get_log():
+    global _log
+    if _log is None:
+        with _log_lock:
+            if _log is None:
+                _log = _make_log()
+    return _log
+
+
+# ----------------------------- Background writer -----------------------------
+
+class _BatchWriter:
+    """
+    Single writer thread draining a FIFO queue of items into `sink(batch, fsync)`.
+    Items are handed over in submit order (so per-sid order is preserved), one
+    sink call per batch.
+    """
+
+    def __init__(
+        self,
+        sink: Callable[[List[Any], bool], None],
+        batch_max: int,
+        flush_interval: float,
+        fsync_policy: str,
+        fsync_secs: float,
+    ):
+        self.sink = sink
+        self.batch_max = max(1, batch_max)
+        self.flush_interval = max(0.0, flush_interval)
+        self.fsync_policy = fsync_policy if fsync_policy in ("none", "batch", "interval") else "interval"
+        self.fsync_secs = fsync_secs
+        self._q: "queue.Queue[object]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._closed = False
+        self._last_fsync = time.monotonic()
+        self.batches = 0
+        self.lines = 0
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="chat-store-writer", daemon=True)
+                self._thread.start()
+
+    def submit(self, item: Any) -> None:
+        if self._closed:
+            # after shutdown: write through synchronously rather than lose data
+            self.sink([item], self.fsync_policy != "none")
+            return
+        self._ensure_started()
+        self._q.put(item)
+
+    def flush(self, timeout: Optional[float] = 5.0) -> bool:
+        """Block until everything submitted so far is written."""
+        if self._thread is None or not self._thread.is_alive():
+            return True
+        done = threading.Event()
+        self._q.put(done)
+        return done.wait(timeout)
+
+    def close(self, timeout: Optional[float] = 5.0) -> None:
+        if self._closed:
+            return
+        self.flush(timeout)
+        self._closed = True
+        if self._thread is not None and self._thread.is_alive():
+            self._q.put(None)
+            self._thread.join(timeout)
+
+    def _want_fsync(self, forced: bool) -> bool:
+        if self.fsync_policy == "none":
+            return False
+        if self.fsync_policy == "batch" or forced:
+            return True
+        return time.monotonic() - self._last_fsync >= self.fsync_secs
+
+    def _run(self) -> None:
+        try:
+            while True:
+                item = self._q.get()
+                if item is None:
+                    break
+                batch: List[Any] = []
+                waiters: List[threading.Event] = []
+                stop = False
+                deadline = time.monotonic() + self.flush_interval
+                while True:
+                    if isinstance(item, threading.Event):
+                        waiters.append(item)
+                        break  # flush() request: write what we have now
+                    if item is None:
+                        stop = True
+                        break
+                    batch.append(item)
+                    if len(batch) >= self.batch_max:
+                        break
+                    remaining = deadline - time.monotonic()
+                    try:
+                        item = self._q.get(timeout=remaining) if remaining > 0 else self._q.get_nowait()
+                    except queue.Empty:
+                        break
+
+                if batch:
+                    fsync = self._want_fsync(forced=stop)
+                    try:
+                        self.sink(batch, fsync)
+                        self.batches += 1
+                        self.lines += len(batch)
+                        if fsync:
+                            self._last_fsync = time.monotonic()
+                    except Exception:
+                        logger.exception("chat_store: batch write failed lines=%d", len(batch))
+                for w in waiters:
+                    w.set()
+                if stop:
+                    break
+        except Exception:
+            logger.exception("chat_store: writer thread crashed")
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._q.qsize(),
+            "batches": self.batches,
+            "lines": self.lines,
+            "fsync": self.fsync_policy,
+        }
+
+
+def _commit_batch(batch: List[Tuple[Optional[str], ChatMessage]], fsync: bool) -> None:
+    global _commit_gen
+    log = _get_log()
+    with _commit_lock:
+        with _lock:
+            _commit_gen += 1
+        try:
+            log.append_messages(batch, fsync=fsync)
+        finally:
+            # on failure the messages are dropped from pending too (logged by the writer);
+            # keeping them would grow memory without bound
+            with _lock:
+                _commit_gen += 1
+                for _, m in batch:
+                    if _queued:
+                        _queued.popleft()
+                    dq = _pending.get(m["sid"])
+                    if dq:
+                        dq.popleft()
+                        if not dq:
+                            _pending.pop(m["sid"], None)
+
+
+_writer = _BatchWriter(_commit_batch, BATCH_MAX, FLUSH_INTERVAL, FSYNC_POLICY, FSYNC_SECS)
+
+
+def flush(timeout: Optional[float] = 5.0) -> bool:
+    """Wait until all queued messages are on disk."""
+    return _writer.flush(timeout)
+
+
+def close(timeout: Optional[float] = 5.0) -> None:
+    """Flush and stop the background writer (app shutdown)."""
+    _writer.close(timeout)
+    logger.info("chat_store: writer closed %s", _writer.stats())
+
+
+atexit.register(close)
+
+
+# ----------------------------------- API -------------------------------------
+
+def append_message(
+    sid: str, role: Role, text: str, *, ts: Optional[int] = None, org: Optional[str] = None
+) -> ChatMessage:
+    """`org` (tenant slug) picks the conversation row on the db backend; ignored by the file backend."""
     if not sid or not text or role not in ("user", "assistant", "staff"):
         raise ValueError("invalid message")
 
@@ -85,42 +276,278 @@ def append_message(sid: str, role: Role, text: str, *, ts: Optional[int] = None)
         "timestamp": int(ts if ts is not None else time.time()),
     }
 
-    _ensure_store_dir()
     with _lock:
-        _index.setdefault(sid, []).append(msg)
-        with open(STORE_PATH, "a", encoding="utf-8") as f:
-            f.write(json.dumps(msg, ensure_ascii=False) + "\n")
+        _pending.setdefault(sid, deque()).append(msg)
+        _queued.append(msg)
+        hot = _hot.get(sid)
+        if hot is not None:
+            hot.append(msg)
+        # enqueue under the lock so disk order matches pending order
+        _writer.submit((org, msg))
     logger.info("WRITE chat_store sid=%s role=%s len=%d ts=%d", sid, role, len(text), msg["timestamp"])
     return msg
 
 
+def _ts(m: ChatMessage) -> int:
+    return m["timestamp"]
+
+
+def _in_window(m: ChatMessage, before_ts: Optional[int], after_ts: Optional[int]) -> bool:
+    return (after_ts is None or m["timestamp"] > after_ts) and (before_ts is None or m["timestamp"] < before_ts)
+
+
+def _read_consistent(read: Callable[[], Any], combine: Callable[[Any], Any], attempts: int = 3) -> Any:
+    """
+    combine(read()) where read() hits the log with no lock held and combine()
+    runs under _lock; retried if a batch commit overlapped the read, so stored
+    and pending messages are each seen exactly once.
+    """
+    for _ in range(attempts):
+        with _lock:
+            gen = _commit_gen
+        if gen % 2 == 0:
+            stored = read()
+            with _lock:
+                if _commit_gen == gen:
+                    return combine(stored)
+        time.sleep(0.001)
+    # writer is busy: read between batches instead
+    with _commit_lock:
+        stored = read()
+        with _lock:
+            return combine(stored)
+
+
+def _load_sid(sid: str) -> List[ChatMessage]:
+    """Cold load: indexed disk records + not-yet-written pending messages."""
+    log = _get_log()
+
+    def combine(msgs: List[ChatMessage]) -> List[ChatMessage]:
+        if log.shared:
+            # other nodes append to the same history: never serve it from memory
+            msgs.extend(_pending.get(sid, ()))
+            return msgs
+        hot = _hot.get(sid)
+        if hot is not None:  # loaded concurrently
+            return hot
+        msgs.extend(_pending.get(sid, ()))
+        _hot.set(sid, msgs)
+        return msgs
+
+    return _read_consistent(lambda: log.read_sid(sid), combine)
+
+
 def list_messages(sid: str) -> List[ChatMessage]:
     with _lock:
-        return list(_index.get(sid, []))
+        hot = _hot.get(sid)
+        if hot is not None:
+            return list(hot)
+    msgs = _load_sid(sid)
+    with _lock:
+        return list(msgs)
+
+
+# A cursor is a position between messages: (timestamp, index within that
+# second). Within a second, messages keep storage order (index id / row id),
+# then not-yet-written ones in append order -- the order they are committed
+# in -- so a position stays valid as the writer drains and new messages
+# arrive. Unlike a bare timestamp it never skips messages sharing a second.
+Pos = Tuple[int, int]
+
+
+class ChatPage(NamedTuple):
+    messages: List[ChatMessage]
+    before: Optional[Pos]  # position of the first message (cursor for the older page)
+    after: Optional[Pos]   # position after the last message (cursor for the newer page)
+
+
+# read(n, before_ts=, after_ts=) -> stored messages oldest first (newest n
+# with only before_ts); count_at(ts) -> stored messages in that second
+Reader = Callable[..., List[ChatMessage]]
+
+
+def pos_from_ts(before_ts: Optional[int], after_ts: Optional[int]) -> Tuple[Optional[Pos], Optional[Pos]]:
+    """Strict second bounds (ts < before_ts, ts > after_ts) as positions."""
+    return (
+        (int(before_ts), 0) if before_ts is not None else None,
+        (int(after_ts) + 1, 0) if after_ts is not None else None,
+    )
+
+
+def _paginate(
+    read: Reader,
+    count_at: Callable[[int], int],
+    queued: Callable[[], List[ChatMessage]],
+    limit: int,
+    before: Optional[Pos],
+    after: Optional[Pos],
+) -> ChatPage:
+    """
+    Keyset page over stored messages merged with the queued ones: with
+    `after` the oldest `limit` after it (bounded by `before`, if given),
+    otherwise the newest `limit` before `before` (or overall).
+    """
+
+    def total_at(ts: int) -> int:
+        return _read_consistent(lambda: count_at(ts), lambda n: n + sum(m["timestamp"] == ts for m in queued()))
+
+    if after is not None:
+        t, k = after
+        stored, pend = _read_consistent(lambda: read(limit + k, after_ts=t - 1), lambda s: (s, queued()))
+        run = heapq.merge(stored, sorted((m for m in pend if m["timestamp"] >= t), key=_ts), key=_ts)
+        out: List[ChatMessage] = []
+        skipped, prev, idx = 0, None, 0
+        for m in islice(run, limit + k):
+            ts = m["timestamp"]
+            idx = idx + 1 if ts == prev else 0  # the run starts at the start of second t
+            prev = ts
+            if ts == t and idx < k:
+                skipped += 1
+                continue
+            if before is not None and (ts, idx) >= before:
+                break
+            out.append(m)
+            if len(out) >= limit:
+                break
+        first = (t, skipped)
+        return ChatPage(out, first, (out[-1]["timestamp"], idx + 1) if out else first)
+
+    if before is None:
+        stored, pend = _read_consistent(lambda: read(limit), lambda s: (s, queued()))
+        older, group = list(heapq.merge(stored, sorted(pend, key=_ts), key=_ts)), []
+    else:
+        t, k = before
+        (lt, at_t), pend = _read_consistent(
+            lambda: (read(limit, before_ts=t), read(k, after_ts=t - 1, before_ts=t + 1) if k else []),
+            lambda s: (s, queued()),
+        )
+        pend_lt = sorted((m for m in pend if m["timestamp"] < t), key=_ts)
+        older = list(heapq.merge(lt, pend_lt, key=_ts))
+        group = (at_t + [m for m in pend if m["timestamp"] == t])[:k]
+    page = (older[-limit:] + group)[-limit:]
+    if not page:
+        return ChatPage([], before, before)
+
+    f_ts, l_ts = page[0]["timestamp"], page[-1]["timestamp"]
+    n_first = sum(m["timestamp"] == f_ts for m in page)
+    if before is not None and f_ts == before[0]:
+        first = len(group) - n_first
+    else:
+        # the page holds the newest n_first messages of second f_ts
+        first = max(0, total_at(f_ts) - n_first)
+    if before is not None:
+        last: Pos = (before[0], len(group))
+    elif f_ts == l_ts:
+        last = (l_ts, first + len(page))
+    else:
+        last = (l_ts, sum(m["timestamp"] == l_ts for m in page))
+    return ChatPage(page, (f_ts, first), last)
+
+
+def _list_reader(msgs: List[ChatMessage]) -> Tuple[Reader, Callable[[int], int]]:
+    """read/count_at over an in-memory session (already in storage order)."""
+
+    def read(n: int, *, before_ts: Optional[int] = None, after_ts: Optional[int] = None) -> List[ChatMessage]:
+        sel = sorted((m for m in msgs if _in_window(m, before_ts, after_ts)), key=_ts)
+        return sel[:n] if after_ts is not None else sel[-n:]
+
+    return read, lambda ts: sum(m["timestamp"] == ts for m in msgs)
+
+
+def page_messages(
+    sid: str,
+    *,
+    before: Optional[Pos] = None,
+    after: Optional[Pos] = None,
+    limit: int = 200,
+) -> ChatPage:
+    """
+    One page of sid's messages, oldest first. `after` pages forward, `before`
+    alone returns the newest `limit` messages before it; with neither, the
+    first page of the session. The db backend answers with keyset queries on
+    ts_epoch.
+    """
+    limit = max(1, int(limit))
+    if before is None and after is None:
+        after = (0, 0)
+    log = _get_log()
+    if log.shared:
+        def read(n: int, **window) -> List[ChatMessage]:
+            return log.read_sid_page(sid, limit=n, **window)
+
+        return _paginate(
+            read,
+            lambda ts: log.count_at(ts, sid=sid),
+            lambda: list(_pending.get(sid, ())),
+            limit, before, after,
+        )
+    read, count_at = _list_reader(list_messages(sid))
+    return _paginate(read, count_at, list, limit, before, after)
+
+
+def list_messages_page(
+    sid: str,
+    *,
+    after_ts: Optional[int] = None,
+    before_ts: Optional[int] = None,
+    limit: int = 200,
+) -> List[ChatMessage]:
+    """page_messages() with strict second bounds (older callers)."""
+    before, after = pos_from_ts(before_ts, after_ts)
+    return page_messages(sid, before=before, after=after, limit=limit).messages
 
 
 def list_all(limit_per_sid: int = 1000) -> Dict[str, List[ChatMessage]]:
     out: Dict[str, List[ChatMessage]] = {}
+    for sid in _get_log().sids():
+        out[sid] = list_messages(sid)[-limit_per_sid:]
     with _lock:
-        for k, v in _index.items():
-            out[k] = v[-limit_per_sid:]
+        for sid, dq in _pending.items():
+            if sid not in out:
+                out[sid] = list(dq)[-limit_per_sid:]
     return out
 
 
-def list_all_flat(limit: int = 10000) -> List[ChatMessage]:
-    with _lock:
-        all_msgs: List[ChatMessage] = []
-        for arr in _index.values():
-            all_msgs.extend(arr)
-        all_msgs.sort(key=lambda m: m["timestamp"])
-        return all_msgs[-limit:]
+def page_all(
+    limit: int = 10000,
+    *,
+    before: Optional[Pos] = None,
+    after: Optional[Pos] = None,
+) -> ChatPage:
+    """
+    Messages across all sessions, oldest first: the newest `limit` (before
+    `before`), or with `after` the oldest `limit` after it.
+
+    The backend returns an already time-ordered run from its (ts, id) index;
+    it is merged with the queued messages, so only about `limit` messages
+    are ever looked at (no sort of the corpus).
+    """
+    log = _get_log()
+    return _paginate(log.read_recent, log.count_at, lambda: list(_queued), max(1, int(limit)), before, after)
+
+
+def list_all_flat(
+    limit: int = 10000,
+    *,
+    before_ts: Optional[int] = None,
+    after_ts: Optional[int] = None,
+) -> List[ChatMessage]:
+    """page_all() with strict second bounds (older callers)."""
+    before, after = pos_from_ts(before_ts, after_ts)
+    return page_all(limit, before=before, after=after).messages
 
 
 def stats() -> dict:
+    log = _get_log()
+    sessions, total = log.counts()
     with _lock:
-        total = sum(len(v) for v in _index.values())
-        return {
-            "path": STORE_PATH,
-            "sessions": len(_index),
-            "messages": total,
-        }
+        pending = sum(len(v) for v in _pending.values())
+    return {
+        "path": STORE_PATH if not log.shared else None,
+        "sessions": sessions,
+        "messages": total + pending,
+        "pending": pending,
+        "backend": log.stats(),
+        "hot": _hot.stats(),
+        "writer": _writer.stats(),
+    }
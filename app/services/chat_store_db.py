@@ -0,0 +1,223 @@
+# app/services/chat_store_db.py
+"""
+Database backend for chat_store: `conversations` + `messages` ORM tables.
+
+Same surface as chat_log.SegmentedChatLog, so chat_store can swap it in with
+ACE_CHAT_STORE_BACKEND=db and several app nodes share one history.
+
+Writes arrive in batches from chat_store's background writer:
+  - org slug -> organization id and (org_id, sid) -> conversation id are cached
+  - missing conversations are created with one INSERT .. ON CONFLICT DO NOTHING
+  - messages go in as one multi-row INSERT per batch
+Reads use a keyset on ts_epoch (no OFFSET): ix_messages_conv_ts per
+conversation, ix_messages_ts_id across all of them.
+"""
+from __future__ import annotations
+
+import logging
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import bindparam, func, insert, select, tuple_, update
+
+from app.core.cache import TTLCache
+from app.core.db import dialect_insert, engine as default_engine
+from app.models.orm import Conversation, Message, Organization
+
+logger = logging.getLogger("ace.chat_store_db")
+
+# (org slug or None, message dict)
+Item = Tuple[Optional[str], Dict[str, Any]]
+
+
+def _as_msg(sid: str, role: str, text: str, ts: int) -> Dict[str, Any]:
+    return {"sid": sid, "role": role, "text": text, "timestamp": int(ts)}
+
+
+class DBChatLog:
+    shared = True  # other nodes write too -> do not trust a local hot cache
+
+    def __init__(self, *, default_org: Optional[str] = None, engine=None, cache_size: int = 50000):
+        self.engine = engine or default_engine
+        self.default_org = default_org or None
+        self._org_ids = TTLCache(maxsize=1024, ttl=300)
+        self._conv_ids = TTLCache(maxsize=cache_size)
+        self.dropped = 0
+
+    # ------------------------------------------------------------- lookups --
+    def _org_id(self, conn, slug: Optional[str]) -> Optional[int]:
+        slug = slug or self.default_org
+        if not slug:
+            return None
+        org_id = self._org_ids.get(slug)
+        if org_id is None:
+            org_id = conn.execute(
+                select(Organization.id).where(Organization.slug == slug)
+            ).scalar_one_or_none()
+            if org_id is not None:
+                self._org_ids.set(slug, org_id)
+        return org_id
+
+    def _conversation_ids(self, conn, keys: Sequence[Tuple[int, str]]) -> Dict[Tuple[int, str], int]:
+        out: Dict[Tuple[int, str], int] = {}
+        missing: List[Tuple[int, str]] = []
+        for k in keys:
+            cid = self._conv_ids.get(k)
+            if cid is None:
+                missing.append(k)
+            else:
+                out[k] = cid
+        if not missing:
+            return out
+
+        def _fetch(wanted: List[Tuple[int, str]]) -> None:
+            rows = conn.execute(
+                select(Conversation.id, Conversation.organization_id, Conversation.sid).where(
+                    tuple_(Conversation.organization_id, Conversation.sid).in_(wanted)
+                )
+            ).all()
+            for cid, org_id, sid in rows:
+                out[(org_id, sid)] = cid
+                self._conv_ids.set((org_id, sid), cid)
+
+        _fetch(missing)
+        new = [k for k in missing if k not in out]
+        if new:
+            now = datetime.utcnow()
+            stmt = dialect_insert(Conversation.__table__, conn).values(
+                [{"organization_id": o, "sid": s, "started_at": now} for o, s in new]
+            ).on_conflict_do_nothing(index_elements=["organization_id", "sid"])
+            conn.execute(stmt)
+            _fetch(new)
+        return out
+
+    # --------------------------------------------------------------- write --
+    def append_messages(self, items: Iterable[Item], *, fsync: bool = False) -> None:
+        """One transaction per batch: conversations (if new) + multi-row message insert."""
+        items = list(items)
+        if not items:
+            return
+        with self.engine.begin() as conn:
+            resolved: List[Tuple[Tuple[int, str], Dict[str, Any]]] = []
+            for org, msg in items:
+                org_id = self._org_id(conn, org)
+                if org_id is None:
+                    self.dropped += 1
+                    logger.error("chat_store_db: no organization for sid=%s org=%s (message dropped)", msg["sid"], org)
+                    continue
+                resolved.append(((org_id, msg["sid"]), msg))
+            if not resolved:
+                return
+
+            conv_ids = self._conversation_ids(conn, list(dict.fromkeys(k for k, _ in resolved)))
+            now = datetime.utcnow()
+            rows = [
+                {
+                    "conversation_id": conv_ids[k],
+                    "role": m["role"],
+                    "text": m["text"],
+                    "ts_epoch": m["timestamp"],
+                    "created_at": now,
+                }
+                for k, m in resolved
+            ]
+            conn.execute(insert(Message), rows)
+
+            last: Dict[int, int] = {}
+            for r in rows:
+                last[r["conversation_id"]] = max(last.get(r["conversation_id"], 0), r["ts_epoch"])
+            conn.execute(
+                update(Conversation.__table__)
+                .where(Conversation.__table__.c.id == bindparam("cid"))
+                .values(last_message_at=bindparam("last_at")),
+                [{"cid": cid, "last_at": datetime.utcfromtimestamp(ts)} for cid, ts in last.items()],
+            )
+
+    # ---------------------------------------------------------------- read --
+    def read_sid(self, sid: str) -> List[Dict[str, Any]]:
+        return self.read_sid_page(sid, limit=None)
+
+    def read_sid_page(
+        self,
+        sid: str,
+        *,
+        after_ts: Optional[int] = None,
+        before_ts: Optional[int] = None,
+        limit: Optional[int] = 200,
+    ) -> List[Dict[str, Any]]:
+        """
+        Messages of `sid` (all orgs) oldest-first, keyset-paginated on ts_epoch.
+        With `before_ts` the page is the newest `limit` messages older than it.
+        """
+        stmt = (
+            select(Conversation.sid, Message.role, Message.text, Message.ts_epoch)
+            .join(Conversation, Conversation.id == Message.conversation_id)
+            .where(Conversation.sid == sid)
+        )
+        if after_ts is not None:
+            stmt = stmt.where(Message.ts_epoch > after_ts)
+        if before_ts is not None:
+            stmt = stmt.where(Message.ts_epoch < before_ts)
+        newest_first = before_ts is not None and after_ts is None
+        if newest_first:
+            stmt = stmt.order_by(Message.ts_epoch.desc(), Message.id.desc())
+        else:
+            stmt = stmt.order_by(Message.ts_epoch, Message.id)
+        if limit is not None:
+            stmt = stmt.limit(int(limit))
+        with self.engine.connect() as conn:
+            rows = conn.execute(stmt).all()
+        out = [_as_msg(*r) for r in rows]
+        if newest_first:
+            out.reverse()
+        return out
+
+    def read_recent(
+        self, limit: int, *, before_ts: Optional[int] = None, after_ts: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """Same contract as SegmentedChatLog.read_recent (keyset on ts_epoch)."""
+        stmt = (
+            select(Conversation.sid, Message.role, Message.text, Message.ts_epoch)
+            .join(Conversation, Conversation.id == Message.conversation_id)
+        )
+        if before_ts is not None:
+            stmt = stmt.where(Message.ts_epoch < before_ts)
+        if after_ts is not None:
+            stmt = stmt.where(Message.ts_epoch > after_ts)
+            stmt = stmt.order_by(Message.ts_epoch, Message.id)
+        else:
+            stmt = stmt.order_by(Message.ts_epoch.desc(), Message.id.desc())
+        with self.engine.connect() as conn:
+            rows = conn.execute(stmt.limit(int(limit))).all()
+        out = [_as_msg(*r) for r in rows]
+        if after_ts is None:
+            out.reverse()
+        return out
+
+    def count_at(self, ts: int, *, sid: Optional[str] = None) -> int:
+        """Messages stamped with second `ts` (of one sid, if given)."""
+        stmt = select(func.count(Message.id)).where(Message.ts_epoch == int(ts))
+        if sid is not None:
+            stmt = stmt.join(Conversation, Conversation.id == Message.conversation_id).where(Conversation.sid == sid)
+        with self.engine.connect() as conn:
+            return int(conn.execute(stmt).scalar() or 0)
+
+    def sids(self) -> List[str]:
+        stmt = select(Conversation.sid).distinct()
+        with self.engine.connect() as conn:
+            return [r[0] for r in conn.execute(stmt)]
+
+    def counts(self) -> Tuple[int, int]:
+        with self.engine.connect() as conn:
+            sessions = conn.execute(select(func.count(func.distinct(Conversation.sid)))).scalar() or 0
+            messages = conn.execute(select(func.count(Message.id))).scalar() or 0
+        return int(sessions), int(messages)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": "db",
+            "dialect": self.engine.dialect.name,
+            "default_org": self.default_org,
+            "conversation_cache": self._conv_ids.stats(),
+            "dropped": self.dropped,
+        }
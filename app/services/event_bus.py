@@ -1,57 +1,311 @@
 from __future__ import annotations
 
 import asyncio
+import heapq
 import logging
+import os
 import time
 from collections import deque
-from typing import Any, Deque, Dict, List, Set, Tuple
+from typing import Any, Callable, Deque, Dict, Iterable, List, Optional, Set, Tuple
+
+from app.services import event_transport
 
 logger = logging.getLogger("ace.event_bus")
 
 # Live subscribers for SSE (topic = sid or "*")
-_subscribers: Dict[str, Set[asyncio.Queue]] = {}
+_subscribers: Dict[str, Set["Subscription"]] = {}
 _lock = asyncio.Lock()
 
 # -------- Event history (for long-polling) -----------------------------------
-# Per-topic ring buffer of recent events: (seq, event_dict)
-_hist: Dict[str, Deque[Tuple[int, dict]]] = {}
-_seq: Dict[str, int] = {}
-_notify = asyncio.Event()  # global notifier to wake long-pollers
+# Per-topic ring buffer of recent events (see _Ring)
+_hist: Dict[str, "_Ring"] = {}
+_seq: Dict[str, int] = {}  # last seq applied per topic (assigned by the transport)
+# Long-pollers parked per topic; a publish wakes only the waiters of the
+# topics it touched (each future is resolved once, then re-armed by its poller)
+_waiters: Dict[str, Set[asyncio.Future]] = {}
 
 HIST_MAX = 500  # keep the last N events per topic
 
+# SSE subscriber buffers
+#   ACE_SSE_QUEUE_MAX  events buffered per subscriber (default 1024)
+#   ACE_SSE_POLICY     what to do when it is full (see Subscription), default disconnect
+POLICIES = ("drop_oldest", "coalesce", "disconnect")
+SUB_MAXSIZE = int(os.getenv("ACE_SSE_QUEUE_MAX", "1024"))
+SUB_POLICY = os.getenv("ACE_SSE_POLICY", "disconnect").strip().lower()
+
+# Service topics (not visitor sids) start with INTERNAL_PREFIX. Visitor-facing
+# publishes (broadcast=True) to such a name are refused, so a chat sid cannot
+# feed an internal stream such as lead_service.KPI_TOPIC.
+INTERNAL_PREFIX = "_"
+
+# In-process callbacks per topic, run for every event applied to it -- on
+# every worker, so services can use an internal topic to keep their caches in
+# sync (see survey_cache). Callbacks run on the event loop and must be quick.
+_listeners: Dict[str, List[Callable[[dict], None]]] = {}
+
+# Carries events between workers and assigns seqs (see event_transport)
+_transport = event_transport.create_transport()
+_transport_loop: Optional[asyncio.AbstractEventLoop] = None
+
 
 def _now() -> float:
     return time.time()
 
 
-def _next_seq(topic: str) -> int:
-    _seq[topic] = _seq.get(topic, 0) + 1
-    return _seq[topic]
+class _Ring:
+    """
+    Fixed-capacity history of one topic; the oldest event is overwritten
+    first. Seqs are increasing, so a `since` cursor is a binary search and a
+    read is one or two list slices of the stored dicts (no per-event copies).
+    The lists grow with the first `cap` events, so the many topics that only
+    ever see a few (one per visitor sid) stay small.
+    """
+
+    __slots__ = ("cap", "seqs", "evts", "start", "size")
+
+    def __init__(self, cap: int):
+        self.cap = max(1, cap)
+        self.seqs: List[int] = []
+        self.evts: List[dict] = []
+        self.start = 0  # slot of the oldest event (0 until the ring is full)
+        self.size = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    @property
+    def first_seq(self) -> Optional[int]:
+        return self.seqs[self.start] if self.size else None
+
+    def append(self, seq: int, evt: dict) -> None:
+        if self.size < self.cap:
+            self.seqs.append(seq)
+            self.evts.append(evt)
+            self.size += 1
+            return
+        i = self.start
+        self.start = (self.start + 1) % self.cap
+        self.seqs[i] = seq
+        self.evts[i] = evt
+
+    def _first_after(self, since: int) -> int:
+        """Logical position (0 = oldest) of the first event with seq > since."""
+        lo, hi = 0, self.size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.seqs[(self.start + mid) % self.cap] > since:
+                hi = mid
+            else:
+                lo = mid + 1
+        return lo
+
+    def since(self, since: int, limit: Optional[int] = None) -> List[dict]:
+        """Events with seq > since, oldest first; the newest `limit` if more."""
+        pos = self._first_after(since)
+        if limit is not None and self.size - pos > limit:
+            pos = self.size - limit
+        if pos >= self.size:
+            return []
+        i = (self.start + pos) % self.cap
+        j = (self.start + self.size) % self.cap  # exclusive end
+        if i < j:
+            return self.evts[i:j]
+        return self.evts[i:] + self.evts[:j]
+
+
+def _wake(topic: str) -> None:
+    for fut in _waiters.pop(topic, ()):
+        if not fut.done():
+            fut.set_result(None)
+
+
+def seq_of(topic: str, evt: dict) -> Optional[int]:
+    """
+    `evt`'s seq in `topic`'s numbering, or None. A sid subscriber also gets
+    publish_all events, which are numbered in the "*" topic.
+    """
+    if topic == "*" or evt.get("sid") == topic:
+        return evt.get("_seq")
+    return None
+
+
+class SubscriberLagged(Exception):
+    """Raised by Subscription.get() after a "disconnect" overflow."""
+
+    def __init__(self, topic: str, last_seq: int):
+        super().__init__(f"subscriber on {topic} fell behind after seq {last_seq}")
+        self.topic = topic
+        self.last_seq = last_seq
+
 
+class Subscription:
+    """
+    One SSE consumer's bounded buffer. When it is full, the policy decides:
+      drop_oldest  discard the oldest buffered event
+      coalesce     drop a buffered event of the same type and sid (the newest
+                   one is appended), else discard the oldest
+      disconnect   end the subscription: get() raises SubscriberLagged with
+                   the last delivered seq, the client resumes from history
+    """
+
+    def __init__(self, topic: str, *, policy: str = SUB_POLICY, maxsize: int = SUB_MAXSIZE):
+        if policy not in POLICIES:
+            logger.warning("event_bus: unknown SSE policy %r, using disconnect", policy)
+            policy = "disconnect"
+        self.topic = topic
+        self.policy = policy
+        self.maxsize = max(1, maxsize)
+        self.buf: Deque[dict] = deque()
+        self._ready = asyncio.Event()
+        self.lagged = False
+        self.last_seq = 0  # last own-topic seq handed to the consumer
+        self.enqueued = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.max_depth = 0
+        self.since = time.time()
+
+    def _coalesce(self, evt: dict) -> bool:
+        key = (evt.get("type"), evt.get("sid"))
+        for i in range(len(self.buf) - 1, -1, -1):
+            old = self.buf[i]
+            if (old.get("type"), old.get("sid")) == key:
+                del self.buf[i]
+                self.coalesced += 1
+                return True
+        return False
+
+    def offer(self, evt: dict) -> bool:
+        """Called by the bus for each event; never blocks."""
+        if self.lagged:
+            return False
+        if len(self.buf) >= self.maxsize:
+            if self.policy == "disconnect":
+                self.lagged = True
+                self.dropped += len(self.buf) + 1
+                self.buf.clear()
+                self._ready.set()
+                logger.warning(
+                    "event_bus: slow subscriber topic=%s disconnected at seq=%d", self.topic, self.last_seq
+                )
+                return False
+            if not (self.policy == "coalesce" and self._coalesce(evt)):
+                self.buf.popleft()
+                self.dropped += 1
+        self.buf.append(evt)
+        self.enqueued += 1
+        if len(self.buf) > self.max_depth:
+            self.max_depth = len(self.buf)
+        self._ready.set()
+        return True
+
+    async def get(self) -> dict:
+        while not self.buf:
+            if self.lagged:
+                raise SubscriberLagged(self.topic, self.last_seq)
+            self._ready.clear()
+            await self._ready.wait()
+        evt = self.buf.popleft()
+        self.delivered += 1
+        seq = seq_of(self.topic, evt)
+        if seq is not None:
+            self.last_seq = seq
+        return evt
+
+    def qsize(self) -> int:
+        return len(self.buf)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "topic": self.topic,
+            "policy": self.policy,
+            "depth": len(self.buf),
+            "max_depth": self.max_depth,
+            "lag_seq": max(0, _seq.get(self.topic, 0) - self.last_seq) if self.last_seq else None,
+            "enqueued": self.enqueued,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+            "lagged": self.lagged,
+            "age_secs": round(time.time() - self.since, 1),
+        }
+
+
+def _fan_out(targets: Iterable[Subscription], evt: dict) -> int:
+    sent = 0
+    for sub in list(targets):
+        try:
+            if sub.offer(evt):
+                sent += 1
+        except Exception:
+            logger.exception("event_bus: publish error sid=%s event=%s", evt.get("sid"), evt.get("type"))
+    return sent
 
-def _push_history(topic: str, evt: dict) -> int:
-    seq = _next_seq(topic)
-    dq = _hist.setdefault(topic, deque(maxlen=HIST_MAX))
-    dq.append((seq, evt))
-    return seq
+
+def _apply(records: List[event_transport.Record]) -> List[int]:
+    """
+    Transport callback: record each event in its topic's history, wake the
+    topic's long-pollers and feed its SSE queues (every queue for fan_all).
+    """
+    counts: List[int] = []
+    for topic, seq, evt, fan_all in records:
+        stored = {**evt, "_seq": seq}
+        ring = _hist.get(topic)
+        if ring is None:
+            ring = _hist[topic] = _Ring(HIST_MAX)
+        ring.append(seq, stored)
+        _seq[topic] = seq
+        _wake(topic)
+        if fan_all:
+            targets: Iterable[Subscription] = [q for qs in _subscribers.values() for q in qs]
+        else:
+            targets = _subscribers.get(topic, ())
+        counts.append(_fan_out(targets, stored))
+        for fn in _listeners.get(topic, ()):
+            try:
+                fn(stored)
+            except Exception:
+                logger.exception("event_bus: listener failed topic=%s event=%s", topic, evt.get("type"))
+    return counts
+
+
+def listen(topic: str, fn: Callable[[dict], None]) -> None:
+    """Call fn(event) for every event of `topic` this worker applies (its own included)."""
+    _listeners.setdefault(topic, []).append(fn)
+
+
+async def start() -> None:
+    """Attach the transport to the running loop (app startup; also done lazily)."""
+    global _transport_loop
+    loop = asyncio.get_running_loop()
+    if _transport_loop is not loop:
+        _transport_loop = loop
+        await _transport.start(_apply)
+
+
+async def close() -> None:
+    global _transport_loop
+    await _transport.close()
+    _transport_loop = None
 
 
 # ----------------------------- Live subscribe API ----------------------------
 
-async def subscribe(topic: str) -> asyncio.Queue:
+async def subscribe(topic: str, *, policy: Optional[str] = None, maxsize: Optional[int] = None) -> Subscription:
     """
     Subscribe to a topic (sid or "*") for SSE.
-    Returns an asyncio.Queue where events will be delivered.
+    Returns a Subscription; `await q.get()` yields the events (each with `_seq`).
     """
-    q: asyncio.Queue = asyncio.Queue(maxsize=1024)
+    await start()
+    q = Subscription(topic, policy=policy or SUB_POLICY, maxsize=maxsize or SUB_MAXSIZE)
     async with _lock:
         _subscribers.setdefault(topic, set()).add(q)
         logger.info("event_bus: subscribe topic=%s subs=%d", topic, len(_subscribers[topic]))
     return q
 
 
-async def unsubscribe(topic: str, q: asyncio.Queue) -> None:
+async def unsubscribe(topic: str, q: Subscription) -> None:
     try:
         async with _lock:
             if topic in _subscribers and q in _subscribers[topic]:
@@ -65,76 +319,62 @@ async def unsubscribe(topic: str, q: asyncio.Queue) -> None:
 
 # ------------------------------ Publish API ----------------------------------
 
-async def publish(sid: str, event_name: str, payload: Any) -> int:
+async def publish(sid: str, event_name: str, payload: Any, *, broadcast: bool = True) -> int:
     """
     Publish to sid-specific topic and to "*" topic.
     - Feeds SSE queues.
     - Stores in history for long-polling.
+    broadcast=False keeps the event out of "*" (internal topics such as "_kpis").
+    With a cross-process transport every worker's bus gets the event; the
+    returned count is this worker's subscribers.
     """
+    if broadcast and str(sid).startswith(INTERNAL_PREFIX):
+        logger.warning("event_bus: refused publish to internal topic sid=%s event=%s", sid, event_name)
+        return 0
     evt = {"type": event_name, "sid": sid, "ts": _now(), "payload": payload}
+    await start()
+    items = [(sid, evt, False), ("*", evt, False)] if broadcast else [(sid, evt, False)]
+    sent = await _transport.send(items)
+    if sent:
+        logger.info("event_bus: publish sid=%s event=%s targets=%d", sid, event_name, sent)
+    return sent
 
-    # History first (sid + broadcast)
-    _push_history(sid, evt)
-    _push_history("*", {**evt, "sid": sid})
 
-    # Wake long-pollers
-    _notify.set()
-    _notify.clear()
+def publish_threadsafe(sid: str, event_name: str, payload: Any, *, broadcast: bool = True) -> bool:
+    """
+    Fire-and-forget publish() from sync code (e.g. endpoints running in the
+    threadpool). Returns False when the bus is not attached to a loop yet,
+    i.e. no other worker can be listening through it.
+    """
+    loop = _transport_loop
+    if loop is None or loop.is_closed():
+        return False
+    fut = asyncio.run_coroutine_threadsafe(publish(sid, event_name, payload, broadcast=broadcast), loop)
 
-    # Fan-out to live subscribers
-    targets: Set[asyncio.Queue] = set()
-    async with _lock:
-        for topic in (sid, "*"):
-            targets.update(_subscribers.get(topic, set()))
+    def _done(f) -> None:
+        if not f.cancelled() and f.exception() is not None:
+            logger.error("event_bus: publish failed sid=%s event=%s: %r", sid, event_name, f.exception())
 
-    sent = 0
-    if targets:
-        logger.info("event_bus: publish sid=%s event=%s targets=%d", sid, event_name, len(targets))
-    for q in list(targets):
-        try:
-            q.put_nowait(evt)
-            sent += 1
-        except asyncio.QueueFull:
-            logger.warning("event_bus: queue full sid=%s event=%s (drop)", sid, event_name)
-        except Exception:
-            logger.exception("event_bus: publish error sid=%s event=%s", sid, event_name)
-    return sent
+    fut.add_done_callback(_done)
+    return True
 
 
 async def publish_all(event_name: str, payload: Any) -> int:
     evt = {"type": event_name, "sid": "*", "ts": _now(), "payload": payload}
-    _push_history("*", evt)  # only broadcast topic gets it
-    _notify.set()
-    _notify.clear()
-
-    targets: Set[asyncio.Queue] = set()
-    async with _lock:
-        for qs in _subscribers.values():
-            targets.update(qs)
-
-    sent = 0
-    if targets:
-        logger.info("event_bus: publish_all event=%s targets=%d", event_name, len(targets))
-    for q in list(targets):
-        try:
-            q.put_nowait(evt)
-            sent += 1
-        except asyncio.QueueFull:
-            logger.warning("event_bus: publish_all queue full event=%s (drop)", event_name)
-        except Exception:
-            logger.exception("event_bus: publish_all error event=%s", event_name)
+    await start()
+    # only the broadcast topic's history gets it, but every subscriber is fed
+    sent = await _transport.send([("*", evt, True)])
+    if sent:
+        logger.info("event_bus: publish_all event=%s targets=%d", event_name, sent)
     return sent
 
 
 # --------------------------- Long-poll helpers --------------------------------
 
-def _collect_since_one(topic: str, since: int) -> List[dict]:
-    """Collect events from a single topic with seq > since, tagging seq & topic."""
-    out: List[dict] = []
-    for seq, evt in _hist.get(topic, ()):
-        if seq > since:
-            out.append({**evt, "_seq": seq, "_topic": topic})
-    return out
+def _collect_since_one(topic: str, since: int, limit: Optional[int] = None) -> List[dict]:
+    """Events from a single topic with seq > since (each carries its `_seq`)."""
+    ring = _hist.get(topic)
+    return ring.since(since, limit) if ring is not None else []
 
 
 def collect_since(
@@ -148,22 +388,37 @@ def collect_since(
     Option B (no duplicates): by default we do NOT merge '*' unless explicitly asked.
     - If sid == "*": read only broadcast topic.
     - Else: read only `sid` topic; include '*' only if include_broadcast=True.
+    The returned dicts are the stored history entries: treat them as read-only.
     """
-    if sid == "*":
-        topics = ["*"]
-    else:
-        topics = [sid] + (["*"] if include_broadcast else [])
-
-    items: List[dict] = []
-    for t in topics:
-        items.extend(_collect_since_one(t, since))
+    if sid == "*" or not include_broadcast:
+        return _collect_since_one(sid, since, limit)
 
-    items.sort(key=lambda e: e["_seq"])
+    runs = [_collect_since_one(t, since, limit) for t in (sid, "*")]
+    items = list(heapq.merge(*runs, key=lambda e: e["_seq"]))
     if len(items) > limit:
         items = items[-limit:]
     return items
 
 
+def last_seq(topic: str) -> int:
+    """Newest seq applied for `topic` on this worker (0 if none)."""
+    return _seq.get(topic, 0)
+
+
+def resume_since(topic: str, last_seq: int, limit: int = HIST_MAX) -> Tuple[List[dict], bool]:
+    """
+    History after `last_seq` for a reconnecting SSE client (Last-Event-ID).
+    The flag is False when the ring no longer reaches back that far, i.e.
+    the client missed events and has to reload.
+    """
+    ring = _hist.get(topic)
+    if ring is None:
+        return [], last_seq >= _seq.get(topic, 0)
+    first = ring.first_seq
+    complete = first is None or last_seq + 1 >= first
+    return ring.since(last_seq, limit), complete
+
+
 async def long_poll(
     sid: str,
     since: int,
@@ -175,21 +430,37 @@ async def long_poll(
     Long-poll: waits up to `timeout` seconds for new events beyond `since`.
     Always returns (possibly empty) list of events.
     """
-    items = collect_since(sid, since, limit=limit, include_broadcast=include_broadcast)
-    if items:
-        return items
-
-    try:
-        await asyncio.wait_for(_notify.wait(), timeout=timeout)
-    except asyncio.TimeoutError:
-        logger.info("event_bus: long_poll timeout sid=%s since=%d", sid, since)
-        return []
-    except Exception:
-        logger.exception("event_bus: long_poll wait error sid=%s", sid)
-        return []
-
-    # After being notified, collect again
-    return collect_since(sid, since, limit=limit, include_broadcast=include_broadcast)
+    await start()
+    topics = ["*"] if sid == "*" else [sid] + (["*"] if include_broadcast else [])
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while True:
+        # no await between this check and parking the future -> no lost wakeups
+        items = collect_since(sid, since, limit=limit, include_broadcast=include_broadcast)
+        if items:
+            return items
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            logger.info("event_bus: long_poll timeout sid=%s since=%d", sid, since)
+            return []
+
+        fut = loop.create_future()
+        for t in topics:
+            _waiters.setdefault(t, set()).add(fut)
+        try:
+            await asyncio.wait_for(fut, timeout=remaining)
+        except asyncio.TimeoutError:
+            pass  # re-check once more, then return empty
+        except Exception:
+            logger.exception("event_bus: long_poll wait error sid=%s", sid)
+            return []
+        finally:
+            for t in topics:
+                ws = _waiters.get(t)
+                if ws is not None:
+                    ws.discard(fut)
+                    if not ws:
+                        _waiters.pop(t, None)
 
 
 # ------------------------------ Introspection --------------------------------
@@ -198,4 +469,16 @@ def stats() -> Dict[str, int]:
     """Current SSE subscriber counts per topic (live)."""
     per = {topic: len(qs) for topic, qs in _subscribers.items()}
     per["__total__"] = sum(per.values())
+    per["__long_polls__"] = len({f for ws in _waiters.values() for f in ws})
     return per
+
+
+def subscriber_stats() -> List[Dict[str, Any]]:
+    """Per-subscriber buffer depth, lag and drop counters (slowest first)."""
+    subs = [q.stats() for qs in _subscribers.values() for q in qs]
+    subs.sort(key=lambda st: (st["depth"], st["dropped"]), reverse=True)
+    return subs
+
+
+def transport_stats() -> Dict[str, object]:
+    return _transport.stats()
@@ -0,0 +1,257 @@
+# app/services/event_transport.py
+"""
+Transports for app.services.event_bus.
+
+Each worker's bus keeps its own history rings, long-poll waiters and SSE
+queues. A transport decides which events reach every worker's bus and
+assigns the per-topic seq numbers, so seqs are the same on all workers and a
+client may poll worker A, then worker B, with the same `since` cursor.
+
+  local   in-process only (single worker; default)
+  sqlite  shared SQLite file as a fan-out log. A publish appends its rows and
+          takes the next per-topic seqs in one write transaction (so rowid
+          order == seq order per topic); every worker tails the log by rowid
+          and applies rows in order. No external services needed; all
+          workers must share the file (one box / one volume).
+
+A Redis/NATS transport would implement the same start/send/close methods.
+
+Env:
+  ACE_EVENT_BUS_TRANSPORT   local (default) | sqlite
+  ACE_EVENT_BUS_PATH        sqlite file (default data/event_bus.sqlite)
+  ACE_EVENT_BUS_POLL_MS     how often other workers' events are picked up (default 50)
+  ACE_EVENT_BUS_RETAIN      rows kept in the shared log (default 50000)
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger("ace.event_transport")
+
+TRANSPORT = os.getenv("ACE_EVENT_BUS_TRANSPORT", "local").strip().lower()
+BUS_PATH = os.getenv("ACE_EVENT_BUS_PATH", os.path.join(os.getcwd(), "data", "event_bus.sqlite"))
+POLL_INTERVAL = float(os.getenv("ACE_EVENT_BUS_POLL_MS", "50")) / 1000.0
+RETAIN = int(os.getenv("ACE_EVENT_BUS_RETAIN", "50000"))
+
+# (topic, event, fan out to every subscriber)
+Outgoing = Tuple[str, dict, bool]
+# (topic, seq, event, fan out to every subscriber)
+Record = Tuple[str, int, dict, bool]
+# applies records to the local bus, returns the number of local queues fed per record
+Deliver = Callable[[List[Record]], List[int]]
+
+
+class EventTransport:
+    name = "base"
+
+    async def start(self, deliver: Deliver) -> None:
+        """(Re)attach to the running loop; called once per event loop."""
+        raise NotImplementedError
+
+    async def send(self, items: List[Outgoing]) -> int:
+        """Publish; returns how many local subscriber queues got the events."""
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        pass
+
+    def stats(self) -> Dict[str, object]:
+        return {"transport": self.name}
+
+
+class LocalTransport(EventTransport):
+    """Single process: seqs from a dict, delivered synchronously."""
+
+    name = "local"
+
+    def __init__(self):
+        self._seq: Dict[str, int] = {}
+        self._deliver: Optional[Deliver] = None
+
+    async def start(self, deliver: Deliver) -> None:
+        self._deliver = deliver
+
+    async def send(self, items: List[Outgoing]) -> int:
+        records: List[Record] = []
+        for topic, evt, fan_all in items:
+            seq = self._seq.get(topic, 0) + 1
+            self._seq[topic] = seq
+            records.append((topic, seq, evt, fan_all))
+        return sum(self._deliver(records)) if self._deliver else 0
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS topic_seq (
+    topic TEXT PRIMARY KEY,
+    seq INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    topic TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    fan_all INTEGER NOT NULL DEFAULT 0,
+    body TEXT NOT NULL
+);
+"""
+
+READ_BATCH = 1000
+TRIM_EVERY = 1000  # trim the shared log every N rows written
+WARM_ROWS = 5000   # rows replayed into the history rings on start
+
+
+class SQLiteTransport(EventTransport):
+    name = "sqlite"
+
+    def __init__(self, path: str, *, poll_interval: float = POLL_INTERVAL, retain: int = RETAIN):
+        self.path = path
+        self.poll_interval = max(0.005, poll_interval)
+        self.retain = max(READ_BATCH, retain)
+        self._tls = threading.local()
+        self._deliver: Optional[Deliver] = None
+        self._last_id: Optional[int] = None
+        self._drain_lock = asyncio.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+        self.sent = 0
+        self.received = 0
+        d = os.path.dirname(path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        conn = self._conn()
+        conn.executescript(_SCHEMA)
+
+    # ----------------------------------------------------------- sqlite side --
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._tls, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._tls.conn = conn
+        return conn
+
+    def _write(self, items: List[Outgoing]) -> List[int]:
+        conn = self._conn()
+        ids: List[int] = []
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for topic, evt, fan_all in items:
+                conn.execute(
+                    "INSERT INTO topic_seq (topic, seq) VALUES (?, 1) "
+                    "ON CONFLICT(topic) DO UPDATE SET seq = seq + 1",
+                    (topic,),
+                )
+                seq = conn.execute("SELECT seq FROM topic_seq WHERE topic=?", (topic,)).fetchone()[0]
+                cur = conn.execute(
+                    "INSERT INTO events (topic, seq, fan_all, body) VALUES (?, ?, ?, ?)",
+                    (topic, seq, int(fan_all), json.dumps(evt, ensure_ascii=False, default=str)),
+                )
+                ids.append(int(cur.lastrowid))
+            if ids and ids[-1] // TRIM_EVERY != (ids[0] - 1) // TRIM_EVERY:
+                conn.execute("DELETE FROM events WHERE id <= ?", (ids[-1] - self.retain,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return ids
+
+    def _read(self, after_id: int, limit: int) -> List[Tuple[int, str, int, int, str]]:
+        return self._conn().execute(
+            "SELECT id, topic, seq, fan_all, body FROM events WHERE id > ? ORDER BY id LIMIT ?",
+            (after_id, limit),
+        ).fetchall()
+
+    def _warm_start_id(self) -> int:
+        lo, hi = self._conn().execute("SELECT COALESCE(MIN(id), 1), COALESCE(MAX(id), 0) FROM events").fetchone()
+        return max(int(lo) - 1, int(hi) - WARM_ROWS)
+
+    # ------------------------------------------------------------ async side --
+    async def start(self, deliver: Deliver) -> None:
+        self._deliver = deliver
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._drain_lock = asyncio.Lock()
+        if self._last_id is None:
+            # replay recent rows into the (empty) history rings, then follow the tail
+            self._last_id = await asyncio.to_thread(self._warm_start_id)
+            await self._drain()
+        if self._task is None or self._task.done() or self._task.get_loop() is not loop:
+            self._task = asyncio.create_task(self._tail(), name="event-bus-tail")
+
+    async def _tail(self) -> None:
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self._drain()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("event_transport: tail read failed path=%s", self.path)
+
+    async def _drain(self) -> Dict[int, int]:
+        """Apply every row after _last_id in rowid order; returns id -> local fan-out."""
+        counts: Dict[int, int] = {}
+        async with self._drain_lock:
+            while True:
+                rows = await asyncio.to_thread(self._read, self._last_id or 0, READ_BATCH)
+                if not rows:
+                    break
+                if self._last_id and rows[0][0] > self._last_id + 1:
+                    logger.warning(
+                        "event_transport: fell behind the shared log, skipped ids %d..%d",
+                        self._last_id + 1, rows[0][0] - 1,
+                    )
+                records: List[Record] = [
+                    (topic, seq, json.loads(body), bool(fan_all)) for _, topic, seq, fan_all, body in rows
+                ]
+                fed = self._deliver(records) if self._deliver else [0] * len(records)
+                counts.update((row[0], n) for row, n in zip(rows, fed))
+                self._last_id = rows[-1][0]
+                self.received += len(rows)
+                if len(rows) < READ_BATCH:
+                    break
+        return counts
+
+    async def send(self, items: List[Outgoing]) -> int:
+        ids = await asyncio.to_thread(self._write, items)
+        self.sent += len(ids)
+        # apply right away (with anything other workers wrote before us) instead
+        # of waiting for the next tail tick
+        counts = await self._drain()
+        return sum(counts.get(i, 0) for i in ids)
+
+    async def close(self) -> None:
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+        self._task = None
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "transport": self.name,
+            "path": self.path,
+            "last_id": self._last_id,
+            "sent": self.sent,
+            "received": self.received,
+        }
+
+
+def create_transport() -> EventTransport:
+    if TRANSPORT == "sqlite":
+        try:
+            t = SQLiteTransport(BUS_PATH)
+            logger.info("event_transport: sqlite path=%s poll=%.0fms", BUS_PATH, POLL_INTERVAL * 1000)
+            return t
+        except Exception:
+            logger.exception("event_transport: sqlite unavailable, falling back to local")
+    return LocalTransport()
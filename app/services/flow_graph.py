@@ -0,0 +1,161 @@
+# app/services/flow_graph.py
+"""
+Compiled (indexed) view of a conversation / survey flow.
+
+A raw flow is `{"nodes": [ {...}, ... ]}`; looking a node up means scanning the
+list. `CompiledFlow` builds, once per flow version:
+  - an id -> node index
+  - per-node choice maps keyed by title and by (string) payload
+  - resolved next-pointers (node.next and choice.next -> node dict)
+so every step of the flow engine is a constant-time dict lookup.
+"""
+from __future__ import annotations
+
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional
+
+logger = logging.getLogger("ace.flow_graph")
+
+# How many compiled flows (global + per-survey versions) to keep around
+CACHE_MAX = 256
+
+
+class CompiledFlow:
+    """Read-only index over a flow dict. The original node dicts are shared, not copied."""
+
+    __slots__ = ("version", "nodes", "_next", "_choice_by_key", "_choice_by_title", "_choice_next")
+
+    def __init__(self, flow: Dict[str, Any] | None, version: Hashable = None):
+        self.version = version
+        self.nodes: Dict[str, Dict[str, Any]] = {}
+        self._next: Dict[str, Optional[Dict[str, Any]]] = {}
+        # title/payload -> first matching choice (same precedence as the old linear scan)
+        self._choice_by_key: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        # title -> first matching choice (survey scoring only matches on title)
+        self._choice_by_title: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        # id(choice) -> resolved next node
+        self._choice_next: Dict[int, Optional[Dict[str, Any]]] = {}
+
+        raw_nodes = (flow or {}).get("nodes") or []
+        if isinstance(raw_nodes, dict):
+            # tolerate {"id": {...}} shaped flows
+            raw_nodes = [dict(n, id=n.get("id", k)) for k, n in raw_nodes.items() if isinstance(n, dict)]
+
+        for n in raw_nodes:
+            if not isinstance(n, dict):
+                continue
+            nid = n.get("id")
+            if nid is None or nid in self.nodes:
+                # first node wins, like next(...) did
+                continue
+            self.nodes[nid] = n
+
+        for nid, n in self.nodes.items():
+            nxt = n.get("next")
+            self._next[nid] = self.nodes.get(nxt) if nxt else None
+
+            choices = n.get("choices")
+            if not isinstance(choices, list):
+                continue
+            by_key: Dict[str, Dict[str, Any]] = {}
+            by_title: Dict[str, Dict[str, Any]] = {}
+            for c in choices:
+                if not isinstance(c, dict):
+                    continue
+                title = c.get("title")
+                payload = c.get("payload")
+                if isinstance(title, str):
+                    by_key.setdefault(title, c)
+                    by_title.setdefault(title, c)
+                if isinstance(payload, str):
+                    by_key.setdefault(payload, c)
+                cnext = c.get("next")
+                self._choice_next[id(c)] = self.nodes.get(cnext) if cnext else None
+            self._choice_by_key[nid] = by_key
+            self._choice_by_title[nid] = by_title
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    def node(self, node_id: Optional[str]) -> Optional[Dict[str, Any]]:
+        if not node_id:
+            return None
+        return self.nodes.get(node_id)
+
+    def next_node(self, node_id: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Resolved target of `node.next` (None if unset or dangling)."""
+        if not node_id:
+            return None
+        return self._next.get(node_id)
+
+    def match_choice(self, node_id: Optional[str], msg: Any) -> Optional[Dict[str, Any]]:
+        """First choice on `node_id` whose title or payload equals `msg`."""
+        if not node_id or not isinstance(msg, str):
+            return None
+        return self._choice_by_key.get(node_id, {}).get(msg)
+
+    def choice_next(self, choice: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Resolved target of `choice.next` for a choice returned by match_choice()."""
+        return self._choice_next.get(id(choice))
+
+    def answer_score(self, node_id: Optional[str], answer: Any) -> Optional[int]:
+        """
+        Score contribution of a survey answer for `node_id`, or None if the
+        answer does not map onto the node (unknown node / unmatched choice).
+        """
+        node = self.node(node_id)
+        if not node:
+            return None
+        if isinstance(answer, str) and node.get("choices"):
+            choice = self._choice_by_title.get(node_id, {}).get(answer)
+            if choice is None:
+                return None
+            return choice.get("score", 0)
+        if node.get("openInput"):
+            return node.get("score", 0)
+        return None
+
+
+_cache: "OrderedDict[Hashable, CompiledFlow]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def compile_flow(flow: Dict[str, Any] | None, version: Hashable = None) -> CompiledFlow:
+    """
+    Return the compiled form of `flow`.
+    With a `version` key the result is cached (LRU, CACHE_MAX entries) and
+    reused for every later call with the same key; callers must change the key
+    whenever the flow content changes (e.g. include survey.updated_at).
+    """
+    if version is None:
+        return CompiledFlow(flow)
+
+    with _lock:
+        cf = _cache.get(version)
+        if cf is not None:
+            _cache.move_to_end(version)
+            return cf
+
+    cf = CompiledFlow(flow, version=version)
+    with _lock:
+        _cache[version] = cf
+        _cache.move_to_end(version)
+        while len(_cache) > CACHE_MAX:
+            _cache.popitem(last=False)
+    logger.debug("flow_graph: compiled version=%s nodes=%d", version, len(cf))
+    return cf
+
+
+def invalidate(predicate=None) -> int:
+    """Drop cached compiled flows (all, or those whose key matches `predicate`)."""
+    with _lock:
+        if predicate is None:
+            n = len(_cache)
+            _cache.clear()
+            return n
+        keys: List[Hashable] = [k for k in _cache if predicate(k)]
+        for k in keys:
+            _cache.pop(k, None)
+        return len(keys)
@@ -0,0 +1,355 @@
+# app/services/flow_sessions.py
+"""
+Flow-engine session state (sid -> {"node": ..., "waiting_input": ..., "qual": {...}}).
+
+Two tiers:
+  - local: bounded in-process LRU + idle TTL (app.core.cache.TTLCache)
+  - durable (optional, pluggable): `flow_sessions` table via app.core.db
+
+The store behaves like a dict for the flow engine. State dicts are mutated in
+place by the engine, so callers persist them with `save(sid)` once a request
+is done; unchanged state is not re-written.
+
+With the durable tier enabled, `refresh(sid)` at the start of a request
+re-reads the row (one PK lookup) unless the local copy was validated less than
+REVALIDATE_SECS ago, so state survives restarts and stays consistent across
+uvicorn workers. Within a request all reads are served from the local tier
+(a sid that refresh() found missing is not looked up again for MISS_TTL secs).
+Async handlers use `arefresh()` / `asave()`, which run the DB round-trip in a
+worker thread instead of on the event loop; the state is serialized on the
+caller's side first, so the thread never reads a dict the loop may mutate.
+
+Saves are compare-and-set on `version`: a write only lands if the durable row
+is still at the version this worker last read or wrote. A worker that lost
+the race drops its write and reloads the winner's state.
+
+Env:
+  ACE_FLOW_SESSION_BACKEND        "db" (default) | "memory"
+  ACE_FLOW_SESSION_MAX            max sessions kept in-process (default 10000)
+  ACE_FLOW_SESSION_TTL            idle TTL in seconds (default 7 days)
+  ACE_FLOW_SESSION_REVALIDATE_SECS  trust local copy for N secs (default 0)
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from collections.abc import MutableMapping
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from app.core.cache import TTLCache
+
+logger = logging.getLogger("ace.flow_sessions")
+
+BACKEND = os.getenv("ACE_FLOW_SESSION_BACKEND", "db").strip().lower()
+MAX_SESSIONS = int(os.getenv("ACE_FLOW_SESSION_MAX", "10000"))
+SESSION_TTL = int(os.getenv("ACE_FLOW_SESSION_TTL", str(7 * 24 * 3600)))
+REVALIDATE_SECS = float(os.getenv("ACE_FLOW_SESSION_REVALIDATE_SECS", "0"))
+PURGE_EVERY = 1000  # durable purge of idle rows every N writes
+MISS_TTL = 5.0      # trust "not in the durable tier" for this long after a refresh
+
+
+def _now() -> int:
+    return int(time.time())
+
+
+def _dump(state: Dict[str, Any]) -> str:
+    return json.dumps(state, ensure_ascii=False, sort_keys=True, default=str)
+
+
+# ----------------------------- Durable backends ------------------------------
+
+class FlowSessionBackend:
+    """Durable tier interface."""
+
+    def load(self, sid: str) -> Optional[Tuple[Dict[str, Any], int]]:
+        """Return (state, version) or None."""
+        raise NotImplementedError
+
+    def save(self, sid: str, state: Dict[str, Any], expected: int) -> Optional[int]:
+        """
+        Persist state if the stored version is still `expected` (0 = not
+        stored yet); return the new version, or None if another writer won.
+        """
+        raise NotImplementedError
+
+    def delete(self, sid: str) -> None:
+        raise NotImplementedError
+
+    def purge(self, older_than: int) -> int:
+        """Delete sessions idle since before `older_than` (epoch secs)."""
+        raise NotImplementedError
+
+
+class DBFlowSessionBackend(FlowSessionBackend):
+    """`flow_sessions` table (SQLite dev / Postgres prod) via app.core.db; created by create_all()."""
+
+    def __init__(self):
+        from app.core.db import engine
+        from app.models.orm import FlowSession
+
+        self._engine = engine
+        self._table = FlowSession.__table__
+
+    def load(self, sid: str) -> Optional[Tuple[Dict[str, Any], int]]:
+        from sqlalchemy import select
+
+        t = self._table
+        with self._engine.connect() as conn:
+            row = conn.execute(select(t.c.state, t.c.version).where(t.c.sid == sid)).first()
+        if row is None:
+            return None
+        return dict(row.state or {}), int(row.version or 0)
+
+    def save(self, sid: str, state: Dict[str, Any], expected: int) -> Optional[int]:
+        from app.core.db import dialect_insert
+
+        t = self._table
+        stmt = dialect_insert(t, self._engine).values(sid=sid, state=state, version=1, updated_at=_now())
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[t.c.sid],
+            set_={
+                "state": stmt.excluded.state,
+                "updated_at": stmt.excluded.updated_at,
+                "version": t.c.version + 1,
+            },
+            where=t.c.version == expected,
+        ).returning(t.c.version)
+        with self._engine.begin() as conn:
+            version = conn.execute(stmt).scalar()
+        return int(version) if version is not None else None
+
+    def delete(self, sid: str) -> None:
+        with self._engine.begin() as conn:
+            conn.execute(self._table.delete().where(self._table.c.sid == sid))
+
+    def purge(self, older_than: int) -> int:
+        with self._engine.begin() as conn:
+            res = conn.execute(self._table.delete().where(self._table.c.updated_at < older_than))
+        return res.rowcount or 0
+
+
+# ------------------------------- Tiered store --------------------------------
+
+class _Entry:
+    __slots__ = ("state", "version", "saved", "checked_at")
+
+    def __init__(self, state: Dict[str, Any], version: int, saved: Optional[str], checked_at: float):
+        self.state = state
+        self.version = version
+        self.saved = saved          # JSON of last persisted state (None = never persisted)
+        self.checked_at = checked_at
+
+
+class FlowSessionStore(MutableMapping):
+    def __init__(
+        self,
+        backend: Optional[FlowSessionBackend] = None,
+        *,
+        maxsize: int = MAX_SESSIONS,
+        ttl: Optional[float] = SESSION_TTL,
+        revalidate_secs: float = REVALIDATE_SECS,
+    ):
+        self.backend = backend
+        self.ttl = ttl
+        self.revalidate_secs = revalidate_secs
+        self._local = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._missing = TTLCache(maxsize=maxsize, ttl=MISS_TTL)
+        self._writes = 0
+        self._lock = threading.Lock()
+
+    # -- internals --
+    def _fetch(self, sid: str) -> Optional[_Entry]:
+        """Local hit, else read through to the durable tier."""
+        entry: Optional[_Entry] = self._local.get(sid)
+        if entry is not None or self.backend is None:
+            return entry
+        if sid in self._missing:
+            return None
+        return self._revalidate(sid, None)
+
+    def _revalidate(self, sid: str, entry: Optional[_Entry]) -> Optional[_Entry]:
+        now = time.monotonic()
+        try:
+            row = self.backend.load(sid)
+        except Exception:
+            logger.exception("flow_sessions: durable load failed sid=%s (using local)", sid)
+            return entry
+        if row is None:
+            # never persisted (or purged) -> local copy is all we have
+            if entry is not None:
+                entry.checked_at = now
+            else:
+                self._missing.set(sid, True)
+            return entry
+        self._missing.pop(sid)
+        state, version = row
+        if entry is not None and entry.version == version:
+            entry.checked_at = now
+            self._local.set(sid, entry)  # refresh idle TTL
+            return entry
+        entry = _Entry(state, version, _dump(state), now)
+        self._local.set(sid, entry)
+        return entry
+
+    def _snapshot(self, sid: str) -> Optional[Tuple[_Entry, str]]:
+        """(entry, JSON of its state) if sid has unsaved changes."""
+        entry: Optional[_Entry] = self._local.get(sid)
+        if entry is None or self.backend is None:
+            return None
+        blob = _dump(entry.state)
+        return (entry, blob) if blob != entry.saved else None
+
+    def _persist(self, sid: str, entry: _Entry) -> None:
+        if self.backend is None:
+            return
+        blob = _dump(entry.state)
+        if blob != entry.saved:
+            self._write(sid, entry, blob)
+
+    def _write(self, sid: str, entry: _Entry, blob: str) -> None:
+        """Compare-and-set `blob` (a snapshot of entry.state) at entry.version."""
+        try:
+            version = self.backend.save(sid, json.loads(blob), entry.version)
+        except Exception:
+            logger.exception("flow_sessions: durable save failed sid=%s", sid)
+            return
+        if version is None:
+            logger.warning("flow_sessions: sid=%s changed since version %d, reloading", sid, entry.version)
+            self._local.pop(sid)
+            self._revalidate(sid, None)
+            return
+        entry.version = version
+        entry.saved = blob
+        entry.checked_at = time.monotonic()
+        with self._lock:
+            self._writes += 1
+            purge = self.ttl is not None and self._writes % PURGE_EVERY == 0
+        if purge:
+            try:
+                n = self.backend.purge(_now() - int(self.ttl))
+                if n:
+                    logger.info("flow_sessions: purged %d idle sessions", n)
+            except Exception:
+                logger.exception("flow_sessions: purge failed")
+
+    # -- mapping API used by the flow engine --
+    def __getitem__(self, sid: str) -> Dict[str, Any]:
+        entry = self._fetch(sid)
+        if entry is None:
+            raise KeyError(sid)
+        return entry.state
+
+    def __setitem__(self, sid: str, state: Dict[str, Any]) -> None:
+        old: Optional[_Entry] = self._local.get(sid)
+        entry = _Entry(state, old.version if old else 0, old.saved if old else None, time.monotonic())
+        self._local.set(sid, entry)
+        self._missing.pop(sid)
+        self._persist(sid, entry)
+
+    def __delitem__(self, sid: str) -> None:
+        existed = self._local.pop(sid) is not None
+        if self.backend is not None:
+            try:
+                self.backend.delete(sid)
+                existed = True
+            except Exception:
+                logger.exception("flow_sessions: durable delete failed sid=%s", sid)
+        if not existed:
+            raise KeyError(sid)
+
+    def __contains__(self, sid: object) -> bool:
+        return isinstance(sid, str) and self._fetch(sid) is not None
+
+    def __iter__(self) -> Iterator[str]:
+        """Iterates the in-process tier only."""
+        return iter(self._local.keys())
+
+    def __len__(self) -> int:
+        return len(self._local)
+
+    def get(self, sid: str, default: Any = None) -> Any:
+        entry = self._fetch(sid)
+        return entry.state if entry is not None else default
+
+    def setdefault(self, sid: str, default: Any = None) -> Any:
+        entry = self._fetch(sid)
+        if entry is not None:
+            return entry.state
+        state = default if default is not None else {}
+        entry = _Entry(state, 0, None, time.monotonic())
+        self._local.set(sid, entry)
+        self._missing.pop(sid)
+        return state
+
+    def refresh(self, sid: Optional[str]) -> None:
+        """
+        Re-read sid from the durable tier unless the local copy was validated
+        within `revalidate_secs`. Call once at the start of a request.
+        """
+        if not sid or self.backend is None:
+            return
+        entry: Optional[_Entry] = self._local.get(sid)
+        if entry is not None and time.monotonic() - entry.checked_at < self.revalidate_secs:
+            return
+        self._revalidate(sid, entry)
+
+    def save(self, sid: Optional[str]) -> None:
+        """Persist in-place mutations of sid's state (no-op if unchanged)."""
+        snap = self._snapshot(sid) if sid else None
+        if snap is not None:
+            self._write(sid, *snap)
+
+    async def arefresh(self, sid: Optional[str]) -> None:
+        """refresh() with the durable read in a worker thread."""
+        if sid and self.backend is not None:
+            await asyncio.to_thread(self.refresh, sid)
+
+    async def asave(self, sid: Optional[str]) -> None:
+        """save() with the durable write in a worker thread (state is snapshotted here)."""
+        snap = self._snapshot(sid) if sid else None
+        if snap is not None:
+            await asyncio.to_thread(self._write, sid, *snap)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": type(self.backend).__name__ if self.backend else "memory",
+            "local": self._local.stats(),
+            "writes": self._writes,
+        }
+
+
+def _make_backend() -> Optional[FlowSessionBackend]:
+    if BACKEND in ("db", "sql", "sqlite", "postgres", "postgresql"):
+        try:
+            return DBFlowSessionBackend()
+        except Exception:
+            logger.exception("flow_sessions: DB backend unavailable, falling back to memory")
+            return None
+    return None
+
+
+def create_store() -> FlowSessionStore:
+    store = FlowSessionStore(_make_backend())
+    logger.info(
+        "flow_sessions: backend=%s max=%d ttl=%s revalidate=%.1fs",
+        store.stats()["backend"], MAX_SESSIONS, SESSION_TTL, REVALIDATE_SECS,
+    )
+    return store
+
+
+_shared: Optional[FlowSessionStore] = None
+_shared_lock = threading.Lock()
+
+
+def shared_store() -> FlowSessionStore:
+    """The process-wide visitor session store (chat flow engine, A/B assignment)."""
+    global _shared
+    if _shared is None:
+        with _shared_lock:
+            if _shared is None:
+                _shared = create_store()
+    return _shared
@@ -0,0 +1,362 @@
+# app/services/lead_notes.py
+"""
+Per-lead note history: an append-only ring of structured entries
+{"seq", "ts", "kind", "text"} capped at NOTES_MAX per lead, instead of one
+ever-growing " | "-joined string.
+
+Lead.notes only carries a short summary (the newest few entries) so /leads
+stays small; the full history is served page by page (GET /leads/{id}/notes).
+
+Entries pushed out of a full ring are dropped, or with ACE_LEAD_NOTES_SPILL=db
+written to the `lead_notes` table and read back when a page reaches past the
+ring (or when the lead has no ring in memory, e.g. after a restart). Spilled
+rows are buffered and written by a background task (start()/close()), never
+on the request path. Rings are kept for at most RINGS_MAX leads (LRU); a ring
+that is evicted, or whose lead leaves lead_service's working set, is spilled
+whole. A new ring continues the lead's seq numbering from the spill table
+(prime(), run when a lead is loaded from the db tier) or from Lead.notesCount.
+
+Env:
+  ACE_LEAD_NOTES_MAX         entries kept in memory per lead (default 200)
+  ACE_LEAD_NOTES_SUMMARY     newest entries joined into Lead.notes (default 3)
+  ACE_LEAD_NOTES_SPILL       none (default) | db
+  ACE_LEAD_NOTES_RINGS       leads with a ring in memory (default 10000)
+  ACE_LEAD_NOTES_FLUSH_SECS  spill write interval (default 2)
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, Iterable, List, Optional, Set, Tuple
+
+from app.core.cache import TTLCache
+
+logger = logging.getLogger("ace.lead_notes")
+
+NOTES_MAX = int(os.getenv("ACE_LEAD_NOTES_MAX", "200"))
+SUMMARY_ENTRIES = int(os.getenv("ACE_LEAD_NOTES_SUMMARY", "3"))
+SUMMARY_CHARS = 500
+SPILL = os.getenv("ACE_LEAD_NOTES_SPILL", "none").strip().lower()
+RINGS_MAX = int(os.getenv("ACE_LEAD_NOTES_RINGS", "10000"))
+FLUSH_SECS = float(os.getenv("ACE_LEAD_NOTES_FLUSH_SECS", "2"))
+SPILL_BATCH = 500
+SPILL_BUFFER_MAX = 100_000  # rows waiting for the writer; beyond this the oldest are dropped
+
+Note = Dict[str, Any]
+
+
+class NoteRing:
+    __slots__ = ("entries", "next_seq")
+
+    def __init__(self, maxlen: int = NOTES_MAX, next_seq: int = 1):
+        self.entries: Deque[Note] = deque(maxlen=max(1, maxlen))
+        self.next_seq = max(1, next_seq)
+
+    def append(self, text: str, kind: str, ts: int) -> Tuple[Note, Optional[Note]]:
+        """Returns (new entry, entry pushed out of the ring or None)."""
+        evicted = self.entries[0] if len(self.entries) == self.entries.maxlen else None
+        entry = {"seq": self.next_seq, "ts": ts, "kind": kind, "text": text}
+        self.next_seq += 1
+        self.entries.append(entry)
+        return entry, evicted
+
+    @property
+    def total(self) -> int:
+        return self.next_seq - 1
+
+    def first_seq(self) -> int:
+        return self.entries[0]["seq"] if self.entries else self.next_seq
+
+    def before(self, before: Optional[int], limit: int) -> List[Note]:
+        """Newest-first entries with seq < before (walks from the newest end)."""
+        out: List[Note] = []
+        for e in reversed(self.entries):
+            if before is not None and e["seq"] >= before:
+                continue
+            out.append(e)
+            if len(out) >= limit:
+                break
+        return out
+
+    def summary(self) -> str:
+        n = min(SUMMARY_ENTRIES, len(self.entries))
+        texts = [self.entries[-i]["text"] for i in range(n, 0, -1)]
+        s = " | ".join(t for t in texts if t)
+        return s if len(s) <= SUMMARY_CHARS else "…" + s[-(SUMMARY_CHARS - 1):]
+
+
+class DBNoteSpill:
+    """`lead_notes` table via app.core.db (evicted ring entries); created by create_all()."""
+
+    def __init__(self):
+        from app.core.db import engine
+        from app.models.orm import LeadNote
+
+        self._engine = engine
+        self._table = LeadNote.__table__
+
+    def write(self, rows: List[Tuple[str, Note]]) -> None:
+        from app.core.db import dialect_insert
+
+        if not rows:
+            return
+        t = self._table
+        # a (lead_id, seq) already stored must not fail the whole batch
+        stmt = dialect_insert(t, self._engine).on_conflict_do_nothing(index_elements=[t.c.lead_id, t.c.seq])
+        with self._engine.begin() as conn:
+            conn.execute(
+                stmt,
+                [{"lead_id": sid, "seq": e["seq"], "ts": e["ts"], "kind": e["kind"], "text": e["text"]} for sid, e in rows],
+            )
+
+    def read(self, sid: str, before: Optional[int], limit: int) -> List[Note]:
+        from sqlalchemy import select
+
+        t = self._table
+        stmt = select(t.c.seq, t.c.ts, t.c.kind, t.c.text).where(t.c.lead_id == sid)
+        if before is not None:
+            stmt = stmt.where(t.c.seq < before)
+        stmt = stmt.order_by(t.c.seq.desc()).limit(limit)
+        with self._engine.connect() as conn:
+            return [{"seq": r.seq, "ts": r.ts, "kind": r.kind, "text": r.text} for r in conn.execute(stmt)]
+
+    def max_seqs(self, sids: List[str]) -> Dict[str, int]:
+        from sqlalchemy import func, select
+
+        if not sids:
+            return {}
+        t = self._table
+        stmt = select(t.c.lead_id, func.max(t.c.seq)).where(t.c.lead_id.in_(sids)).group_by(t.c.lead_id)
+        with self._engine.connect() as conn:
+            return {lead_id: int(seq) for lead_id, seq in conn.execute(stmt)}
+
+    def delete(self, sids: List[str]) -> None:
+        if not sids:
+            return
+        with self._engine.begin() as conn:
+            conn.execute(self._table.delete().where(self._table.c.lead_id.in_(sids)))
+
+
+class LeadNotes:
+    def __init__(
+        self,
+        spill: Optional[DBNoteSpill] = None,
+        *,
+        maxlen: int = NOTES_MAX,
+        max_rings: int = RINGS_MAX,
+    ):
+        self.spill = spill
+        self.maxlen = maxlen
+        self.max_rings = max(1, max_rings)
+        self._rings: "OrderedDict[str, NoteRing]" = OrderedDict()
+        # sid -> highest seq in the spill table, for the lead's next ring (prime())
+        self._seeds = TTLCache(maxsize=self.max_rings, ttl=3600)
+        self._spill_buf: List[Tuple[str, Note]] = []
+        self._inflight: List[Tuple[str, Note]] = []  # taken by flush(), not yet committed
+        self._deletes: Set[str] = set()
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.evicted = 0
+        self.dropped = 0
+
+    # -- rings --
+    def _ring(self, sid: str, seq_floor: int) -> NoteRing:
+        ring = self._rings.get(sid)
+        if ring is not None:
+            self._rings.move_to_end(sid)
+            return ring
+        seed = max(self._seeds.pop(sid, 0) or 0, seq_floor)
+        ring = self._rings[sid] = NoteRing(self.maxlen, seed + 1)
+        while len(self._rings) > self.max_rings:
+            old_sid, old = self._rings.popitem(last=False)
+            self._retire(old_sid, old)
+        return ring
+
+    def _retire(self, sid: str, ring: NoteRing) -> None:
+        """A ring leaves memory: its entries go to the spill table (if any)."""
+        self.evicted += 1
+        if self.spill is not None:
+            self._buffer((sid, e) for e in ring.entries)
+
+    def _buffer(self, rows: Iterable[Tuple[str, Note]]) -> None:
+        self._spill_buf.extend(rows)
+        excess = len(self._spill_buf) - SPILL_BUFFER_MAX
+        if excess > 0:
+            del self._spill_buf[:excess]
+            self.dropped += excess
+            logger.warning("lead_notes: spill buffer full, dropped %d oldest rows", excess)
+
+    def evict(self, sid: str) -> None:
+        """Drop sid's ring from memory (spilling it); its history stays pageable."""
+        with self._lock:
+            ring = self._rings.pop(sid, None)
+            if ring is not None:
+                self._retire(sid, ring)
+
+    def prime(self, sids: List[str]) -> None:
+        """
+        Continue seq numbering from the spill table for leads without a ring
+        (blocking: run it where the lead itself is loaded from the db).
+        """
+        if self.spill is None:
+            return
+        with self._lock:
+            wanted = [sid for sid in sids if sid not in self._rings]
+        if not wanted:
+            return
+        try:
+            seeds = self.spill.max_seqs(wanted)
+        except Exception:
+            logger.exception("lead_notes: seq lookup failed leads=%d", len(wanted))
+            return
+        with self._lock:
+            for sid, seq in seeds.items():
+                if sid not in self._rings:
+                    self._seeds.set(sid, seq)
+
+    def add(
+        self, sid: str, text: str, kind: str = "note", ts: Optional[int] = None, *, seq_floor: int = 0
+    ) -> Note:
+        """`seq_floor`: seqs already handed out for sid (e.g. Lead.notesCount)."""
+        with self._lock:
+            ring = self._ring(sid, seq_floor)
+            entry, evicted = ring.append(text, kind, int(ts if ts is not None else time.time()))
+            if evicted is not None and self.spill is not None:
+                self._buffer([(sid, evicted)])
+            return entry
+
+    # -- spill writer --
+    def flush(self) -> int:
+        """Write buffered spill rows and deletes now (blocking); returns rows written."""
+        if self.spill is None:
+            return 0
+        written = 0
+        with self._flush_lock:
+            while True:
+                with self._lock:
+                    deletes, self._deletes = list(self._deletes), set()
+                    rows = self._inflight = self._spill_buf[:SPILL_BATCH]
+                    del self._spill_buf[:SPILL_BATCH]
+                if not deletes and not rows:
+                    return written
+                try:
+                    self.spill.delete(deletes)
+                    self.spill.write(rows)
+                    written += len(rows)
+                except Exception:
+                    logger.exception("lead_notes: spill write failed rows=%d (dropped)", len(rows))
+                    with self._lock:
+                        self._deletes.update(deletes)  # retried next time
+                    self.dropped += len(rows)
+                    return written
+                finally:
+                    with self._lock:
+                        self._inflight = []
+
+    async def _run(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(self.flush)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("lead_notes: spill flush failed")
+
+    async def start(self, interval: float = FLUSH_SECS) -> None:
+        """Start the background spill writer (app startup)."""
+        if self.spill is None or self._task is not None:
+            return
+        self._task = asyncio.get_running_loop().create_task(self._run(max(0.05, interval)))
+
+    async def close(self) -> None:
+        """Stop the writer and spill every ring still in memory (app shutdown)."""
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        if self.spill is not None:
+            with self._lock:
+                for sid, ring in self._rings.items():
+                    self._buffer((sid, e) for e in ring.entries)
+            await asyncio.to_thread(self.flush)
+
+    # -- reads --
+    def summary(self, sid: str) -> str:
+        ring = self._rings.get(sid)
+        return ring.summary() if ring is not None else ""
+
+    def count(self, sid: str) -> int:
+        ring = self._rings.get(sid)
+        return ring.total if ring is not None else 0
+
+    def page(self, sid: str, *, before: Optional[int] = None, limit: int = 50) -> Tuple[List[Note], Optional[int]]:
+        """
+        Newest-first page of entries with seq < before; returns (items, cursor
+        for the next older page or None). Reads the spill table when the page
+        reaches past the ring (blocking: call it off the event loop).
+        """
+        limit = max(1, int(limit))
+        with self._lock:
+            ring = self._rings.get(sid)
+            items = ring.before(before, limit) if ring is not None else []
+            first = ring.first_seq() if ring is not None else None
+            want_spill = (
+                self.spill is not None
+                and len(items) < limit
+                and (first is None or first > 1)
+                and sid not in self._deletes
+            )
+            unsaved = [e for s, e in self._inflight + self._spill_buf if s == sid] if want_spill else []
+        if want_spill:
+            bound = first if before is None else (before if first is None else min(before, first))
+            want = limit - len(items)
+            older: Dict[int, Note] = {}
+            try:
+                older = {e["seq"]: e for e in self.spill.read(sid, bound, want)}  # type: ignore[union-attr]
+            except Exception:
+                logger.exception("lead_notes: spill read failed sid=%s", sid)
+            for e in unsaved:
+                if bound is None or e["seq"] < bound:
+                    older.setdefault(e["seq"], e)
+            items.extend(sorted(older.values(), key=lambda e: e["seq"], reverse=True)[:want])
+        oldest = items[-1]["seq"] if items else None
+        more = oldest is not None and oldest > 1 and (self.spill is not None or oldest > first)
+        return items, (oldest if more else None)
+
+    def drop(self, sid: str) -> None:
+        """Forget sid's history (the spill rows are deleted by the writer)."""
+        with self._lock:
+            self._rings.pop(sid, None)
+            self._seeds.pop(sid)
+            self._spill_buf = [r for r in self._spill_buf if r[0] != sid]
+            if self.spill is not None:
+                self._deletes.add(sid)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "rings": len(self._rings),
+            "buffered": len(self._spill_buf),
+            "evicted": self.evicted,
+            "dropped": self.dropped,
+        }
+
+
+def _make_spill() -> Optional[DBNoteSpill]:
+    if SPILL == "db":
+        try:
+            return DBNoteSpill()
+        except Exception:
+            logger.exception("lead_notes: DB spill unavailable, keeping the ring only")
+    return None
+
+
+notes = LeadNotes(_make_spill())
@@ -1,20 +1,344 @@
+import asyncio
+import heapq
+import logging
+import os
 import time
-from typing import List, Optional
+from itertools import count
+from typing import Any, Callable, Dict, FrozenSet, Iterator, List, Optional, Set, Tuple, Union
 from collections import Counter
+from sortedcontainers import SortedList
+from app.core.cache import TTLCache
 from app.models.lead import Lead
+from app.services import event_bus, lead_notes, lead_store_db
 
-# In-memory lead store
-_leads: List[Lead] = []
+logger = logging.getLogger("ace.lead_service")
+
+# Fields that drive an index or aggregate; change them via update_lead()
+INDEXED_FIELDS = ("score", "stage", "phone", "email", "lastMessage")
+
+ACTIVE_STAGES = ("Interested", "Discovery", "Pogovori")
+MEETING_SCORE = 85
+CLOSE_WORDS = ("close", "deal")
+OBJECTIONS = (
+    ("💸 Price too high", ("price",)),
+    ("👥 Need partner approval", ("partner", "approval")),
+    ("🏢 Already working with agency", ("agency",)),
+    ("⏳ Timing not right", ("time", "timing")),
+)
+
+# (closing, objection labels) derived from a lead's notes
+NoteFlags = Tuple[bool, FrozenSet[str]]
+_NO_FLAGS: NoteFlags = (False, frozenset())
+
+
+def _scan_notes(text: str) -> NoteFlags:
+    t = (text or "").lower()
+    if not t:
+        return _NO_FLAGS
+    closing = any(w in t for w in CLOSE_WORDS)
+    labels = frozenset(label for label, words in OBJECTIONS if any(w in t for w in words))
+    return closing, labels
+
+
+def _flags_of(lead: Lead) -> NoteFlags:
+    """Flags stored on the lead, plus those of its notes summary (older rows have only that)."""
+    closing, labels = _scan_notes(lead.notes)
+    return closing or bool(lead.notesClosing), labels | frozenset(lead.notesObjections or ())
+
+
+class LeadStore:
+    """
+    In-memory leads: id -> Lead, plus maintained secondary indexes
+      order     (-score, seq, id) in a SortedList -> score-ordered walk,
+                O(log n) per insert / remove
+      stages    stage -> ids
+      phone / email   ids with that contact flag
+    and aggregate counters (total, stages, meeting, contacts, interactions,
+    closing, objections), so KPI / funnel / objection reads are O(1) instead
+    of passes over every lead. Ties in score keep insertion order (as the old
+    sorted() did).
+
+    The counters cover every lead, not just the resident ones: seed() sets
+    them from the db tier's aggregate, leads loaded from it are added with
+    counted=True, and evict() drops a lead from memory (and the indexes)
+    without touching them. Only remove() -- a deleted lead -- counts down.
+
+    Note-derived flags are sticky: they are updated from each appended note
+    alone (note_appended), never by rescanning the note history, and kept on
+    the lead (notesClosing / notesObjections) so the db tier stores them.
+    """
+
+    def __init__(self):
+        self._by_id: Dict[str, Lead] = {}
+        # id -> (score, seq, stage, phone, email, interacted)
+        self._keys: Dict[str, Tuple[int, int, str, bool, bool, bool]] = {}
+        self._order: SortedList = SortedList()  # of (-score, seq, id)
+        self._stages: Dict[str, Set[str]] = {}
+        self._phone: Set[str] = set()
+        self._email: Set[str] = set()
+        self._notes: Dict[str, NoteFlags] = {}
+        self._seq = count()
+        self.seeded = False
+        self.total = 0
+        self.stages: Counter = Counter()
+        self.meeting = 0
+        self.contacts = 0
+        self.interactions = 0
+        self.closing = 0
+        self.objections: Counter = Counter()
+        self.version = 0
+        # called after every change that can move an aggregate
+        self.on_change: Optional[Callable[[], None]] = None
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def __iter__(self) -> Iterator[Lead]:
+        return iter(list(self._by_id.values()))
+
+    def __contains__(self, sid: object) -> bool:
+        return sid in self._by_id
+
+    def get(self, sid: Optional[str]) -> Optional[Lead]:
+        return self._by_id.get(sid) if sid else None
+
+    def _changed(self) -> None:
+        self.version += 1
+        if self.on_change is not None:
+            try:
+                self.on_change()
+            except Exception:
+                logger.exception("lead_service: on_change failed")
+
+    @staticmethod
+    def _key_of(lead: Lead, seq: int) -> Tuple[int, int, str, bool, bool, bool]:
+        return int(lead.score), seq, lead.stage, bool(lead.phone), bool(lead.email), bool(lead.lastMessage)
+
+    def _count(self, key: Tuple[int, int, str, bool, bool, bool], sign: int) -> None:
+        score, _, stage, phone, email, interacted = key
+        self.total += sign
+        self.stages[stage] += sign
+        self.meeting += sign * (score >= MEETING_SCORE)
+        self.contacts += sign * (phone or email)
+        self.interactions += sign * interacted
+
+    def _index(self, lead: Lead, seq: int, *, counted: bool = False) -> None:
+        key = self._key_of(lead, seq)
+        score, _, stage, phone, email, interacted = key
+        self._keys[lead.id] = key
+        self._order.add((-score, seq, lead.id))
+        self._stages.setdefault(stage, set()).add(lead.id)
+        if phone:
+            self._phone.add(lead.id)
+        if email:
+            self._email.add(lead.id)
+        if not counted:
+            self._count(key, 1)
+
+    def _unindex(self, sid: str, *, counted: bool = True) -> int:
+        key = self._keys.pop(sid)
+        score, seq, stage, phone, email, interacted = key
+        self._order.discard((-score, seq, sid))
+        ids = self._stages.get(stage)
+        if ids is not None:
+            ids.discard(sid)
+            if not ids:
+                del self._stages[stage]
+        self._phone.discard(sid)
+        self._email.discard(sid)
+        if counted:
+            self._count(key, -1)
+        return seq
+
+    def _set_note_flags(self, sid: str, flags: NoteFlags, *, counted: bool = False) -> bool:
+        old = self._notes.get(sid, _NO_FLAGS)
+        if flags == old:
+            return False
+        if not counted:
+            self.closing += flags[0] - old[0]
+            self.objections.subtract(old[1])
+            self.objections.update(flags[1])
+        if flags == _NO_FLAGS:
+            self._notes.pop(sid, None)
+        else:
+            self._notes[sid] = flags
+        lead = self._by_id.get(sid)
+        if lead is not None:
+            lead.notesClosing, lead.notesObjections = flags[0], sorted(flags[1])
+        return True
+
+    def seed(self, total: int, stages: Dict[str, int], meeting: int, contacts: int,
+             interactions: int, closing: int, objections: Dict[str, int]) -> None:
+        """Set the counters from an aggregate over every stored lead (empty store only)."""
+        if self._by_id:
+            raise RuntimeError("LeadStore.seed() needs an empty store")
+        self.total, self.meeting, self.contacts = total, meeting, contacts
+        self.interactions, self.closing = interactions, closing
+        self.stages = Counter(stages)
+        self.objections = Counter(objections)
+        self.seeded = True
+        self._changed()
+
+    def add(self, lead: Lead, *, counted: bool = False) -> Lead:
+        """
+        Insert unless the id exists; returns the stored lead. `counted`: the
+        lead is already in the seeded counters (loaded from the db tier).
+        """
+        existing = self._by_id.get(lead.id)
+        if existing is not None:
+            return existing
+        counted = counted and self.seeded
+        self._by_id[lead.id] = lead
+        self._index(lead, next(self._seq), counted=counted)
+        if not (counted and lead.id in self._notes):  # flags kept across evict()
+            self._set_note_flags(lead.id, _flags_of(lead), counted=counted)
+        if not counted:
+            self._changed()
+        return lead
+
+    def remove(self, sid: str) -> Optional[Lead]:
+        """Delete a lead: it leaves the indexes and the counters."""
+        lead = self._by_id.pop(sid, None)
+        if lead is not None:
+            self._unindex(sid)
+            self._set_note_flags(sid, _NO_FLAGS)
+            self._changed()
+        return lead
+
+    def evict(self, sid: str) -> Optional[Lead]:
+        """Drop a lead from memory; it stays in the counters once they are seeded."""
+        if not self.seeded:
+            return self.remove(sid)
+        lead = self._by_id.pop(sid, None)
+        if lead is not None:
+            self._unindex(sid, counted=False)
+        return lead
+
+    def reindex(self, lead: Lead) -> None:
+        """Refresh the indexes after INDEXED_FIELDS of a stored lead changed."""
+        key = self._keys.get(lead.id)
+        if key is None:
+            return
+        if key == self._key_of(lead, key[1]):
+            return
+        seq = self._unindex(lead.id)
+        self._index(lead, seq)
+        self._changed()
+
+    def note_appended(self, lead: Lead, note: str) -> None:
+        """Fold flags of a note just appended to lead.notes into the aggregates."""
+        if lead.id not in self._by_id:
+            return
+        closing, labels = self._notes.get(lead.id, _NO_FLAGS)
+        add_closing, add_labels = _scan_notes(note)
+        if self._set_note_flags(lead.id, (closing or add_closing, labels | add_labels)):
+            self._changed()
+
+    def ordered(self) -> List[Lead]:
+        """All leads, score descending."""
+        by_id = self._by_id
+        return [by_id[sid] for _, _, sid in self._order]
+
+    def count_score_at_least(self, score: int) -> int:
+        """Resident leads with at least `score` (all leads: `meeting` for MEETING_SCORE)."""
+        # entries are (-score, seq, id): everything before (-score + 1,) qualifies
+        return self._order.bisect_left((-int(score) + 1,))
+
+    def in_stage(self, stage: str) -> List[Lead]:
+        return [self._by_id[sid] for sid in self._stages.get(stage, ())]
+
+    def stage_count(self, stage: str) -> int:
+        return self.stages[stage]
+
+    def stage_counts(self) -> Dict[str, int]:
+        return {stage: n for stage, n in self.stages.items() if n}
+
+    def with_contact(self) -> Set[str]:
+        return self._phone | self._email
+
+
+# In-memory working set of leads; with the db tier (lead_store_db) changed
+# leads are written behind to the `leads` table and missing ones hydrated
+# from it. KPI / funnel / objection aggregates are seeded from the table at
+# startup, so they cover every lead, resident or not.
+_leads = LeadStore()
+_store = lead_store_db.make_write_behind()
+_writer_task: Optional[asyncio.Task] = None
+
+# sids the db tier does not know, so repeated lookups of new visitors skip it
+MISS_TTL = 5.0
+_missing = TTLCache(maxsize=10000, ttl=MISS_TTL)
 
 
 def _now() -> int:
     return int(time.time())
 
 
-def _find(sid: Optional[str]) -> Optional[Lead]:
-    if not sid:
+def mark_dirty(lead: Lead) -> None:
+    """Queue a stored lead for the next write-behind flush (no-op in memory mode)."""
+    if _store is not None:
+        _store.mark(lead.id)
+
+
+def _load(sid: str) -> Optional[Lead]:
+    """Read a lead from the db tier (blocking; remembers misses for MISS_TTL)."""
+    if sid in _missing:
         return None
-    return next((l for l in _leads if l.id == sid), None)
+    try:
+        lead = _store.repo.load(sid)
+    except Exception:
+        logger.exception("lead_service: hydrate failed sid=%s", sid)
+        return None
+    if lead is None:
+        _missing.set(sid, True)
+        return None
+    lead_notes.notes.prime([sid])
+    return lead
+
+
+def _hydrate(sid: str) -> Optional[Lead]:
+    lead = _load(sid)
+    return _leads.add(lead, counted=True) if lead is not None else None
+
+
+def _find(sid: Optional[str]) -> Optional[Lead]:
+    lead = _leads.get(sid)
+    if lead is None and sid and _store is not None:
+        lead = _hydrate(sid)
+    return lead
+
+
+async def preload(sid: Optional[str]) -> None:
+    """
+    Hydrate `sid` from the db tier in a worker thread, so the sync lookups of
+    the request that follow are memory hits. Async handlers call this first.
+    """
+    if not sid or _store is None or sid in _leads or sid in _missing:
+        return
+    lead = await asyncio.to_thread(_load, sid)
+    if lead is not None:
+        _leads.add(lead, counted=True)
+
+
+def get_lead(sid: Optional[str]) -> Optional[Lead]:
+    """O(1) lookup by sid (read through to the db tier on a miss)."""
+    return _find(sid)
+
+
+def update_lead(lead: Union[Lead, str], **fields: Any) -> Optional[Lead]:
+    """
+    Set fields on a stored lead and keep the indexes in sync. Use this for
+    INDEXED_FIELDS; other fields may be assigned on the Lead directly.
+    """
+    if isinstance(lead, str):
+        lead = _find(lead)
+        if lead is None:
+            return None
+    for k, v in fields.items():
+        setattr(lead, k, v)
+    _leads.reindex(lead)
+    mark_dirty(lead)
+    return lead
 
 
 def _ensure(sid: str) -> Lead:
@@ -36,7 +360,8 @@ def _ensure(sid: str) -> Lead:
         lastSeenSec=_now(),
         notes=""
     )
-    _leads.append(lead)
+    lead = _leads.add(lead)
+    mark_dirty(lead)
     return lead
 
 
@@ -77,16 +402,20 @@ def ingest_from_deepseek(user_message: str, classification: dict, sid: str = Non
         emailText="",          # NEW
         lastMessage=user_message,
         lastSeenSec=int(time.time()),
-        notes=classification.get("reasons", "")
+        notes=""
     )
-    _leads.append(lead)
+    lead = _leads.add(lead)
+    mark_dirty(lead)
+    reasons = classification.get("reasons", "")
+    if reasons:
+        append_note(lead, reasons, kind="classification")
     return lead
 
 
 def add_lead(lead: Lead):
-    """Append a lead to the global store if not already present."""
-    if not any(l.id == lead.id for l in _leads):
-        _leads.append(lead)
+    """Add a lead to the global store if not already present."""
+    lead = _leads.add(lead)
+    mark_dirty(lead)
     return lead
 
 
@@ -116,6 +445,8 @@ def upsert_contact(sid: str, *, name: str = "", email: str = "", phone: str = ""
             lead.score = 50
 
     lead.lastSeenSec = _now()
+    _leads.reindex(lead)
+    mark_dirty(lead)
     return lead
 
 
@@ -123,26 +454,60 @@ def upsert_contact(sid: str, *, name: str = "", email: str = "", phone: str = ""
 # Lead access
 # -------------------
 def get_all_leads() -> List[Lead]:
-    """Return all leads sorted by score descending."""
-    return sorted(_leads, key=lambda l: l.score, reverse=True)
+    """
+    Leads of the working set (every lead in memory mode; with the db tier the
+    most recently seen, up to ACE_LEAD_STORE_MAX), score descending.
+    """
+    return _leads.ordered()
+
+
+def _forget(sid: str) -> None:
+    """Remove a (hydrated) lead from memory, the indexes and the counters."""
+    lead_notes.notes.drop(sid)
+    _survey_scores.pop(sid, None)
+    _leads.remove(sid)
+    if _store is not None:
+        _store.discard(sid)
+
+
+def _delete_row(sid: str) -> None:
+    try:
+        _store.repo.delete(sid)
+    except Exception:
+        logger.exception("lead_service: durable delete failed sid=%s", sid)
 
 
 def delete_lead(sid: str) -> bool:
-    """Delete a lead by ID. Returns True if deleted, False if not found."""
-    global _leads
-    initial_count = len(_leads)
-    _leads = [l for l in _leads if l.id != sid]
-    return len(_leads) < initial_count
+    """Delete a lead by ID (blocking; scripts). Returns True if deleted, False if not found."""
+    found = _find(sid) is not None
+    _forget(sid)
+    if _store is not None:
+        _delete_row(sid)
+    return found
+
+
+async def adelete_lead(sid: str) -> bool:
+    """
+    delete_lead() for async handlers: the store is changed on the loop, only
+    the hydrate (so the lead leaves the counters) and the row delete run in
+    a worker thread.
+    """
+    await preload(sid)
+    found = _leads.get(sid) is not None
+    _forget(sid)
+    if _store is not None:
+        await asyncio.to_thread(_delete_row, sid)
+    return found
 
 
 # -------------------
 # KPI calculations
 # -------------------
 def get_kpis():
-    total = len(_leads)
-    contacts = sum(1 for l in _leads if l.phone or l.email)
-    interactions = sum(1 for l in _leads if l.lastMessage)
-    active_leads = sum(1 for l in _leads if l.stage in ["Interested", "Discovery", "Pogovori"])
+    total = _leads.total
+    contacts = _leads.contacts
+    interactions = _leads.interactions
+    active_leads = sum(_leads.stage_count(s) for s in ACTIVE_STAGES)
 
     # avg response simulated as fixed for now
     avg_response = 30 if total == 0 else 25
@@ -167,12 +532,12 @@ def get_funnel():
     Meeting: leads with high score
     Close: leads with notes containing 'close' or 'deal'
     """
-    total = len(_leads) or 1
+    total = _leads.total or 1
 
     awareness = 100
-    interest = int(100 * sum(1 for l in _leads if l.stage == "Interested") / total)
-    meeting = int(100 * sum(1 for l in _leads if l.score >= 85) / total)
-    close = int(100 * sum(1 for l in _leads if "close" in l.notes.lower() or "deal" in l.notes.lower()) / total)
+    interest = int(100 * _leads.stage_count("Interested") / total)
+    meeting = int(100 * _leads.meeting / total)
+    close = int(100 * _leads.closing / total)
 
     return {
         "awareness": awareness,
@@ -188,24 +553,193 @@ def get_funnel():
 def get_objections():
     """
     Collect objections from lead notes.
-    Returns top 5 most common reasons.
+    Returns top 5 most common reasons (each lead counts once per reason).
     """
-    texts = [l.notes.lower() for l in _leads if l.notes]
-    words = []
+    ranked = [f"{k} ({v})" for k, v in _leads.objections.most_common() if v > 0]
+    return ranked[:5]
 
-    for t in texts:
-        if "price" in t:
-            words.append("💸 Price too high")
-        if "partner" in t or "approval" in t:
-            words.append("👥 Need partner approval")
-        if "agency" in t:
-            words.append("🏢 Already working with agency")
-        if "time" in t or "timing" in t:
-            words.append("⏳ Timing not right")
 
-    counts = Counter(words)
-    ranked = [f"{k} ({v})" for k, v in counts.most_common(5)]
-    return ranked
+def append_note(lead: Lead, note: str, kind: str = "note") -> Lead:
+    """
+    Record a note in the lead's note history (lead_notes) and update the
+    aggregates. lead.notes is refreshed to a short summary of the newest
+    entries; the full history is paged via lead_notes.
+    """
+    if note:
+        lead_notes.notes.add(lead.id, note, kind, seq_floor=lead.notesCount or 0)
+        lead.notes = lead_notes.notes.summary(lead.id)
+        lead.notesCount = lead_notes.notes.count(lead.id)
+        _leads.note_appended(lead, note)
+        mark_dirty(lead)
+    return lead
+
+
+def get_notes(sid: str, *, before: Optional[int] = None, limit: int = 50):
+    """Newest-first page of a lead's notes -> (items, cursor for the next page)."""
+    return lead_notes.notes.page(sid, before=before, limit=limit)
+
+
+# -------------------
+# KPI delta stream
+# -------------------
+# Aggregate changes are coalesced per event-loop tick and published as
+# "kpi.delta" on the KPI_TOPIC bus topic (only the fields that changed), so
+# dashboards can follow /kpis + /funnel + /objections without polling.
+KPI_TOPIC = event_bus.INTERNAL_PREFIX + "kpis"
+_kpi_published: Dict[str, Dict[str, Any]] = {}
+_kpi_scheduled = False
+_kpi_tasks: Set[asyncio.Task] = set()  # the loop keeps only weak references
+
+
+def aggregates_version() -> int:
+    """Bumped on every change that can move a KPI / funnel / objection value."""
+    return _leads.version
+
+
+def kpi_snapshot() -> Dict[str, Any]:
+    return {"kpis": get_kpis(), "funnel": get_funnel(), "objections": get_objections()}
+
+
+def _kpi_delta(old: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Any]:
+    delta: Dict[str, Any] = {}
+    for section, values in new.items():
+        prev = old.get(section)
+        if isinstance(values, dict) and isinstance(prev, dict):
+            changed = {k: v for k, v in values.items() if prev.get(k) != v}
+            if changed:
+                delta[section] = changed
+        elif prev != values:
+            delta[section] = values
+    return delta
+
+
+async def _publish_kpi_delta() -> None:
+    global _kpi_scheduled
+    _kpi_scheduled = False
+    snap = kpi_snapshot()
+    delta = _kpi_delta(_kpi_published, snap)
+    if not delta:
+        return
+    _kpi_published.clear()
+    _kpi_published.update(snap)
+    try:
+        await event_bus.publish(KPI_TOPIC, "kpi.delta", {"version": aggregates_version(), **delta}, broadcast=False)
+    except Exception:
+        logger.exception("lead_service: kpi delta publish failed")
+
+
+def _schedule_kpi_delta() -> None:
+    global _kpi_scheduled
+    if _kpi_scheduled:
+        return
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return  # not inside the app's loop (scripts/tests); readers still see exact values
+    _kpi_scheduled = True
+    task = loop.create_task(_publish_kpi_delta())
+    _kpi_tasks.add(task)
+    task.add_done_callback(_kpi_tasks.discard)
+
+
+_leads.on_change = _schedule_kpi_delta
+
+
+# -------------------
+# Write-behind (db tier)
+# -------------------
+# Dirty leads are snapshotted on the event loop and upserted from a worker
+# thread every FLUSH_SECS; the working set is then trimmed to MAX_LEADS by
+# evicting the least recently seen leads that have nothing left to write
+# (they are hydrated again on their next request).
+def _evict(limit: int = lead_store_db.MAX_LEADS) -> int:
+    excess = len(_leads) - limit
+    if _store is None or limit <= 0 or excess <= 0:
+        return 0
+    clean = (lead for lead in _leads if not _store.is_dirty(lead.id))
+    victims = heapq.nsmallest(excess, clean, key=lambda lead: lead.lastSeenSec)
+    for lead in victims:
+        _leads.evict(lead.id)
+        _missing.pop(lead.id, None)
+        _survey_scores.pop(lead.id, None)
+        lead_notes.notes.evict(lead.id)
+    return len(victims)
+
+
+def flush_leads() -> int:
+    """Write every dirty lead now (shutdown, scripts); returns leads written."""
+    if _store is None:
+        return 0
+    return _store.flush(_leads.get)
+
+
+def warm_leads(limit: int = lead_store_db.WARM) -> int:
+    """Load the most recently seen leads from the db tier into the working set."""
+    if _store is None or limit <= 0:
+        return 0
+    try:
+        recent = _store.repo.load_recent(limit)
+    except Exception:
+        logger.exception("lead_service: warm-up from db failed")
+        return 0
+    lead_notes.notes.prime([lead.id for lead in recent])
+    for lead in recent:
+        _leads.add(lead, counted=True)
+    logger.info("lead_service: warmed %d leads from db", len(recent))
+    return len(recent)
+
+
+def seed_aggregates() -> bool:
+    """Seed the KPI / funnel / objection counters from the db tier (before warm_leads)."""
+    if _store is None or _leads.seeded or len(_leads):
+        return False
+    try:
+        agg = _store.repo.aggregates(MEETING_SCORE, CLOSE_WORDS, OBJECTIONS)
+    except Exception:
+        logger.exception("lead_service: aggregate seed from db failed (counting the working set only)")
+        return False
+    if agg is None:
+        return False
+    _leads.seed(**agg)
+    logger.info("lead_service: seeded aggregates over %d leads", agg["total"])
+    return True
+
+
+async def _run_writer(interval: float) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            batch = _store.take(_leads.get)
+            if batch:
+                await asyncio.to_thread(_store.write, batch)
+            _evict()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("lead_service: write-behind flush failed")
+
+
+async def start_store(interval: float = lead_store_db.FLUSH_SECS) -> None:
+    """Seed the aggregates, warm the working set and start the write-behind loop (app startup)."""
+    global _writer_task
+    if _store is None or _writer_task is not None:
+        return
+    seed_aggregates()
+    warm_leads()
+    _writer_task = asyncio.get_running_loop().create_task(_run_writer(max(0.05, interval)))
+
+
+async def close_store() -> None:
+    """Stop the write-behind loop and flush what is left (app shutdown)."""
+    global _writer_task
+    task, _writer_task = _writer_task, None
+    if task is not None:
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+    flush_leads()
 
 
 # -------------------
@@ -220,6 +754,7 @@ def start_survey(sid: str) -> Lead:
     if not lead.survey_started_at:
         lead.survey_started_at = datetime.utcnow().isoformat()
     lead.lastSeenSec = _now()
+    mark_dirty(lead)
     return lead
 
 
@@ -230,8 +765,9 @@ def update_survey_answer(sid: str, node_id: str, answer: any) -> Lead:
     lead = _ensure(sid)
     if not lead.survey_answers:
         lead.survey_answers = {}
-    lead.survey_answers[node_id] = answer
+    _set_survey_answer(lead, node_id, answer)
     lead.lastSeenSec = _now()
+    mark_dirty(lead)
     return lead
 
 
@@ -250,7 +786,8 @@ def update_survey_progress(sid: str, progress: int, answers: dict = None) -> Lea
     if answers:
         if not lead.survey_answers:
             lead.survey_answers = {}
-        lead.survey_answers.update(answers)
+        for node_id, answer in answers.items():
+            _set_survey_answer(lead, node_id, answer)
     
     if progress >= 100 and not lead.survey_completed_at:
         lead.survey_completed_at = datetime.utcnow().isoformat()
@@ -259,9 +796,92 @@ def update_survey_progress(sid: str, progress: int, answers: dict = None) -> Lea
             lead.score = 60
     
     lead.lastSeenSec = _now()
+    _leads.reindex(lead)
+    mark_dirty(lead)
     return lead
 
 
+# Survey score: per-node contributions
+# ------------------------------------
+# The score of a lead's survey answers is kept as node -> contribution plus a
+# running total. Storing an answer marks only that node dirty when its value
+# changed, and survey_score() rescores the dirty nodes, so a click costs O(1)
+# however many questions were answered before. A full rescore
+# (rescore_survey) runs when the flow version changes, and on every call with
+# ACE_SURVEY_SCORE_VERIFY=1 to check (and repair) the incremental total.
+SURVEY_SCORE_VERIFY = os.getenv("ACE_SURVEY_SCORE_VERIFY", "0") == "1"
+
+# (node_id, answer) -> score contribution, or None when the answer does not score
+AnswerScorer = Callable[[str, Any], Optional[int]]
+
+
+class SurveyScore:
+    __slots__ = ("version", "parts", "total", "dirty")
+
+    def __init__(self, version: Any = None):
+        self.version = version
+        self.parts: Dict[str, int] = {}
+        self.total = 0
+        self.dirty: Set[str] = set()
+
+    @property
+    def count(self) -> int:
+        """Number of answers that contributed to the total."""
+        return len(self.parts)
+
+    def set(self, node_id: str, score: Optional[int]) -> None:
+        self.total -= self.parts.pop(node_id, 0)
+        if score is not None:
+            self.parts[node_id] = score
+            self.total += score
+
+
+_survey_scores: Dict[str, SurveyScore] = {}
+
+
+def _set_survey_answer(lead: Lead, node_id: str, answer: Any) -> None:
+    answers = lead.survey_answers
+    if node_id in answers and answers[node_id] == answer:
+        return
+    answers[node_id] = answer
+    st = _survey_scores.get(lead.id)
+    if st is not None:
+        st.dirty.add(node_id)
+
+
+def rescore_survey(lead: Lead, scorer: AnswerScorer, version: Any = None) -> SurveyScore:
+    """Full recompute over every stored answer (repair / verification path)."""
+    st = SurveyScore(version)
+    for node_id, answer in (lead.survey_answers or {}).items():
+        st.set(node_id, scorer(node_id, answer))
+    _survey_scores[lead.id] = st
+    return st
+
+
+def survey_score(lead: Lead, scorer: AnswerScorer, version: Any = None) -> SurveyScore:
+    """
+    Score of the lead's survey answers under `scorer`. `version` identifies
+    the flow the scorer reads; contributions computed under another version
+    are discarded and rebuilt.
+    """
+    st = _survey_scores.get(lead.id)
+    if st is None or st.version != version:
+        return rescore_survey(lead, scorer, version)
+    answers = lead.survey_answers or {}
+    for node_id in st.dirty:
+        st.set(node_id, scorer(node_id, answers[node_id]) if node_id in answers else None)
+    st.dirty.clear()
+    if SURVEY_SCORE_VERIFY:
+        full = rescore_survey(lead, scorer, version)
+        if (full.total, full.count) != (st.total, st.count):
+            logger.warning(
+                "lead_service: survey score drift sid=%s incremental=%d/%d full=%d/%d (repaired)",
+                lead.id, st.total, st.count, full.total, full.count,
+            )
+        return full
+    return st
+
+
 def get_survey_answers(sid: str) -> dict:
     """
     Retrieve survey answers for a lead.
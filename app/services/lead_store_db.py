@@ -0,0 +1,312 @@
+# app/services/lead_store_db.py
+"""
+Durable tier of lead_service: the `leads` ORM table, written behind.
+
+lead_service keeps the working set in memory (LeadStore, with its indexes and
+aggregates) and only marks changed leads dirty. WriteBehind collects the dirty
+sids and flushes them in batches, as one multi-row
+INSERT .. ON CONFLICT (organization_id, sid) DO UPDATE per batch (the bulk
+form of leads_repo.upsert_lead_by_sid), so a burst of updates to one lead
+costs one row write. A lead missing from the working set is read back by sid
+(hydration), and the most recently seen leads are loaded on startup so
+/leads survives deploys. The KPI / funnel / objection counters are seeded on
+startup from one grouped aggregate over the table (aggregates()), so they
+cover every lead and not only the working set. The note-derived flags are
+stored on the row (notesClosing / notesObjections), as lead_service keeps
+them over the whole note history.
+
+Rows belong to one organization, ACE_LEAD_STORE_ORG (slug, falls back to
+ACE_CHAT_DEFAULT_ORG). Without an org, or with ACE_LEAD_STORE_BACKEND=memory,
+leads stay in memory only (the previous behavior).
+
+Env:
+  ACE_LEAD_STORE_BACKEND      "db" (default) | "memory"
+  ACE_LEAD_STORE_ORG          organization slug owning the rows
+  ACE_LEAD_STORE_FLUSH_SECS   write-behind interval (default 1.0)
+  ACE_LEAD_STORE_BATCH        leads per upsert statement (default 500)
+  ACE_LEAD_STORE_WARM         recent leads loaded on startup (default 5000)
+  ACE_LEAD_STORE_MAX          working-set size; beyond it the least recently
+                              seen clean leads are evicted (default 50000, 0 = no limit)
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from sqlalchemy import case, func, or_, select
+
+from app.models.lead import Lead
+
+logger = logging.getLogger("ace.lead_store_db")
+
+BACKEND = os.getenv("ACE_LEAD_STORE_BACKEND", "db").strip().lower()
+ORG_SLUG = (
+    os.getenv("ACE_LEAD_STORE_ORG", "").strip()
+    or os.getenv("ACE_CHAT_DEFAULT_ORG", "").strip()
+    or None
+)
+FLUSH_SECS = float(os.getenv("ACE_LEAD_STORE_FLUSH_SECS", "1.0"))
+BATCH = int(os.getenv("ACE_LEAD_STORE_BATCH", "500"))
+WARM = int(os.getenv("ACE_LEAD_STORE_WARM", "5000"))
+MAX_LEADS = int(os.getenv("ACE_LEAD_STORE_MAX", "50000"))
+
+# Lead attributes stored as same-named columns
+FIELDS = (
+    "name", "industry", "score", "stage", "compatibility", "interest",
+    "phone", "email", "adsExp", "phoneText", "emailText",
+    "lastMessage", "lastSeenSec", "notes", "notesCount", "notesClosing",
+    "survey_answers", "survey_progress",
+)
+# ISO strings on the Lead, DateTime columns in the table
+TIMES = ("survey_started_at", "survey_completed_at")
+# lists of strings on the Lead, newline-joined Text columns in the table
+LISTS = ("notesObjections",)
+
+
+def _to_dt(v: Optional[str]) -> Optional[datetime]:
+    if not v:
+        return None
+    try:
+        return datetime.fromisoformat(v)
+    except ValueError:
+        return None
+
+
+def to_row(lead: Lead, org_id: int) -> Dict[str, Any]:
+    row = {"organization_id": org_id, "sid": lead.id}
+    for f in FIELDS:
+        row[f] = getattr(lead, f)
+    row["phoneText"] = row["phoneText"] or ""
+    row["emailText"] = row["emailText"] or ""
+    for f in TIMES:
+        row[f] = _to_dt(getattr(lead, f))
+    for f in LISTS:
+        row[f] = "\n".join(sorted(getattr(lead, f) or ()))
+    return row
+
+
+def from_row(row: Any) -> Lead:
+    m = row._mapping
+    data = {f: m[f] for f in FIELDS if m[f] is not None}
+    for f in TIMES:
+        if m[f] is not None:
+            data[f] = m[f].isoformat()
+    for f in LISTS:
+        data[f] = [v for v in (m[f] or "").split("\n") if v]
+    return Lead(id=m["sid"], **data)
+
+
+class DBLeadRepository:
+    """`leads` rows of one organization via app.core.db."""
+
+    def __init__(self, org_slug: str, engine=None):
+        from app.core.db import engine as default_engine
+        from app.models.orm import Lead as LeadRow
+
+        self.org_slug = org_slug
+        self._engine = engine or default_engine
+        self._table = LeadRow.__table__
+        self._org_id: Optional[int] = None
+
+    def org_id(self) -> Optional[int]:
+        if self._org_id is None:
+            from app.models.orm import Organization
+
+            with self._engine.connect() as conn:
+                self._org_id = conn.execute(
+                    select(Organization.id).where(Organization.slug == self.org_slug)
+                ).scalar_one_or_none()
+        return self._org_id
+
+    def _columns(self):
+        t = self._table
+        return (t.c.sid, *(t.c[f] for f in (*FIELDS, *TIMES, *LISTS)))
+
+    def load(self, sid: str) -> Optional[Lead]:
+        if self.org_id() is None:
+            return None
+        t = self._table
+        stmt = select(*self._columns()).where(t.c.organization_id == self.org_id(), t.c.sid == sid)
+        with self._engine.connect() as conn:
+            row = conn.execute(stmt).first()
+        return from_row(row) if row is not None else None
+
+    def load_recent(self, limit: int) -> List[Lead]:
+        """Most recently seen leads, newest first."""
+        if self.org_id() is None:
+            return []
+        t = self._table
+        stmt = (
+            select(*self._columns())
+            .where(t.c.organization_id == self.org_id())
+            .order_by(t.c.lastSeenSec.desc(), t.c.id.desc())
+            .limit(limit)
+        )
+        with self._engine.connect() as conn:
+            return [from_row(r) for r in conn.execute(stmt)]
+
+    def aggregates(
+        self,
+        meeting_score: int,
+        close_words: Sequence[str],
+        objections: Sequence[Tuple[str, Sequence[str]]],
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Counters of LeadStore.seed() over every lead of the org, in one query
+        grouped by stage. Note flags are the stored ones (notesClosing /
+        notesObjections), or'ed with lead_service._scan_notes on the notes
+        summary for rows written before the flags were stored -- the same
+        flags LeadStore.add() gives a lead loaded from the table.
+        """
+        if self.org_id() is None:
+            return None
+        t = self._table
+        notes = func.lower(func.coalesce(t.c.notes, ""))
+        labels = func.coalesce(t.c.notesObjections, "")
+
+        def n(cond):
+            return func.coalesce(func.sum(case((cond, 1), else_=0)), 0)
+
+        def mentions(words):
+            return or_(*(notes.like(f"%{w}%") for w in words))
+
+        stmt = (
+            select(
+                t.c.stage,
+                func.count().label("total"),
+                n(t.c.score >= meeting_score).label("meeting"),
+                n(or_(t.c.phone.is_(True), t.c.email.is_(True))).label("contacts"),
+                n(func.coalesce(t.c.lastMessage, "") != "").label("interactions"),
+                n(or_(t.c.notesClosing.is_(True), mentions(close_words))).label("closing"),
+                *(
+                    n(or_(labels.contains(label), mentions(words))).label(f"objection_{i}")
+                    for i, (label, words) in enumerate(objections)
+                ),
+            )
+            .where(t.c.organization_id == self.org_id())
+            .group_by(t.c.stage)
+        )
+        out: Dict[str, Any] = {
+            "total": 0, "stages": {}, "meeting": 0, "contacts": 0, "interactions": 0,
+            "closing": 0, "objections": {label: 0 for label, _ in objections},
+        }
+        with self._engine.connect() as conn:
+            for row in conn.execute(stmt):
+                m = row._mapping
+                out["stages"][m["stage"]] = out["stages"].get(m["stage"], 0) + int(m["total"])
+                for k in ("total", "meeting", "contacts", "interactions", "closing"):
+                    out[k] += int(m[k])
+                for i, (label, _) in enumerate(objections):
+                    out["objections"][label] += int(m[f"objection_{i}"])
+        return out
+
+    def upsert(self, leads: Iterable[Lead], batch: int = BATCH) -> int:
+        """Write leads as multi-row upserts on (organization_id, sid); returns rows written."""
+        from app.core.db import dialect_insert
+
+        leads = list(leads)
+        if not leads:
+            return 0
+        org_id = self.org_id()
+        if org_id is None:
+            raise LookupError(f"organization '{self.org_slug}' not found")
+        rows = [to_row(lead, org_id) for lead in leads]
+        t = self._table
+        now = datetime.utcnow()
+        with self._engine.begin() as conn:
+            for i in range(0, len(rows), max(1, batch)):
+                chunk = [dict(r, created_at=now, updated_at=now) for r in rows[i:i + batch]]
+                stmt = dialect_insert(t, conn).values(chunk)
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=[t.c.organization_id, t.c.sid],
+                    set_={f: stmt.excluded[f] for f in (*FIELDS, *TIMES, *LISTS, "updated_at")},
+                )
+                conn.execute(stmt)
+        return len(rows)
+
+    def delete(self, sid: str) -> None:
+        if self.org_id() is None:
+            return
+        t = self._table
+        with self._engine.begin() as conn:
+            conn.execute(t.delete().where(t.c.organization_id == self.org_id(), t.c.sid == sid))
+
+
+class WriteBehind:
+    """
+    Dirty-sid set in front of a repository. mark() is O(1); flush() snapshots
+    the dirty leads (via `get`, on the caller's thread) and writes them.
+    Failed writes are re-marked and retried on the next flush.
+    """
+
+    def __init__(self, repo: DBLeadRepository, *, batch: int = BATCH):
+        self.repo = repo
+        self.batch = batch
+        self._dirty: Set[str] = set()
+        self._lock = threading.Lock()
+        self.flushes = 0
+        self.written = 0
+        self.failures = 0
+
+    def mark(self, sid: str) -> None:
+        with self._lock:
+            self._dirty.add(sid)
+
+    def discard(self, sid: str) -> None:
+        with self._lock:
+            self._dirty.discard(sid)
+
+    def is_dirty(self, sid: str) -> bool:
+        return sid in self._dirty
+
+    @property
+    def pending(self) -> int:
+        return len(self._dirty)
+
+    def take(self, get: Callable[[str], Optional[Lead]]) -> List[Lead]:
+        """Detach the dirty set and return copies of those leads still stored."""
+        with self._lock:
+            sids, self._dirty = self._dirty, set()
+        out = []
+        for sid in sids:
+            lead = get(sid)
+            if lead is not None:
+                out.append(lead.model_copy(deep=True))
+        return out
+
+    def write(self, leads: List[Lead]) -> int:
+        if not leads:
+            return 0
+        try:
+            n = self.repo.upsert(leads, self.batch)
+        except Exception:
+            logger.exception("lead_store_db: flush of %d leads failed (will retry)", len(leads))
+            self.failures += 1
+            with self._lock:
+                self._dirty.update(lead.id for lead in leads)
+            return 0
+        self.flushes += 1
+        self.written += n
+        return n
+
+    def flush(self, get: Callable[[str], Optional[Lead]]) -> int:
+        return self.write(self.take(get))
+
+    def stats(self) -> Dict[str, int]:
+        return {"pending": self.pending, "flushes": self.flushes, "written": self.written, "failures": self.failures}
+
+
+def make_write_behind() -> Optional[WriteBehind]:
+    if BACKEND not in ("db", "sql", "postgres", "postgresql"):
+        return None
+    if not ORG_SLUG:
+        logger.info("lead_store_db: no ACE_LEAD_STORE_ORG / ACE_CHAT_DEFAULT_ORG, leads kept in memory only")
+        return None
+    try:
+        return WriteBehind(DBLeadRepository(ORG_SLUG))
+    except Exception:
+        logger.exception("lead_store_db: db tier unavailable, leads kept in memory only")
+        return None
@@ -7,7 +7,7 @@ from sqlalchemy.orm import Session
 from app.models.orm import Lead
 
 def list_leads(db: Session, client_id: int, limit: int = 100) -> list[Lead]:
-    stmt = select(Lead).where(Lead.client_id == client_id).order_by(Lead.updated_at.desc()).limit(limit)
+    stmt = select(Lead).where(Lead.organization_id == client_id).order_by(Lead.updated_at.desc()).limit(limit)
     return list(db.scalars(stmt))
 
 def upsert_lead_by_sid(
@@ -17,10 +17,10 @@ def upsert_lead_by_sid(
     sid: str,
     **fields,
 ) -> Lead:
-    stmt = select(Lead).where(Lead.client_id == client_id, Lead.sid == sid).limit(1)
+    stmt = select(Lead).where(Lead.organization_id == client_id, Lead.sid == sid).limit(1)
     obj: Optional[Lead] = db.scalars(stmt).first()
     if obj is None:
-        obj = Lead(client_id=client_id, sid=sid, **fields)
+        obj = Lead(organization_id=client_id, sid=sid, **fields)
         db.add(obj)
     else:
         for k, v in fields.items():
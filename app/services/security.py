@@ -4,10 +4,19 @@ Robust password hashing utilities:
 - Prefer passlib (bcrypt)
 - Fallback to python-bcrypt if passlib isn't available
 - Dev-only final fallback (sha256) so the app can still boot
+
+ACE_BCRYPT_ROUNDS sets the bcrypt cost factor (default 12). The *_async
+wrappers run on app.core.password_pool instead of the calling thread;
+hash_password_pooled does too, blocking the (sync endpoint) caller.
 """
 from __future__ import annotations
 import hashlib
 import hmac
+import os
+
+from app.core.password_pool import pool as _password_pool
+
+BCRYPT_ROUNDS = int(os.getenv("ACE_BCRYPT_ROUNDS", "12"))
 
 # Try passlib
 try:
@@ -30,7 +39,7 @@ def _is_bcrypt_hash(h: str) -> bool:
 
 if _PASSLIB:
     # Best option
-    _pwd = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    _pwd = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
 
     def hash_password(raw: str) -> str:
         return _pwd.hash(raw)
@@ -45,7 +54,7 @@ else:
     # Fallbacks
     def hash_password(raw: str) -> str:
         if _BCRYPT:
-            return _bcrypt.hashpw(raw.encode("utf-8"), _bcrypt.gensalt()).decode("utf-8")
+            return _bcrypt.hashpw(raw.encode("utf-8"), _bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode("utf-8")
         # DEV-ONLY weak fallback so app still runs
         return "sha256$" + hashlib.sha256(raw.encode("utf-8")).hexdigest()
 
@@ -67,5 +76,17 @@ else:
         return hmac.compare_digest(raw, hashed)
 
 
+def hash_password_pooled(raw: str) -> str:
+    return _password_pool.call(hash_password, raw)
+
+
+async def hash_password_async(raw: str) -> str:
+    return await _password_pool.run(hash_password, raw)
+
+
+async def verify_password_async(raw: str, hashed: str) -> bool:
+    return await _password_pool.run(verify_password, raw, hashed)
+
+
 def looks_like_hash(s: str) -> bool:
     return isinstance(s, str) and (s.startswith("$2") or s.startswith("sha256$"))
@@ -0,0 +1,222 @@
+# app/services/survey_cache.py
+"""
+Live survey definitions by (org_slug, survey_slug), for the chat survey path.
+
+An entry holds the ids and the compiled flow (node index + choice-score maps,
+see flow_graph.CompiledFlow), so /chat/survey/submit resolves its survey
+without touching the DB once warm. "No such live survey" is cached as well
+(compiled=None), for a shorter time.
+
+The public survey page (/s/{org_slug}/{survey_slug}, /a, /b) is cached the
+same way as pre-serialized JSON bodies with their ETags (public_page), so a
+landing page load is a dict lookup and, with If-None-Match, a 304.
+
+Admin writes in app/api/surveys.py call invalidate(). It drops the entries
+here and publishes a "survey_cache.invalidate" event on the internal
+INVALIDATE_TOPIC of the event bus; every worker drops the same entries when
+the event reaches its bus. With the default local transport only this worker
+hears it, so run several workers with ACE_EVENT_BUS_TRANSPORT=sqlite (or any
+cross-process transport); otherwise the TTL bounds how long other workers
+may serve an edited or unpublished survey.
+
+Env:
+  ACE_SURVEY_CACHE_TTL       seconds a resolved survey is kept (default 300)
+  ACE_SURVEY_CACHE_MISS_TTL  seconds a miss is kept (default 30)
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+from typing import Any, Dict, FrozenSet, NamedTuple, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.core.cache import TTLCache
+from app.services import ab_assign, event_bus, flow_graph
+
+logger = logging.getLogger("ace.survey_cache")
+
+CACHE_TTL = float(os.getenv("ACE_SURVEY_CACHE_TTL", "300"))
+MISS_TTL = float(os.getenv("ACE_SURVEY_CACHE_MISS_TTL", "30"))
+INVALIDATE_TOPIC = event_bus.INTERNAL_PREFIX + "survey_cache"
+
+
+class SurveyDef(NamedTuple):
+    org_id: Optional[int]
+    survey_id: Optional[int]
+    compiled: Optional[flow_graph.CompiledFlow]  # None: no live survey with a flow
+
+
+_defs = TTLCache(maxsize=2048, ttl=CACHE_TTL)
+
+
+def _load(db: Session, org_slug: str, survey_slug: str) -> SurveyDef:
+    from app.models.orm import Organization, Survey
+
+    org_id = db.query(Organization.id).filter(
+        Organization.slug == org_slug,
+        Organization.active == True
+    ).scalar()
+    if org_id is None:
+        return SurveyDef(None, None, None)
+    survey = db.query(Survey).filter(
+        Survey.slug == survey_slug,
+        Survey.organization_id == org_id,
+        Survey.status == "live"
+    ).first()
+    if not survey or not survey.flow_json:
+        return SurveyDef(org_id, survey.id if survey else None, None)
+    compiled = flow_graph.compile_flow(
+        survey.flow_json,
+        version=("survey", survey.id, survey.updated_at),
+    )
+    return SurveyDef(org_id, survey.id, compiled if len(compiled) else None)
+
+
+def resolve(db: Session | None, org_slug: str | None, survey_slug: str | None) -> Optional[SurveyDef]:
+    """Cached definition of the live survey, or None when it cannot be looked up."""
+    if not (org_slug and survey_slug):
+        return None
+    key = (org_slug, survey_slug)
+    d = _defs.get(key)
+    if d is not None:
+        return d
+    if db is None:
+        return None
+    d = _load(db, org_slug, survey_slug)
+    _defs.set(key, d, ttl=CACHE_TTL if d.compiled is not None else MISS_TTL)
+    return d
+
+
+def count_questions(survey: Any) -> int:
+    """Number of nodes in the survey's flow (variant A for A/B tests)."""
+    if survey.survey_type == "regular" and survey.flow_json:
+        flow = survey.flow_json
+    elif survey.survey_type == "ab_test":
+        # Use variant A for counting (both should have same number)
+        flow = survey.variant_a_flow
+    else:
+        return 0
+    if not flow or not isinstance(flow, dict):
+        return 0
+    nodes = flow.get("nodes", [])
+    return len(nodes) if isinstance(nodes, (list, dict)) else 0
+
+
+class PublicSurvey(NamedTuple):
+    org_id: Optional[int]
+    survey_id: Optional[int]
+    survey_type: Optional[str]
+    # variant (None for a regular survey, "a" / "b") -> (etag, JSON body)
+    pages: Dict[Optional[str], Tuple[str, bytes]]
+    configured: FrozenSet[str] = frozenset()  # A/B variants that have a flow
+    buckets: Optional[ab_assign.Buckets] = None  # traffic split over `configured`
+    questions: int = 0  # node count, for response progress
+    missing: Optional[str] = None  # "org" | "survey" when there is nothing to serve
+
+
+_public = TTLCache(maxsize=2048, ttl=CACHE_TTL)
+
+
+def _page(body: Dict[str, Any]) -> Tuple[str, bytes]:
+    # same encoding as starlette's JSONResponse
+    raw = json.dumps(body, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":"), default=str).encode("utf-8")
+    return '"%s"' % hashlib.sha1(raw).hexdigest()[:20], raw
+
+
+def _load_public(db: Session, org_slug: str, survey_slug: str) -> PublicSurvey:
+    from app.models.orm import Organization, Survey
+
+    org = db.query(Organization).filter(
+        Organization.slug == org_slug,
+        Organization.active == True
+    ).first()
+    if not org:
+        return PublicSurvey(None, None, None, {}, missing="org")
+    survey = db.query(Survey).filter(
+        Survey.slug == survey_slug,
+        Survey.organization_id == org.id,
+        Survey.status == "live"
+    ).first()
+    if not survey:
+        return PublicSurvey(org.id, None, None, {}, missing="survey")
+
+    def body(variant: Optional[str], flow: Any) -> Dict[str, Any]:
+        return {
+            "survey_id": survey.id,
+            "name": survey.name,
+            "slug": survey.slug,
+            "org_slug": org.slug,
+            "survey_type": survey.survey_type,
+            "variant": variant,
+            "flow": flow,
+        }
+
+    if survey.survey_type == "ab_test":
+        flows = {"a": survey.variant_a_flow, "b": survey.variant_b_flow}
+        pages = {v: _page(body(v, flow)) for v, flow in flows.items()}
+        configured = frozenset(v for v, flow in flows.items() if flow)
+        buckets = ab_assign.buckets_for({v: f for v, f in flows.items() if f}) if configured else None
+    else:
+        pages = {None: _page(body(None, survey.flow_json))}
+        configured, buckets = frozenset(), None
+    return PublicSurvey(
+        org.id, survey.id, survey.survey_type, pages, configured, buckets, questions=count_questions(survey)
+    )
+
+
+def public_page(db: Session, org_slug: str, survey_slug: str) -> PublicSurvey:
+    """Cached public view of a live survey (live flows cannot be edited, so the bodies stay valid)."""
+    key = (org_slug, survey_slug)
+    p = _public.get(key)
+    if p is None:
+        p = _load_public(db, org_slug, survey_slug)
+        _public.set(key, p, ttl=CACHE_TTL if p.missing is None else MISS_TTL)
+    return p
+
+
+def _drop(org_id: Optional[int], survey_id: Optional[int]) -> int:
+    n = 0
+    for cache in (_defs, _public):
+        if org_id is None and survey_id is None:
+            n += len(cache)
+            cache.clear()
+            continue
+        stale = [
+            k for k, d in cache.items()
+            if (org_id is not None and d.org_id == org_id) or (survey_id is not None and d.survey_id == survey_id)
+        ]
+        n += sum(cache.pop(k, None) is not None for k in stale)
+    if survey_id is not None:
+        flow_graph.invalidate(lambda k: isinstance(k, tuple) and k[:2] == ("survey", survey_id))
+    if n:
+        logger.debug("survey_cache: invalidated %d entries org=%s survey=%s", n, org_id, survey_id)
+    return n
+
+
+def invalidate(*, org_id: Optional[int] = None, survey_id: Optional[int] = None) -> int:
+    """
+    Drop cached definitions and public pages of a survey / an organization
+    (all when both are None), here and on every other worker. Entries of the
+    org are dropped too, so slug changes and newly published surveys are
+    picked up at once.
+    """
+    n = _drop(org_id, survey_id)
+    event_bus.publish_threadsafe(
+        INVALIDATE_TOPIC, "survey_cache.invalidate", {"org_id": org_id, "survey_id": survey_id}, broadcast=False
+    )
+    return n
+
+
+def _on_invalidate(evt: dict) -> None:
+    payload = evt.get("payload") or {}
+    _drop(payload.get("org_id"), payload.get("survey_id"))
+
+
+event_bus.listen(INVALIDATE_TOPIC, _on_invalidate)
+
+
+def stats() -> Dict[str, Any]:
+    return {"definitions": _defs.stats(), "public_pages": _public.stats()}
@@ -0,0 +1,200 @@
+# app/services/survey_stats.py
+"""
+Survey statistics from the `survey_stats` rollup (one row per survey and
+variant), so GET /stats reads at most three small rows however many
+responses a survey has.
+
+The rollup is kept current by the public survey endpoints, inside the same
+transaction as the response write:
+  record_submit()      new response, or a score change on an existing one
+  record_completion()  a response marked completed
+
+rebuild() recomputes a survey's rows from survey_responses with one grouped
+query (conditional aggregates, portable between SQLite and Postgres) and
+upserts them in the caller's transaction. It runs the first time a survey's
+stats are read, and on demand as a repair path. Until a survey's rows exist,
+record_*() updates touch nothing, so a partial rollup is never mistaken for
+a complete one.
+
+On Postgres a rebuild holds a transaction-level advisory lock on the survey
+exclusively, and every record_*() update holds it shared: concurrent
+rebuilds serialize, and no increment can commit between a rebuild's read and
+its upsert (which would be overwritten). SQLite serializes writers itself.
+
+The table is created with the schema (bootstrap_db.create_all()).
+"""
+from __future__ import annotations
+
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Mapping, Optional
+
+from sqlalchemy import case, delete, extract, func, select, text, update
+from sqlalchemy.orm import Session
+
+from app.core.db import dialect_insert
+from app.models.orm import SurveyResponse, SurveyStatsRollup
+
+logger = logging.getLogger("ace.survey_stats")
+
+VARIANTS = ("", "a", "b")
+
+# first key of the two-int pg advisory locks taken on a survey's rollup
+LOCK_NAMESPACE = 0x5353  # "SS"
+
+_table = SurveyStatsRollup.__table__
+
+
+def _lock(db: Session, survey_id: int, *, shared: bool) -> None:
+    """Advisory lock on the survey's rollup until the transaction ends (Postgres only)."""
+    if db.get_bind().dialect.name != "postgresql":
+        return
+    fn = "pg_advisory_xact_lock_shared" if shared else "pg_advisory_xact_lock"
+    db.execute(text(f"SELECT {fn}(:ns, :id)"), {"ns": LOCK_NAMESPACE, "id": survey_id})
+
+
+def _seconds_between(start, end, dialect: str):
+    """SQL expression for (end - start) in seconds (Postgres prod / SQLite dev)."""
+    if dialect == "postgresql":
+        return extract("epoch", end - start)
+    return (func.julianday(end) - func.julianday(start)) * 86400.0
+
+
+def _duration(started_at: Optional[datetime], completed_at: Optional[datetime]) -> Optional[float]:
+    if started_at is None or completed_at is None:
+        return None
+    return (completed_at - started_at).total_seconds()
+
+
+def _bump(db: Session, survey_id: int, variant: Optional[str], **deltas: float) -> None:
+    """Atomic `col = col + delta` on one rollup row (no-op until the survey is built)."""
+    deltas = {k: v for k, v in deltas.items() if v}
+    if not deltas:
+        return
+    _lock(db, survey_id, shared=True)
+    c = _table.c
+    db.execute(
+        update(_table)
+        .where(c.survey_id == survey_id, c.variant == (variant or ""))
+        .values(updated_at=datetime.utcnow(), **{k: c[k] + v for k, v in deltas.items()})
+    )
+
+
+def record_submit(db: Session, row: Mapping[str, Any], *, created: bool, old_score: int = 0) -> None:
+    """
+    Call before committing a submitted response, with its survey_responses row
+    as written (new, or an update of `old_score`).
+    """
+    score_delta = 0
+    if row["survey_completed_at"] is not None:
+        score_delta = (row["score"] or 0) - (0 if created else old_score or 0)
+    _bump(
+        db, row["survey_id"], row["variant"],
+        responses=1 if created else 0,
+        completed_score_sum=score_delta,
+    )
+
+
+def record_completion(
+    db: Session,
+    response: SurveyResponse,
+    *,
+    previous_completed_at: Optional[datetime] = None,
+) -> None:
+    """Call before committing a response whose survey_completed_at was just set."""
+    new_secs = _duration(response.survey_started_at, response.survey_completed_at)
+    if previous_completed_at is None:
+        deltas: Dict[str, float] = {"completed": 1, "completed_score_sum": response.score or 0}
+        old_secs = None
+    else:
+        # completed again: only the duration moves
+        deltas = {}
+        old_secs = _duration(response.survey_started_at, previous_completed_at)
+    deltas["timed_completions"] = (new_secs is not None) - (old_secs is not None)
+    deltas["completion_seconds_sum"] = (new_secs or 0.0) - (old_secs or 0.0)
+    _bump(db, response.survey_id, response.variant, **deltas)
+
+
+def rebuild(db: Session, survey_id: int) -> List[Dict[str, Any]]:
+    """
+    Recompute the survey's rollup rows from survey_responses (one grouped
+    query) and upsert them; the caller commits.
+    """
+    _lock(db, survey_id, shared=False)
+    r = SurveyResponse
+    done = r.survey_completed_at.isnot(None)
+    timed = done & r.survey_started_at.isnot(None)
+    secs = _seconds_between(r.survey_started_at, r.survey_completed_at, db.get_bind().dialect.name)
+    stmt = (
+        select(
+            func.coalesce(r.variant, "").label("variant"),
+            func.count(r.id).label("responses"),
+            func.count(r.survey_completed_at).label("completed"),
+            func.coalesce(func.sum(case((done, r.score), else_=0)), 0).label("completed_score_sum"),
+            func.count(case((timed, r.id))).label("timed_completions"),
+            func.coalesce(func.sum(case((timed, secs), else_=0.0)), 0.0).label("completion_seconds_sum"),
+        )
+        .where(r.survey_id == survey_id)
+        .group_by(r.variant)
+    )
+    found = {row.variant: row._asdict() for row in db.execute(stmt)}
+    now = datetime.utcnow()
+    rows = []
+    for v in sorted(set(VARIANTS) | set(found)):
+        row = found.get(v) or {
+            "variant": v, "responses": 0, "completed": 0, "completed_score_sum": 0,
+            "timed_completions": 0, "completion_seconds_sum": 0.0,
+        }
+        rows.append({
+            "survey_id": survey_id,
+            **row,
+            "completed_score_sum": int(row["completed_score_sum"] or 0),
+            "completion_seconds_sum": float(row["completion_seconds_sum"] or 0.0),
+            "updated_at": now,
+        })
+    c = _table.c
+    db.execute(delete(_table).where(c.survey_id == survey_id, c.variant.notin_([row["variant"] for row in rows])))
+    stmt = dialect_insert(_table, db.get_bind()).values(rows)
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[c.survey_id, c.variant],
+        set_={k: stmt.excluded[k] for k in rows[0] if k not in ("survey_id", "variant")},
+    ))
+    return rows
+
+
+def forget(db: Session, survey_id: int) -> None:
+    """Drop a survey's rollup rows (survey deleted); the caller commits."""
+    db.execute(delete(_table).where(_table.c.survey_id == survey_id))
+
+
+def stats(db: Session, survey_id: int, *, refresh: bool = False) -> Dict[str, Any]:
+    """
+    Totals and per-variant figures for a survey:
+      {"total_responses", "completed_responses", "avg_score",
+       "avg_completion_time_minutes", "variants": {variant: {"responses", "avg_score"}}}
+    """
+    rows: List[Any] = []
+    if not refresh:
+        rows = [r._asdict() for r in db.execute(select(_table).where(_table.c.survey_id == survey_id))]
+    if not rows:
+        rows = rebuild(db, survey_id)
+        db.commit()
+
+    def avg(total: float, n: int) -> float:
+        return float(total) / n if n else 0.0
+
+    responses = sum(r["responses"] for r in rows)
+    completed = sum(r["completed"] for r in rows)
+    timed = sum(r["timed_completions"] for r in rows)
+    return {
+        "total_responses": responses,
+        "completed_responses": completed,
+        "avg_score": avg(sum(r["completed_score_sum"] for r in rows), completed),
+        "avg_completion_time_minutes": (
+            round(sum(r["completion_seconds_sum"] for r in rows) / timed / 60.0, 2) if timed else None
+        ),
+        "variants": {
+            r["variant"]: {"responses": r["responses"], "avg_score": avg(r["completed_score_sum"], r["completed"])}
+            for r in rows
+        },
+    }
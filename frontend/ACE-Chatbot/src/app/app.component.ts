@@ -995,11 +995,13 @@ export class AppComponent implements OnInit, OnDestroy, AfterViewInit {
       next: (response) => {
         this.i('Organization avatar response:', response);
         
-        if (response.avatar_url) {
+        // The chat header shows a small photo: prefer the thumbnail variant
+        const photoUrl: string | null = response.avatar_thumb_url || response.avatar_url;
+        if (photoUrl) {
           // Prepend backend URL if it's a relative path
-          this.agentPhotoUrl = response.avatar_url.startsWith('http') 
-            ? response.avatar_url 
-            : `${this.backendUrl}${response.avatar_url}`;
+          this.agentPhotoUrl = photoUrl.startsWith('http') 
+            ? photoUrl 
+            : `${this.backendUrl}${photoUrl}`;
           this.i('Agent photo URL set to:', this.agentPhotoUrl);
         } else {
           this.i('No avatar_url in response - using default');
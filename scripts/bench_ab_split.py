@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Offline simulation of sticky A/B assignment (app.services.ab_assign).
+
+Simulates N visitors (random sids) against a split and reports:
+- observed vs configured share per variant, with a chi-square statistic
+- stickiness: every repeat visit of a sid gets the same variant
+- decision cost with and without the session fast path
+- with --resplit, the share of visitors that move when the split changes:
+  none for remembered visitors, and for the hash alone (new worker, lost
+  session) vs the minimum any assignment could achieve
+
+Usage:
+    python scripts/bench_ab_split.py --split a:50,b:50 --visitors 200000
+    python scripts/bench_ab_split.py --split a:70,b:20,c:10 --survey-id 42 --repeats 3
+    python scripts/bench_ab_split.py --split a:50,b:50 --resplit a:60,b:40
+"""
+
+import argparse
+import sys
+import time
+import uuid
+from collections import Counter
+from pathlib import Path
+
+# Add project root to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.services import ab_assign
+
+
+def simulate(split: str, visitors: int, repeats: int, survey_id: int, resplit: str = "") -> bool:
+    weights = ab_assign.parse_split(split)
+    buckets = ab_assign.Buckets(weights.items())
+    shares = buckets.shares()
+    sids = [uuid.uuid4().hex for _ in range(visitors)]
+    sessions = {}
+
+    t0 = time.perf_counter()
+    first = [ab_assign.assign(survey_id, sid, buckets, sessions) for sid in sids]
+    cold = time.perf_counter() - t0
+
+    flips = 0
+    t0 = time.perf_counter()
+    for _ in range(repeats):
+        for sid, v in zip(sids, first):
+            flips += ab_assign.assign(survey_id, sid, buckets, sessions) != v
+    warm = time.perf_counter() - t0
+
+    # hash decision alone must be stable too (what a new worker would compute)
+    flips += sum(ab_assign.assign(survey_id, sid, buckets) != v for sid, v in zip(sids, first))
+
+    counts = Counter(first)
+    chi2 = sum((counts[v] - visitors * p) ** 2 / (visitors * p) for v, p in shares.items() if p > 0)
+    dof = max(1, len(shares) - 1)
+
+    print(f"split={split} visitors={visitors} survey_id={survey_id}")
+    print(f"{'variant':>8} {'configured':>11} {'observed':>9} {'count':>9}")
+    for v, p in shares.items():
+        print(f"{v:>8} {p:>10.2%} {counts[v] / visitors:>9.2%} {counts[v]:>9}")
+    print(f"chi2={chi2:.2f} (dof={dof}; ~{dof + 3 * (2 * dof) ** 0.5:.1f} is the 99.9% bound)")
+    print(f"flips={flips} over {repeats} repeat visits + 1 stateless re-check per sid")
+    print(f"decision: {cold / visitors * 1e6:.2f} us/visitor (hash), "
+          f"{warm / max(1, visitors * repeats) * 1e6:.2f} us/visit (session)")
+
+    if resplit:
+        after = ab_assign.Buckets(ab_assign.parse_split(resplit).items())
+        kept = sum(ab_assign.assign(survey_id, sid, after, sessions) != v for sid, v in zip(sids, first))
+        moved = sum(ab_assign.assign(survey_id, sid, after) != v for sid, v in zip(sids, first)) / visitors
+        new_shares = after.shares()
+        minimum = sum(max(0.0, p - new_shares.get(v, 0.0)) for v, p in shares.items())
+        print(f"resplit={resplit}: {kept} remembered visitors moved; "
+              f"hash alone moves {moved:.2%} (minimum {minimum:.2%})")
+        flips += kept
+    return flips == 0 and chi2 <= dof + 3 * (2 * dof) ** 0.5
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--split", default=ab_assign.DEFAULT_SPLIT)
+    parser.add_argument("--visitors", type=int, default=100000)
+    parser.add_argument("--repeats", type=int, default=2)
+    parser.add_argument("--survey-id", type=int, default=1)
+    parser.add_argument("--resplit", default="", help="second split to measure how many visitors move")
+    args = parser.parse_args()
+    ok = simulate(args.split, args.visitors, args.repeats, args.survey_id, args.resplit)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Login burst benchmark: bcrypt inline vs on the password pool
+(app.core.password_pool).
+
+Runs an in-process FastAPI app (httpx ASGITransport, no network) with
+  POST /login-inline   sync endpoint, bcrypt on the shared threadpool (old)
+  POST /login-pooled   async endpoint, bcrypt on the password pool (new)
+  GET  /ping           sync endpoint standing in for unrelated dashboard calls
+and, for each login mode, fires --logins concurrent logins while a steady
+stream of /ping requests runs. Reports login throughput and /ping latency
+(p50 / p99 / max).
+
+Usage:
+    python scripts/bench_password_pool.py --logins 200 --concurrency 64
+    ACE_BCRYPT_ROUNDS=10 ACE_PASSWORD_WORKERS=2 python scripts/bench_password_pool.py
+"""
+
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from pathlib import Path
+
+# Add project root to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import httpx
+from fastapi import FastAPI
+
+from app.auth import security
+from app.core.password_pool import pool
+
+HASHED = security.hash_password("s3cret")
+
+
+def build_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.post("/login-inline")
+    def login_inline():
+        return {"ok": security.verify_password("s3cret", HASHED)}
+
+    @app.post("/login-pooled")
+    async def login_pooled():
+        return {"ok": await security.verify_password_async("s3cret", HASHED)}
+
+    @app.get("/ping")
+    def ping():
+        return {"ok": True}
+
+    return app
+
+
+def pct(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+async def run(mode: str, logins: int, concurrency: int, ping_interval: float) -> dict:
+    transport = httpx.ASGITransport(app=build_app())
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        sem = asyncio.Semaphore(concurrency)
+        done = asyncio.Event()
+        ping_ms = []
+
+        async def login():
+            async with sem:
+                r = await client.post(f"/login-{mode}")
+                assert r.status_code == 200 and r.json()["ok"], r.text
+
+        async def pinger():
+            while not done.is_set():
+                t0 = time.perf_counter()
+                await client.get("/ping")
+                ping_ms.append((time.perf_counter() - t0) * 1000)
+                await asyncio.sleep(ping_interval)
+
+        pingers = [asyncio.create_task(pinger()) for _ in range(4)]
+        t0 = time.perf_counter()
+        await asyncio.gather(*(login() for _ in range(logins)))
+        elapsed = time.perf_counter() - t0
+        done.set()
+        await asyncio.gather(*pingers)
+
+    return {
+        "mode": mode,
+        "logins_per_s": logins / elapsed,
+        "pings": len(ping_ms),
+        "ping_p50_ms": statistics.median(ping_ms) if ping_ms else 0.0,
+        "ping_p99_ms": pct(ping_ms, 99),
+        "ping_max_ms": max(ping_ms) if ping_ms else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--ping-interval", type=float, default=0.01)
+    args = parser.parse_args()
+
+    print(f"bcrypt rounds={security.BCRYPT_ROUNDS} pool={pool.kind} workers={pool.workers} "
+          f"queue_max={pool.queue_max} logins={args.logins} concurrency={args.concurrency}")
+    print(f"{'mode':>8} {'logins/s':>9} {'pings':>6} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for mode in ("inline", "pooled"):
+        r = asyncio.run(run(mode, args.logins, args.concurrency, args.ping_interval))
+        print(f"{r['mode']:>8} {r['logins_per_s']:>9.1f} {r['pings']:>6} "
+              f"{r['ping_p50_ms']:>8.1f} {r['ping_p99_ms']:>8.1f} {r['ping_max_ms']:>8.1f}")
+    print(f"pool: {pool.stats()}")
+    pool.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Migration script to prepare an existing `leads` table for the write-behind
+lead store (app/services/lead_store_db.py). New databases get all of this
+from Base.metadata.create_all().
+
+- adds the phoneText, emailText, notesCount, notesClosing and
+  notesObjections columns
+- removes duplicate (organization_id, sid) rows, keeping the newest
+- creates the unique (organization_id, sid) index the upserts rely on, and
+  (organization_id, lastSeenSec) for the startup warm-up
+
+Safe to run repeatedly (SQLite and PostgreSQL).
+"""
+
+import sys
+import os
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.core.db import engine
+from sqlalchemy import inspect, text
+
+COLUMNS = {
+    "phoneText": "VARCHAR(64) DEFAULT ''",
+    "emailText": "VARCHAR(255) DEFAULT ''",
+    "notesCount": "INTEGER DEFAULT 0",
+    "notesClosing": "BOOLEAN DEFAULT FALSE",
+    "notesObjections": "TEXT DEFAULT ''",
+}
+
+DEDUPE = (
+    "DELETE FROM leads WHERE id NOT IN ("
+    "SELECT MAX(id) FROM leads GROUP BY organization_id, sid)"
+)
+
+INDEXES = [
+    'CREATE UNIQUE INDEX IF NOT EXISTS uq_leads_org_sid ON leads (organization_id, sid)',
+    'CREATE INDEX IF NOT EXISTS ix_leads_org_seen ON leads (organization_id, "lastSeenSec")',
+]
+
+
+def migrate():
+    print("🔄 Preparing leads table for the write-behind lead store...")
+    existing = {c["name"] for c in inspect(engine).get_columns("leads")}
+    with engine.begin() as conn:
+        for name, ddl in COLUMNS.items():
+            if name not in existing:
+                conn.execute(text(f'ALTER TABLE leads ADD COLUMN "{name}" {ddl}'))
+                print(f"  ✓ added column {name}")
+        removed = conn.execute(text(DEDUPE)).rowcount
+        if removed:
+            print(f"  ✓ removed {removed} duplicate (organization_id, sid) leads")
+        for ddl in INDEXES:
+            conn.execute(text(ddl))
+            print(f"  ✓ {ddl.split(' ON ')[0].split()[-1]}")
+    print("✅ Done.")
+
+
+if __name__ == "__main__":
+    migrate()
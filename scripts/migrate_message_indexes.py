@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""
+Migration script to add the messages (ts_epoch, id) index to an existing
+database. New databases get it from Base.metadata.create_all(); this is for
+tables created before the index was added to app/models/orm.py.
+
+Without it, every GET /chats/all page on the db chat store backend scans and
+sorts the whole messages table.
+
+Safe to run repeatedly (CREATE INDEX IF NOT EXISTS, SQLite and PostgreSQL).
+"""
+
+import sys
+import os
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.core.db import engine
+from sqlalchemy import text
+
+INDEXES = [
+    # newest messages across all conversations (chat_store_db.read_recent)
+    "CREATE INDEX IF NOT EXISTS ix_messages_ts_id ON messages (ts_epoch, id)",
+]
+
+
+def migrate():
+    print("🔄 Adding messages indexes...")
+    with engine.begin() as conn:
+        for ddl in INDEXES:
+            conn.execute(text(ddl))
+            print(f"  ✓ {ddl.split(' ON ')[0].split()[-1]}")
+    print("✅ Done.")
+
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Migration script to add survey_responses indexes to an existing database.
+New databases get them from Base.metadata.create_all(); this is for tables
+created before the index was added to app/models/orm.py.
+
+Safe to run repeatedly (CREATE INDEX IF NOT EXISTS, SQLite and PostgreSQL).
+Before the unique (survey_id, sid) index, duplicate responses are removed,
+keeping the newest row of each pair (rebuild survey stats afterwards with
+GET .../surveys/{id}/stats?refresh=true).
+"""
+
+import sys
+import os
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.core.db import engine
+from sqlalchemy import text
+
+# Duplicate (survey_id, sid) rows predate the unique index; keep the newest
+DEDUPE = (
+    "DELETE FROM survey_responses WHERE id NOT IN ("
+    "SELECT MAX(id) FROM survey_responses GROUP BY survey_id, sid)"
+)
+
+INDEXES = [
+    # keyset pagination of GET /surveys/{id}/responses
+    "CREATE INDEX IF NOT EXISTS ix_responses_survey_created_id "
+    "ON survey_responses (survey_id, created_at, id)",
+    # submit upserts on (survey_id, sid)
+    "CREATE UNIQUE INDEX IF NOT EXISTS uq_responses_survey_sid "
+    "ON survey_responses (survey_id, sid)",
+]
+
+
+def migrate():
+    print("🔄 Adding survey_responses indexes...")
+    with engine.begin() as conn:
+        removed = conn.execute(text(DEDUPE)).rowcount
+        if removed:
+            print(f"  ✓ removed {removed} duplicate (survey_id, sid) responses")
+        for ddl in INDEXES:
+            conn.execute(text(ddl))
+            print(f"  ✓ {ddl.split(' ON ')[0].split()[-1]}")
+    print("✅ Done.")
+
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,46 @@
+from collections import Counter
+
+from app.services import ab_assign
+
+
+def test_buckets_follow_weights_for_any_number_of_variants():
+    b = ab_assign.Buckets([("a", 70), ("b", 20), ("c", 10)])
+    assert b.shares() == {"a": 0.7, "b": 0.2, "c": 0.1}
+    counts = Counter(b.pick(i) for i in range(ab_assign.BUCKETS))
+    assert counts == {"a": 7000, "b": 2000, "c": 1000}
+    assert ab_assign.buckets_for({"a": {"traffic_weight": 1}, "b": {"traffic_weight": 3}}).shares() == {"a": 0.25, "b": 0.75}
+    assert ab_assign.buckets_for({"a": {}, "b": {}}, "a:90,b:10").shares() == {"a": 0.9, "b": 0.1}
+
+
+def test_assignment_is_sticky_and_remembered_in_session():
+    b = ab_assign.Buckets([("a", 50), ("b", 50)])
+    sessions = {}
+    first = {sid: ab_assign.assign(7, sid, b, sessions) for sid in map(str, range(2000))}
+    assert 900 < sum(v == "a" for v in first.values()) < 1100
+    assert all(ab_assign.assign(7, sid, b) == v for sid, v in first.items())  # stateless == remembered
+    assert sessions["5"]["ab"]["7"] == first["5"]
+
+    # a split change does not move visitors that already have a variant
+    skewed = ab_assign.Buckets([("a", 1), ("b", 99)])
+    assert all(ab_assign.assign(7, sid, skewed, sessions) == v for sid, v in first.items())
+
+    # a split change only moves visitors whose bucket changed owner
+    shifted = ab_assign.Buckets([("a", 60), ("b", 40)])
+    moved = [sid for sid, v in first.items() if ab_assign.assign(7, sid, shifted) != v]
+    assert all(first[sid] == "b" for sid in moved) and len(moved) < 300
+
+
+def test_remembered_variant_does_not_break_the_chat_flow():
+    from app.api import chat
+    from app.models.chat import ChatRequest
+    from app.services.flow_sessions import FlowSessionStore
+
+    sessions = FlowSessionStore(None, ttl=None)
+    variant = ab_assign.assign(7, "v1", ab_assign.Buckets([("a", 50), ("b", 50)]), sessions)
+    assert sessions["v1"] == {"ab": {"7": variant}}
+
+    # the visitor's first chat message starts the flow like any new sid's does
+    reply = chat.handle_flow(ChatRequest(message="", sid="v1"), sessions)
+    fresh = chat.handle_flow(ChatRequest(message="", sid="fresh"), sessions)
+    assert reply["ui"] == fresh["ui"] and reply["storyComplete"] == fresh["storyComplete"]
+    assert sessions["v1"]["node"] == "welcome" and sessions["v1"]["ab"] == {"7": variant}
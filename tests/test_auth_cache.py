@@ -0,0 +1,61 @@
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from app.auth import permissions, security
+from app.models.orm import Organization, User
+
+
+def _db():
+    engine = create_engine("sqlite://")
+    for model in (Organization, User):
+        model.__table__.create(engine)
+    queries = []
+    event.listen(engine, "before_cursor_execute", lambda *a: queries.append(a[2]))
+    db = sessionmaker(bind=engine)()
+    org = Organization(slug="auth-org", name="Auth")
+    db.add(org)
+    db.commit()
+    user = User(username="cache-user", email="c@example.com", hashed_password="x",
+                role="org_user", organization_id=org.id, is_active=True)
+    db.add(user)
+    db.commit()
+    return db, org, user, queries
+
+
+def _auth(db, token):
+    return permissions.get_auth_context(authorization=f"Bearer {token}", db=db)
+
+
+def test_verified_tokens_are_cached_and_bad_ones_are_not():
+    token = security.create_token({"sub": "u", "user_id": 1, "organization_id": 1, "role": "org_user"})
+    assert security.verify_token(token)["sub"] == "u"
+    assert security._token_key(token) in security._verified
+    assert security.verify_token(token + "x") is None
+    assert security._token_key(token + "x") not in security._verified
+
+
+def test_active_user_cached_until_invalidated():
+    db, org, user, queries = _db()
+    token = security.create_token(
+        {"sub": user.username, "user_id": user.id, "organization_id": org.id, "role": user.role}
+    )
+    permissions.invalidate_user(user.id)
+
+    assert _auth(db, token).user_id == user.id
+    before = len(queries)
+    assert _auth(db, token).user_id == user.id
+    assert len(queries) == before  # served from the caches
+
+    user.is_active = False
+    db.commit()
+    permissions.invalidate_user(user.id)
+    with pytest.raises(HTTPException) as exc:
+        _auth(db, token)
+    assert exc.value.status_code == 401
+
+    user.is_active = True
+    db.commit()
+    permissions.invalidate_org(org.id)
+    assert _auth(db, token).user_id == user.id
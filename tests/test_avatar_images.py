@@ -0,0 +1,89 @@
+import asyncio
+import io
+
+import pytest
+from PIL import Image
+
+from app.services import avatar_images
+
+
+def _png(w=900, h=600, mode="RGBA"):
+    buf = io.BytesIO()
+    Image.new(mode, (w, h), (200, 30, 30, 255) if mode == "RGBA" else (200, 30, 30)).save(buf, "PNG")
+    return buf.getvalue()
+
+
+def test_render_writes_every_size_once(tmp_path):
+    content = _png()
+    digest = avatar_images.content_hash(content)
+    names = avatar_images.render(content, str(tmp_path), digest, (64, 128, 512))
+    assert sorted(names) == sorted(avatar_images.file_names(digest, (64, 128, 512)))
+    with Image.open(tmp_path / f"{digest}-64.webp") as small:
+        assert small.format == "WEBP" and max(small.size) == 64
+    with Image.open(tmp_path / f"{digest}-512.png") as fallback:
+        assert fallback.size == (512, 341)
+    assert not list(tmp_path.glob(".*.tmp"))
+
+    with pytest.raises(avatar_images.InvalidImage):
+        avatar_images.render(b"not an image", str(tmp_path), "x" * 20)
+
+
+def test_upload_is_content_addressed(tmp_path, monkeypatch):
+    monkeypatch.setattr(avatar_images, "AVATAR_DIR", tmp_path)
+    content = _png(mode="RGB")
+    try:
+        url = asyncio.run(avatar_images.process_upload(content))
+        assert asyncio.run(avatar_images.process_upload(content)) == url  # dedup: same files
+        with pytest.raises(avatar_images.InvalidImage):
+            asyncio.run(avatar_images.process_upload(b"\x89PNG broken"))
+    finally:
+        avatar_images.shutdown()
+
+    variants = avatar_images.variants(url)
+    assert url.endswith("-512.png") and variants["fallback"] == url
+    assert set(variants) == {str(s) for s in avatar_images.SIZES} | {"fallback"}
+    assert all(p.exists() for p in avatar_images.files_of(url))
+    assert avatar_images.variants("/static/avatars/0123abcd.jpg") == {}
+
+    avatar_images.remove_files(url)
+    assert not list(tmp_path.iterdir())
+    assert avatar_images.variants(url) == {"fallback": url}
+
+
+@pytest.mark.filterwarnings("ignore::PIL.Image.DecompressionBombWarning")
+def test_oversized_image_is_rejected_before_decoding(tmp_path, monkeypatch):
+    monkeypatch.setattr(avatar_images, "MAX_PIXELS", 100)
+    with pytest.raises(avatar_images.InvalidImage, match="too large"):
+        avatar_images.render(_png(10, 15), str(tmp_path), "a" * 20)  # under Pillow's own 2x error
+    assert not list(tmp_path.iterdir())
+
+
+def test_variants_follow_stored_sizes(tmp_path, monkeypatch):
+    monkeypatch.setattr(avatar_images, "AVATAR_DIR", tmp_path)
+    content = _png()
+    digest = avatar_images.content_hash(content)
+    avatar_images.render(content, str(tmp_path), digest, (64, 128, 512))
+    url = f"{avatar_images.AVATAR_URL_PREFIX}{digest}-512.png"
+
+    monkeypatch.setattr(avatar_images, "SIZES", (48, 96, 512))  # config changed since
+    variants = avatar_images.variants(url)
+    assert list(variants) == ["64", "128", "512", "fallback"]
+    assert avatar_images.thumb(url).endswith(f"{digest}-64.webp")
+    assert all((tmp_path / u.rsplit("/", 1)[1]).exists() for u in variants.values())
+    assert avatar_images.thumb("/static/avatars/0123abcd.jpg") == "/static/avatars/0123abcd.jpg"
+
+
+def test_broken_worker_pool_is_replaced(tmp_path, monkeypatch):
+    import os
+    from concurrent.futures.process import BrokenProcessPool
+
+    monkeypatch.setattr(avatar_images, "AVATAR_DIR", tmp_path)
+    broken = avatar_images._pool()
+    with pytest.raises(BrokenProcessPool):
+        broken.submit(os._exit, 1).result()  # a worker dies
+    try:
+        url = asyncio.run(avatar_images.process_upload(_png(64, 64)))
+        assert avatar_images._executor is not broken
+        assert all(p.exists() for p in avatar_images.files_of(url))
+    finally:
+        avatar_images.shutdown()
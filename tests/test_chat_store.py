@@ -0,0 +1,164 @@
+import json
+
+import pytest
+
+from app.core.cache import TTLCache
+from app.services import chat_store
+from app.services.chat_log import SegmentedChatLog
+
+
+def _entry(sid, ts, text):
+    msg = {"sid": sid, "role": "user", "text": text, "timestamp": ts}
+    return sid, ts, (json.dumps(msg) + "\n").encode()
+
+
+def test_batch_writer_preserves_order_and_flushes():
+    written, fsyncs = [], []
+
+    def sink(batch, fsync):
+        written.extend(batch)
+        fsyncs.append(fsync)
+
+    w = chat_store._BatchWriter(sink, batch_max=16, flush_interval=0.05, fsync_policy="none", fsync_secs=1)
+    for i in range(100):
+        w.submit(i)
+    assert w.flush(timeout=5)
+    assert written == list(range(100))
+    assert 1 < w.stats()["batches"] < 100
+    assert not any(fsyncs)
+
+    w.close()
+    w.submit(100)  # written through after close
+    assert written[-1] == 100
+
+
+def test_segmented_log_reads_by_sid_and_rotates(tmp_path):
+    legacy = tmp_path / "chat_store.jsonl"
+    legacy.write_text(
+        json.dumps({"sid": "old", "role": "user", "text": "legacy", "timestamp": 1}) + "\n"
+        + "not json\n"
+    )
+    log = SegmentedChatLog(str(legacy), segment_max_bytes=1024)
+    for i in range(60):
+        log.append([_entry(f"s{i % 3}", 10 + i, f"m{i}")])
+
+    assert log.segments() > 2  # legacy + rotated segments
+    assert [m["text"] for m in log.read_sid("old")] == ["legacy"]
+    assert [m["text"] for m in log.read_sid("s1")] == [f"m{i}" for i in range(1, 60, 3)]
+    assert log.counts() == (4, 61)
+    assert [m["text"] for m in log.read_recent(2)] == ["m58", "m59"]
+
+    # reopening does not rescan anything and sees the same data
+    again = SegmentedChatLog(str(legacy), segment_max_bytes=1024)
+    assert again.counts() == (4, 61)
+    assert len(again.read_sid("s0")) == 20
+
+
+def test_segmented_log_recovers_unindexed_tail(tmp_path):
+    log = SegmentedChatLog(str(tmp_path / "chat_store.jsonl"))
+    log.append([_entry("a", 1, "one")])
+    # simulate a crash after the segment write but before the index commit
+    seg_path = tmp_path / "chat_store.000001.jsonl"
+    with open(seg_path, "ab") as f:
+        f.write(_entry("a", 2, "two")[2])
+    reopened = SegmentedChatLog(str(tmp_path / "chat_store.jsonl"))
+    assert [m["text"] for m in reopened.read_sid("a")] == ["one", "two"]
+
+
+def test_db_log_batches_and_keyset_pages(tmp_path):
+    from sqlalchemy import create_engine, insert
+
+    from app.core.db import Base
+    from app.models.orm import Organization
+    from app.services.chat_store_db import DBChatLog
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'chat.db'}")
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(Organization), [{"name": "Acme", "slug": "acme"}])
+
+    log = DBChatLog(default_org="acme", engine=engine)
+    msg = lambda sid, ts: {"sid": sid, "role": "user", "text": f"{sid}-{ts}", "timestamp": ts}
+    log.append_messages([(None, msg("a", t)) for t in range(1, 6)] + [("acme", msg("b", 1))])
+    log.append_messages([("acme", msg("a", 6)), ("nope", msg("c", 1))])
+
+    assert [m["timestamp"] for m in log.read_sid("a")] == [1, 2, 3, 4, 5, 6]
+    assert [m["timestamp"] for m in log.read_sid_page("a", after_ts=2, limit=2)] == [3, 4]
+    assert [m["timestamp"] for m in log.read_sid_page("a", before_ts=5, limit=2)] == [3, 4]
+    assert log.counts() == (2, 7)
+    assert (log.count_at(1), log.count_at(1, sid="a")) == (2, 1)
+    assert log.dropped == 1
+    assert log.stats()["conversation_cache"]["hits"] >= 1
+
+    # /chats/all pages walk an index instead of sorting the messages table
+    with engine.connect() as conn:
+        plan = conn.exec_driver_sql(
+            "EXPLAIN QUERY PLAN SELECT id FROM messages ORDER BY ts_epoch DESC, id DESC LIMIT 5"
+        ).all()
+    assert "ix_messages_ts_id" in str(plan)
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    """chat_store on a log under tmp_path instead of the repo's data/."""
+    chat_store.flush(timeout=5)
+    monkeypatch.setattr(chat_store, "_log", SegmentedChatLog(str(tmp_path / "chat_store.jsonl")))
+    monkeypatch.setattr(chat_store, "_hot", TTLCache(maxsize=100))
+    yield chat_store
+    chat_store.flush(timeout=5)
+
+
+def test_list_all_flat_merges_pending_and_stored_pages(store):
+    base = 1_000_000
+    for i in range(6):
+        store.append_message(f"flat-{i % 3}", role="user", text=str(i), ts=base + i)
+
+    before = store.list_all_flat(4)  # some may still be queued for the writer
+    assert store.flush(timeout=5)
+    after = store.list_all_flat(4)
+    assert [m["timestamp"] for m in before] == [m["timestamp"] for m in after] == [base + i for i in range(2, 6)]
+
+    older = store.list_all_flat(2, before_ts=base + 2)
+    assert [m["text"] for m in older] == ["0", "1"]
+    newer = store.list_all_flat(2, after_ts=base + 1)
+    assert [m["text"] for m in newer] == ["2", "3"]
+    assert [m["text"] for m in store.list_messages_page("flat-0", before_ts=base + 3, limit=5)] == ["0"]
+
+
+def test_cursors_do_not_skip_messages_sharing_a_second(store):
+    for i in range(7):  # one burst: every message in the same second
+        store.append_message(f"tie-{i % 2}", role="user", text=str(i), ts=500)
+        if i == 3:
+            assert store.flush(timeout=5)  # 0-3 stored, 4-6 still queued
+
+    page, seen = store.page_all(3), []
+    while page.messages:
+        seen[:0] = [m["text"] for m in page.messages]
+        page = store.page_all(3, before=page.before)
+    assert seen == [str(i) for i in range(7)]
+
+    page, seen = store.page_all(3, after=(500, 0)), []
+    while page.messages:
+        seen += [m["text"] for m in page.messages]
+        store.flush(timeout=5)  # the writer draining between pages keeps positions valid
+        page = store.page_all(3, after=page.after)
+    assert seen == [str(i) for i in range(7)]
+
+    store.append_message("tie-0", role="user", text="late", ts=500)
+    assert [m["text"] for m in store.page_all(3, after=page.after).messages] == ["late"]
+
+    first = store.page_messages("tie-0", limit=2)
+    rest = store.page_messages("tie-0", after=first.after, limit=10)
+    assert [m["text"] for m in first.messages + rest.messages] == ["0", "2", "4", "6", "late"]
+
+
+def test_read_consistent_retries_when_a_commit_overlaps(monkeypatch):
+    reads = []
+
+    def read():
+        reads.append(1)
+        if len(reads) == 1:  # a batch commits while the first read is running
+            monkeypatch.setattr(chat_store, "_commit_gen", chat_store._commit_gen + 2)
+        return len(reads)
+
+    assert chat_store._read_consistent(read, lambda stored: stored) == 2
@@ -0,0 +1,56 @@
+from app.services import flow_graph
+
+
+FLOW = {
+    "version": "t1",
+    "nodes": [
+        {
+            "id": "q1",
+            "texts": ["Pick one"],
+            "choices": [
+                {"title": "A", "payload": "pa", "score": 10, "next": "q2"},
+                {"title": "B", "score": -5, "next": "missing"},
+                {"title": "C", "payload": {"fit": "good"}, "action": "qualify_tag", "next": "q2"},
+            ],
+        },
+        {"id": "q2", "openInput": True, "score": 30, "next": "done"},
+        {"id": "done", "texts": ["Bye"]},
+    ],
+}
+
+
+def test_compiled_flow_lookups():
+    cf = flow_graph.CompiledFlow(FLOW)
+    assert len(cf) == 3
+    assert cf.node("q2")["score"] == 30
+    assert cf.node("nope") is None
+    assert cf.next_node("q2")["id"] == "done"
+    assert cf.next_node("done") is None
+
+
+def test_compiled_flow_choices():
+    cf = flow_graph.CompiledFlow(FLOW)
+    by_title = cf.match_choice("q1", "A")
+    assert by_title is cf.match_choice("q1", "pa")
+    assert cf.choice_next(by_title)["id"] == "q2"
+    assert cf.choice_next(cf.match_choice("q1", "B")) is None
+    # dict payloads are never matched against the raw message
+    assert cf.match_choice("q1", "C")["action"] == "qualify_tag"
+    assert cf.match_choice("q1", "zzz") is None
+
+
+def test_compiled_flow_answer_score():
+    cf = flow_graph.CompiledFlow(FLOW)
+    assert cf.answer_score("q1", "A") == 10
+    assert cf.answer_score("q1", "B") == -5
+    assert cf.answer_score("q1", "pa") is None  # scoring matches on title only
+    assert cf.answer_score("q2", "anything") == 30
+    assert cf.answer_score("done", "x") is None
+
+
+def test_compile_flow_cached_per_version():
+    flow_graph.invalidate()
+    a = flow_graph.compile_flow(FLOW, version=("test", 1))
+    assert flow_graph.compile_flow(FLOW, version=("test", 1)) is a
+    assert flow_graph.compile_flow(FLOW, version=("test", 2)) is not a
+    assert flow_graph.invalidate(lambda k: k[0] == "test") == 2
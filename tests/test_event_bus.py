@@ -0,0 +1,171 @@
+import asyncio
+
+from app.services import event_bus
+
+
+def test_long_poll_wakes_only_interested_topic():
+    async def run():
+        a = asyncio.create_task(event_bus.long_poll("lp-a", 0, timeout=2))
+        b = asyncio.create_task(event_bus.long_poll("lp-b", 0, timeout=0.3))
+        await asyncio.sleep(0.05)
+        assert event_bus._waiters["lp-a"] and event_bus._waiters["lp-b"]
+
+        await event_bus.publish("lp-a", "message.created", {"n": 1})
+        got = await asyncio.wait_for(a, 1)
+        assert [e["payload"] for e in got] == [{"n": 1}]
+        assert "lp-a" not in event_bus._waiters
+        assert not b.done()  # untouched topic keeps sleeping
+        assert await b == []
+        assert "lp-b" not in event_bus._waiters
+
+    asyncio.run(run())
+
+
+def test_long_poll_keeps_waiting_until_timeout_after_unrelated_wakeup():
+    async def run():
+        since = event_bus._seq.get("*", 0)
+        poll = asyncio.create_task(event_bus.long_poll("*", since, timeout=2))
+        await asyncio.sleep(0.05)
+        await event_bus.publish("lp-c", "lead.touched", {})
+        got = await asyncio.wait_for(poll, 1)
+        assert [e["sid"] for e in got] == ["lp-c"]
+
+        # a sid poller is not woken by other sids
+        seq = event_bus._seq.get("lp-d", 0)
+        poll = asyncio.create_task(event_bus.long_poll("lp-d", seq, timeout=0.3))
+        await asyncio.sleep(0.05)
+        await event_bus.publish("lp-e", "lead.touched", {})
+        await asyncio.sleep(0.05)
+        assert not poll.done()
+        assert await poll == []
+
+    asyncio.run(run())
+
+
+def test_ring_since_wraps_and_returns_stored_events():
+    ring = event_bus._Ring(4)
+    for seq in range(1, 8):
+        ring.append(seq, {"_seq": seq})
+    assert len(ring) == 4
+    assert [e["_seq"] for e in ring.since(0)] == [4, 5, 6, 7]
+    assert [e["_seq"] for e in ring.since(5)] == [6, 7]
+    assert [e["_seq"] for e in ring.since(2, limit=3)] == [5, 6, 7]
+    assert ring.since(7) == []
+    assert ring.since(5)[0] is ring.since(4)[1]  # no per-read copies
+
+    sparse = event_bus._Ring(500)
+    for seq in (3, 9):
+        sparse.append(seq, {"_seq": seq})
+    assert len(sparse.evts) == 2  # grows with its events, not preallocated
+    assert [e["_seq"] for e in sparse.since(3)] == [9] and sparse.first_seq == 3
+
+
+def test_collect_since_merges_sid_and_broadcast():
+    async def run():
+        await event_bus.publish("cs-a", "message.created", {"n": 1})
+        await event_bus.publish_all("heartbeat", {})
+        seq_a = event_bus._seq["cs-a"]
+        assert [e["_seq"] for e in event_bus.collect_since("cs-a", seq_a - 1)] == [seq_a]
+        merged = event_bus.collect_since("cs-a", 0, include_broadcast=True)
+        assert {e["sid"] for e in merged} >= {"cs-a", "*"}
+        assert [e["_seq"] for e in merged] == sorted(e["_seq"] for e in merged)
+
+    asyncio.run(run())
+
+
+def test_sqlite_transport_shares_events_and_seqs_across_workers(tmp_path):
+    from app.services.event_transport import SQLiteTransport
+
+    path = str(tmp_path / "bus.sqlite")
+
+    async def run():
+        seen = {"w1": [], "w2": []}
+
+        def deliver_to(name):
+            def deliver(records):
+                seen[name].extend((topic, seq, evt["payload"]) for topic, seq, evt, _ in records)
+                return [0] * len(records)
+            return deliver
+
+        w1 = SQLiteTransport(path, poll_interval=0.01)
+        w2 = SQLiteTransport(path, poll_interval=0.01)
+        await w1.start(deliver_to("w1"))
+        await w2.start(deliver_to("w2"))
+
+        await w1.send([("s1", {"payload": 1}, False), ("*", {"payload": 1}, False)])
+        await w2.send([("s1", {"payload": 2}, False), ("*", {"payload": 2}, False)])
+        await w1.send([("*", {"payload": 3}, True)])
+        await asyncio.sleep(0.1)
+
+        assert seen["w1"] == seen["w2"] == [
+            ("s1", 1, 1), ("*", 1, 1), ("s1", 2, 2), ("*", 2, 2), ("*", 3, 3),
+        ]
+
+        # a worker started later replays recent history with the same seqs
+        w3_seen = []
+        w3 = SQLiteTransport(path)
+        await w3.start(lambda records: w3_seen.extend((t, s) for t, s, _, _ in records) or [0] * len(records))
+        assert w3_seen == [("s1", 1), ("*", 1), ("s1", 2), ("*", 2), ("*", 3)]
+        for w in (w1, w2, w3):
+            await w.close()
+
+    asyncio.run(run())
+
+
+def _evt(seq, type_="message.created", sid="bp"):
+    return {"type": type_, "sid": sid, "_seq": seq}
+
+
+def test_subscription_overflow_policies():
+    async def run():
+        drop = event_bus.Subscription("bp", policy="drop_oldest", maxsize=2)
+        for i in range(1, 5):
+            drop.offer(_evt(i))
+        assert [(await drop.get())["_seq"] for _ in range(2)] == [3, 4]
+        assert drop.stats()["dropped"] == 2
+
+        co = event_bus.Subscription("bp", policy="coalesce", maxsize=2)
+        co.offer(_evt(1, "lead.touched"))
+        co.offer(_evt(2))
+        co.offer(_evt(3, "lead.touched"))
+        assert [(await co.get())["_seq"] for _ in range(2)] == [2, 3]
+        assert co.stats()["coalesced"] == 1
+
+        dc = event_bus.Subscription("bp", policy="disconnect", maxsize=2)
+        dc.offer(_evt(1))
+        assert (await dc.get())["_seq"] == 1
+        for i in range(2, 5):
+            dc.offer(_evt(i))
+        try:
+            await dc.get()
+            raise AssertionError("expected SubscriberLagged")
+        except event_bus.SubscriberLagged as e:
+            assert e.last_seq == 1
+
+    asyncio.run(run())
+
+
+def test_sse_stream_resumes_from_last_event_id():
+    from app.api.chat_events import sse_stream
+
+    async def run():
+        for i in range(3):
+            await event_bus.publish("sse-r", "message.created", {"n": i})
+        first = event_bus._seq["sse-r"] - 2
+
+        stream = sse_stream("sse-r", last_event_id=first)
+        assert (await stream.__anext__()).startswith("retry:")
+        replayed = [await stream.__anext__() for _ in range(2)]
+        assert [f.split("\n")[0] for f in replayed] == [f"id: {first + 1}", f"id: {first + 2}"]
+
+        await event_bus.publish("sse-r", "message.created", {"n": 3})
+        live = await asyncio.wait_for(stream.__anext__(), 1)
+        assert live.startswith(f"id: {first + 3}\n")
+        await stream.aclose()
+        assert "sse-r" not in event_bus._subscribers
+
+        _, complete = event_bus.resume_since("sse-r", 0)
+        assert complete
+        assert event_bus.resume_since("sse-r", first)[0][0]["_seq"] == first + 1
+
+    asyncio.run(run())
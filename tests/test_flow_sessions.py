@@ -0,0 +1,131 @@
+from app.services.flow_sessions import FlowSessionBackend, FlowSessionStore
+
+
+class DictBackend(FlowSessionBackend):
+    """Stand-in durable tier shared by several 'workers'."""
+
+    def __init__(self):
+        self.rows = {}
+        self.saves = 0
+
+    def load(self, sid):
+        row = self.rows.get(sid)
+        return (dict(row[0]), row[1]) if row else None
+
+    def save(self, sid, state, expected):
+        self.saves += 1
+        version = self.rows.get(sid, (None, 0))[1]
+        if version != expected:
+            return None
+        self.rows[sid] = (dict(state), version + 1)
+        return version + 1
+
+    def delete(self, sid):
+        self.rows.pop(sid, None)
+
+    def purge(self, older_than):
+        return 0
+
+
+def test_local_tier_is_bounded():
+    store = FlowSessionStore(None, maxsize=3, ttl=None)
+    for i in range(10):
+        store[f"s{i}"] = {"node": "q1"}
+    assert len(store) == 3
+    assert "s0" not in store
+    assert store["s9"] == {"node": "q1"}
+
+
+def test_inplace_mutation_persisted_on_save_only_when_changed():
+    backend = DictBackend()
+    store = FlowSessionStore(backend, ttl=None)
+    store["a"] = {"node": "q1"}
+    assert backend.saves == 1
+    store["a"]["waiting_input"] = True
+    store.save("a")
+    store.save("a")
+    assert backend.saves == 2
+    assert backend.rows["a"][0] == {"node": "q1", "waiting_input": True}
+
+
+def test_state_shared_across_workers_and_restarts():
+    backend = DictBackend()
+    w1 = FlowSessionStore(backend, ttl=None)
+    w2 = FlowSessionStore(backend, ttl=None)
+
+    w1["sid"] = {"node": "q1"}
+    assert w2["sid"] == {"node": "q1"}
+
+    w2["sid"]["node"] = "q2"
+    w2.save("sid")
+    w1.refresh("sid")
+    assert w1["sid"]["node"] == "q2"
+
+    restarted = FlowSessionStore(backend, ttl=None)
+    assert "sid" in restarted
+    assert restarted.get("sid") == {"node": "q2"}
+
+
+def test_async_refresh_and_save_new_sid_loads_once():
+    import asyncio
+
+    backend = DictBackend()
+    loads = []
+    backend_load = backend.load
+    backend.load = lambda sid: loads.append(sid) or backend_load(sid)
+    store = FlowSessionStore(backend, ttl=None)
+
+    async def request():
+        await store.arefresh("new")
+        assert "new" not in store and store.get("new") is None  # no second lookup
+        store.setdefault("new", {})["node"] = "welcome"
+        await store.asave("new")
+
+    asyncio.run(request())
+    assert loads == ["new"]
+    assert backend.rows["new"][0] == {"node": "welcome"}
+
+
+def test_concurrent_writer_loses_and_reloads():
+    backend = DictBackend()
+    w1 = FlowSessionStore(backend, ttl=None)
+    w2 = FlowSessionStore(backend, ttl=None)
+    w1["sid"] = {"node": "q1"}
+    w2.refresh("sid")
+
+    w1["sid"]["node"] = "q2"
+    w1.save("sid")
+    w2["sid"]["node"] = "q3"  # based on the stale version
+    w2.save("sid")
+    assert backend.rows["sid"] == ({"node": "q2"}, 2)
+    assert w2["sid"] == {"node": "q2"}
+
+
+def test_async_save_writes_a_snapshot():
+    import asyncio
+    import threading
+
+    backend = DictBackend()
+    seen, gate = [], threading.Event()
+    backend_save = backend.save
+
+    def slow_save(sid, state, expected):
+        gate.wait(5)
+        seen.append(state)
+        return backend_save(sid, state, expected)
+
+    backend.save = slow_save
+    store = FlowSessionStore(backend, ttl=None)
+    store.setdefault("a", {})["node"] = "q1"
+
+    async def request():
+        task = asyncio.ensure_future(store.asave("a"))
+        await asyncio.sleep(0)  # snapshot taken, write handed to a thread
+        store["a"]["node"] = "q2"  # mutated on the loop while the write is in flight
+        gate.set()
+        await task
+
+    asyncio.run(request())
+    assert seen == [{"node": "q1"}]
+    store.save("a")  # the later mutation is still unsaved
+    assert backend.rows["a"] == ({"node": "q2"}, 2)
@@ -0,0 +1,199 @@
+from app.models.lead import Lead
+from app.services.lead_service import LeadStore, update_lead
+from app.services import lead_service
+
+
+def test_store_keeps_score_order_and_indexes():
+    store = LeadStore()
+    for sid, score, stage in [("a", 50, "Pogovori"), ("b", 90, "Interested"), ("c", 50, "Cold")]:
+        store.add(Lead(id=sid, score=score, stage=stage))
+    assert [l.id for l in store.ordered()] == ["b", "a", "c"]  # ties keep insertion order
+    assert store.add(Lead(id="a", score=1)).score == 50  # no duplicates
+
+    lead = store.get("c")
+    lead.score, lead.stage, lead.email = 95, "Interested", True
+    store.reindex(lead)
+    assert [l.id for l in store.ordered()] == ["c", "b", "a"]
+    assert store.stage_counts() == {"Pogovori": 1, "Interested": 2}
+    assert store.with_contact() == {"c"}
+    assert store.count_score_at_least(90) == 2
+
+    assert store.remove("b").id == "b"
+    assert store.remove("b") is None
+    assert [l.id for l in store.ordered()] == ["c", "a"]
+    assert [l.id for l in store.in_stage("Interested")] == ["c"]
+
+
+def test_module_api_uses_indexed_store():
+    lead_service.add_lead(Lead(id="ls-1", score=10))
+    update_lead("ls-1", score=99, phone=True)
+    assert lead_service.get_all_leads()[0].id == "ls-1"
+    lead_service.upsert_contact("ls-2", email="x@example.com")
+    assert lead_service.get_lead("ls-2").stage == "Pogovori"
+    assert lead_service.get_kpis()["contacts"] >= 2
+    assert lead_service.delete_lead("ls-1") and lead_service.delete_lead("ls-2")
+    assert lead_service.get_lead("ls-1") is None
+
+
+def test_aggregates_follow_updates_notes_and_deletes():
+    store = LeadStore()
+    a = store.add(Lead(id="a", stage="Interested", notes="price is an issue"))
+    b = store.add(Lead(id="b", stage="Cold"))
+    assert (store.contacts, store.interactions, store.closing) == (0, 0, 0)
+    assert store.objections["💸 Price too high"] == 1
+
+    b.phone, b.lastMessage = True, "hi"
+    store.reindex(b)
+    assert (store.contacts, store.interactions) == (1, 1)
+
+    b.notes = "ready to close the deal"
+    store.note_appended(b, b.notes)
+    store.note_appended(a, "need partner approval")
+    assert store.closing == 1
+    assert store.objections["👥 Need partner approval"] == 1
+
+    store.remove("a")
+    assert store.objections["💸 Price too high"] == 0
+    store.remove("b")
+    assert (store.contacts, store.interactions, store.closing) == (0, 0, 0)
+
+
+def test_kpi_delta_published_on_bus():
+    import asyncio
+
+    from app.services import event_bus
+
+    async def run():
+        since = event_bus.last_seq(lead_service.KPI_TOPIC)
+        lead_service.add_lead(Lead(id="kpi-1", stage="Interested"))
+        lead_service.upsert_contact("kpi-1", phone="123")
+        lead_service.append_note(lead_service.get_lead("kpi-1"), "timing is bad")
+        await asyncio.sleep(0)  # coalesced into one publish
+        await asyncio.sleep(0)
+        events = event_bus.collect_since(lead_service.KPI_TOPIC, since)
+        assert len(events) == 1 and events[0]["type"] == "kpi.delta"
+        assert events[0]["payload"]["kpis"]["contacts"] == lead_service.get_kpis()["contacts"]
+        assert not any(e["sid"] == lead_service.KPI_TOPIC for e in event_bus.collect_since("*", 0))
+
+        assert await lead_service.adelete_lead("kpi-1")
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        delta = event_bus.collect_since(lead_service.KPI_TOPIC, since)[-1]["payload"]
+        assert "visitors" in delta["kpis"]
+
+        # a visitor sid cannot publish into the KPI topic
+        last = event_bus.last_seq(lead_service.KPI_TOPIC)
+        assert await event_bus.publish(lead_service.KPI_TOPIC, "message.created", {}) == 0
+        assert event_bus.last_seq(lead_service.KPI_TOPIC) == last
+        assert not lead_service._kpi_tasks
+
+    asyncio.run(run())
+
+
+def test_lead_notes_ring_summary_and_pages():
+    from app.services.lead_notes import LeadNotes
+
+    notes = LeadNotes(maxlen=5)
+    for i in range(1, 9):
+        notes.add("n-1", f"note {i}", "qual" if i % 2 else "score", ts=1000 + i)
+    assert notes.count("n-1") == 8
+    assert notes.summary("n-1") == "note 6 | note 7 | note 8"
+
+    items, cursor = notes.page("n-1", limit=3)
+    assert [e["seq"] for e in items] == [8, 7, 6] and cursor == 6
+    assert items[0] == {"seq": 8, "ts": 1008, "kind": "score", "text": "note 8"}
+    items, cursor = notes.page("n-1", before=cursor, limit=3)
+    assert [e["seq"] for e in items] == [5, 4] and cursor is None  # 1..3 evicted, no spill
+
+    notes.drop("n-1")
+    assert notes.page("n-1") == ([], None)
+
+
+class _DictSpill:
+    """Stand-in for the lead_notes table."""
+
+    def __init__(self):
+        self.rows = {}
+
+    def write(self, rows):
+        for sid, e in rows:
+            assert (sid, e["seq"]) not in self.rows
+            self.rows[(sid, e["seq"])] = dict(e)
+
+    def read(self, sid, before, limit):
+        seqs = sorted((q for s, q in self.rows if s == sid and (before is None or q < before)), reverse=True)
+        return [self.rows[(sid, q)] for q in seqs[:limit]]
+
+    def max_seqs(self, sids):
+        return {s: max(q for t, q in self.rows if t == s) for s in sids if any(t == s for t, _ in self.rows)}
+
+    def delete(self, sids):
+        self.rows = {k: v for k, v in self.rows.items() if k[0] not in sids}
+
+
+def test_lead_notes_spill_is_deferred_bounded_and_survives_restart():
+    from app.services.lead_notes import LeadNotes
+
+    spill = _DictSpill()
+    notes = LeadNotes(spill, maxlen=3, max_rings=2)
+    for i in range(1, 6):
+        notes.add("a", f"a{i}", ts=i)
+    assert spill.rows == {}  # nothing written on the request path
+    assert [e["seq"] for e in notes.page("a", limit=10)[0]] == [5, 4, 3, 2, 1]
+
+    notes.add("b", "b1")
+    notes.add("c", "c1")  # LRU: a's ring leaves memory and is spilled whole
+    assert notes.stats()["rings"] == 2
+    assert notes.flush() == 5
+    items, cursor = notes.page("a", limit=2)
+    assert [e["text"] for e in items] == ["a5", "a4"] and cursor == 4
+
+    restarted = LeadNotes(spill, maxlen=3)
+    assert [e["seq"] for e in restarted.page("a", limit=10)[0]] == [5, 4, 3, 2, 1]
+    restarted.prime(["a"])
+    assert restarted.add("a", "a6")["seq"] == 6
+    assert restarted.add("b", "b2", seq_floor=1)["seq"] == 2
+
+    restarted.drop("a")
+    assert restarted.page("a") == ([], None)
+    restarted.flush()
+    assert not any(sid == "a" for sid, _ in spill.rows)
+
+
+def test_append_note_keeps_summary_short():
+    lead = lead_service.add_lead(Lead(id="notes-1"))
+    for i in range(50):
+        lead_service.append_note(lead, f"Survey [q{i}]: answer {i}", "survey")
+    assert lead.notesCount == 50
+    assert lead.notes.endswith("answer 49") and "answer 40" not in lead.notes
+    items, _ = lead_service.get_notes("notes-1", limit=2)
+    assert [e["text"] for e in items] == ["Survey [q49]: answer 49", "Survey [q48]: answer 48"]
+    lead_service.delete_lead("notes-1")
+    assert lead_service.get_notes("notes-1") == ([], None)
+
+
+def test_survey_score_is_incremental_and_matches_full_rescore():
+    scores = {"yes": 10, "no": -5}
+    calls = []
+
+    def scorer(node_id, value):
+        calls.append(node_id)
+        return scores.get(value)
+
+    lead_service.update_survey_progress("survey-1", 10, {f"q{i}": "yes" for i in range(60)})
+    lead = lead_service.get_lead("survey-1")
+    st = lead_service.survey_score(lead, scorer, version=1)
+    assert (st.total, st.count, len(calls)) == (600, 60, 60)
+
+    calls.clear()
+    lead_service.update_survey_answer("survey-1", "q3", "no")
+    lead_service.update_survey_progress("survey-1", 20, dict(lead.survey_answers, q60="maybe"))
+    st = lead_service.survey_score(lead, scorer, version=1)
+    assert sorted(calls) == ["q3", "q60"]  # only changed nodes rescored
+    assert (st.total, st.count) == (585, 60)
+    assert st.total == lead_service.rescore_survey(lead, scorer, version=1).total
+
+    calls.clear()
+    assert lead_service.survey_score(lead, scorer, version=2).total == 585
+    assert len(calls) == 61  # new flow version -> full rescore
+    lead_service.delete_lead("survey-1")
@@ -0,0 +1,130 @@
+from sqlalchemy import create_engine, insert
+from sqlalchemy.pool import StaticPool
+
+from app.models.lead import Lead
+from app.models.orm import Lead as LeadRow, Organization
+from app.services import lead_service
+from app.services.lead_store_db import DBLeadRepository, WriteBehind
+
+
+def _store():
+    # one shared connection: preload() reads from a worker thread
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    for model in (Organization, LeadRow):
+        model.__table__.create(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(Organization.__table__).values(slug="leads-org", name="Leads"))
+    return WriteBehind(DBLeadRepository("leads-org", engine=engine), batch=2)
+
+
+def test_dirty_leads_flush_as_upserts_and_load_back():
+    store = _store()
+    leads = {sid: Lead(id=sid, score=i * 10, lastSeenSec=i) for i, sid in enumerate(("a", "b", "c"), 1)}
+    for sid in leads:
+        store.mark(sid)
+    store.mark("a")
+    assert store.flush(leads.get) == 3  # one row per lead, batches of 2
+    assert store.pending == 0
+
+    leads["a"].score, leads["a"].emailText = 99, "a@example.com"
+    leads["a"].survey_started_at = "2026-01-01T12:00:00"
+    store.mark("a")
+    store.flush(leads.get)
+
+    a = store.repo.load("a")
+    assert (a.score, a.emailText, a.survey_started_at) == (99, "a@example.com", "2026-01-01T12:00:00")
+    assert store.repo.load("zzz") is None
+    assert [l.id for l in store.repo.load_recent(2)] == ["c", "b"]
+
+    store.repo.delete("b")
+    assert store.repo.load("b") is None
+
+
+def test_failed_flush_is_retried():
+    store = _store()
+    store.repo.upsert = lambda leads, batch: (_ for _ in ()).throw(RuntimeError("db down"))
+    store.mark("a")
+    assert store.flush({"a": Lead(id="a")}.get) == 0
+    assert store.pending == 1 and store.failures == 1
+
+
+def test_lead_service_hydrates_marks_and_evicts(monkeypatch):
+    store = _store()
+    monkeypatch.setattr(lead_service, "_store", store)
+    monkeypatch.setattr(lead_service, "_leads", lead_service.LeadStore())
+    store.repo.upsert([Lead(id="cold-1", score=77, stage="Interested", lastSeenSec=1)])
+
+    lead = lead_service.get_lead("cold-1")  # miss -> hydrated from the table
+    assert (lead.score, lead.stage) == (77, "Interested")
+    lead_service.update_lead(lead, score=80)
+    assert store.is_dirty("cold-1")
+    assert lead_service.flush_leads() == 1
+    assert store.repo.load("cold-1").score == 80
+
+    lead_service.add_lead(Lead(id="hot-1", lastSeenSec=2))
+    assert lead_service._evict(limit=1) == 1  # cold-1 is clean; hot-1 still dirty
+    assert "cold-1" not in lead_service._leads and "hot-1" in lead_service._leads
+    assert lead_service.get_lead("cold-1").score == 80
+
+    assert lead_service.delete_lead("cold-1") and store.repo.load("cold-1") is None
+
+
+def test_aggregates_are_seeded_from_the_table_and_survive_eviction(monkeypatch):
+    import asyncio
+
+    store = _store()
+    monkeypatch.setattr(lead_service, "_store", store)
+    monkeypatch.setattr(lead_service, "_leads", lead_service.LeadStore())
+    monkeypatch.setattr(lead_service, "_missing", lead_service.TTLCache(maxsize=100, ttl=60))
+    store.repo.upsert([
+        Lead(id="s1", score=90, stage="Interested", email=True, lastMessage="hi", notes="price is high", lastSeenSec=1),
+        Lead(id="s2", score=40, stage="Cold", notes="Ready to close", lastSeenSec=2),
+        Lead(id="s3", score=60, stage="Interested", phone=True, lastSeenSec=3),
+    ])
+    assert lead_service.seed_aggregates() and lead_service.warm_leads(limit=1) == 1  # only s3 resident
+    kpis = lead_service.get_kpis()
+    assert (kpis["visitors"], kpis["contacts"], kpis["interactions"], kpis["activeLeads"]) == (3, 2, 1, 2)
+    assert lead_service.get_funnel() == {"awareness": 100, "interest": 66, "meeting": 33, "close": 33}
+    assert lead_service.get_objections() == ["💸 Price too high (1)"]
+
+    asyncio.run(lead_service.preload("s1"))  # hydrated off the loop, already counted
+    lead_service.add_lead(Lead(id="new-1", stage="Interested", lastSeenSec=9))
+    assert lead_service.get_kpis()["visitors"] == 4
+    assert lead_service.flush_leads() == 1
+    assert lead_service._evict(limit=1) == 2 and lead_service.get_kpis()["visitors"] == 4
+    assert lead_service._leads.stage_count("Interested") == 3
+
+    assert lead_service.get_lead("nobody") is None and "nobody" in lead_service._missing
+    load, store.repo.load = store.repo.load, lambda sid: (_ for _ in ()).throw(AssertionError("miss is cached"))
+    assert lead_service.get_lead("nobody") is None
+    store.repo.load = load
+
+    assert lead_service.delete_lead("new-1") and lead_service.get_kpis()["visitors"] == 3
+
+    # async delete: s2 is not resident, it is hydrated so it leaves the counters
+    assert "s2" not in lead_service._leads
+    assert asyncio.run(lead_service.adelete_lead("s2")) and store.repo.load("s2") is None
+    assert lead_service.get_kpis()["visitors"] == 2 and lead_service.get_funnel()["close"] == 0
+
+
+def test_note_flags_are_stored_and_seeded_over_the_full_history(monkeypatch):
+    store = _store()
+    monkeypatch.setattr(lead_service, "_store", store)
+    monkeypatch.setattr(lead_service, "_leads", lead_service.LeadStore())
+    lead = lead_service.add_lead(Lead(id="hist-1", stage="Interested", lastSeenSec=1))
+    for note in ("price is too high", "let's close the deal", "a", "b", "c"):
+        lead_service.append_note(lead, note)
+    assert "close" not in lead.notes  # only the newest notes are in the summary
+    assert lead_service.flush_leads() == 1
+    assert "notesClosing" not in lead_service.get_lead("hist-1").model_dump()
+
+    # restart: the counters come from the table, not from the summary
+    monkeypatch.setattr(lead_service, "_leads", lead_service.LeadStore())
+    assert lead_service.seed_aggregates()
+    assert lead_service.get_funnel()["close"] == 100
+    assert lead_service.get_objections() == ["💸 Price too high (1)"]
+
+    lead = lead_service.get_lead("hist-1")  # hydrated with its stored flags
+    assert lead.notesClosing and lead.notesObjections == ["💸 Price too high"]
+    lead_service.delete_lead("hist-1")
+    assert lead_service.get_funnel()["close"] == 0 and lead_service.get_objections() == []
@@ -0,0 +1,35 @@
+import asyncio
+import threading
+
+import bcrypt
+import pytest
+
+from app.auth import security
+from app.core.password_pool import PasswordPool, PasswordPoolBusy
+
+
+def test_queue_is_bounded_and_counted():
+    pool = PasswordPool(workers=1, queue_max=1, kind="thread")
+    gate = threading.Event()
+    running = pool.submit(gate.wait, 5)
+    waiting = pool.submit(lambda: "done")
+    assert (pool.in_flight, pool.queued) == (2, 1)
+    with pytest.raises(PasswordPoolBusy):
+        pool.submit(lambda: "rejected")
+    gate.set()
+    assert running.result(5) is True and waiting.result(5) == "done"
+    s = pool.stats()
+    assert (s["in_flight"], s["completed"], s["rejected"]) == (0, 2, 1)
+    pool.shutdown()
+
+
+def test_async_verify_runs_on_the_pool():
+    hashed = bcrypt.hashpw(b"pw", bcrypt.gensalt(rounds=4)).decode()
+
+    async def check():
+        return await asyncio.gather(
+            security.verify_password_async("pw", hashed),
+            security.verify_password_async("nope", hashed),
+        )
+
+    assert asyncio.run(check()) == [True, False]
@@ -0,0 +1,104 @@
+import logging
+
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+from app.middleware import request_logger
+from app.middleware.request_logger import RequestLoggerMiddleware
+
+
+class _Records(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.lines = []
+
+    def emit(self, record):
+        self.lines.append(record.getMessage())
+
+
+def _client(monkeypatch, caplog, **opts):
+    monkeypatch.setattr(request_logger, "_ensure_queue_logging", lambda: None)
+    records = _Records()
+    request_logger.logger.addHandler(records)
+    caplog.set_level(logging.INFO, logger=request_logger.logger.name)  # restored after the test
+    app = FastAPI()
+    app.add_middleware(RequestLoggerMiddleware, **opts)
+
+    @app.post("/echo")
+    async def echo(request: Request):
+        return {"size": len(await request.body())}
+
+    @app.post("/api/auth/login")
+    async def login(request: Request):
+        return {"size": len(await request.body())}
+
+    @app.get("/stream")
+    def stream():
+        return StreamingResponse((b"x" * 10 for _ in range(3)), media_type="text/event-stream")
+
+    @app.get("/missing")
+    def missing():
+        return StreamingResponse(iter([b"no"]), status_code=404)
+
+    return TestClient(app), records
+
+
+def test_body_prefix_status_and_streamed_sizes(monkeypatch, caplog):
+    client, records = _client(monkeypatch, caplog, body_bytes=8, sample=1.0)
+    try:
+        r = client.post("/echo", json={"payload": "a" * 100}, headers={"X-Sid": "s1"})
+        assert r.json()["size"] > 100  # the app still sees the whole body
+        assert client.get("/stream").content == b"x" * 30
+        client.post("/echo", files={"f": ("a.bin", b"\0" * 5000)})
+    finally:
+        request_logger.logger.removeHandler(records)
+
+    echo, stream, upload = records.lines
+    assert "sid=s1 POST /echo -> 200" in echo and "body='{\"payloa…'" in echo
+    assert "GET /stream -> 200" in stream and "out=30B" in stream
+    assert "body=" not in upload and "in=" in upload  # multipart never captured
+
+
+def test_sampling_keeps_errors(monkeypatch, caplog):
+    client, records = _client(monkeypatch, caplog, sample=0.0)
+    try:
+        client.get("/stream")
+        client.get("/missing")
+    finally:
+        request_logger.logger.removeHandler(records)
+    assert len(records.lines) == 1 and "-> 404" in records.lines[0]
+
+
+def test_bodies_are_opt_in_and_credentials_never_logged(monkeypatch, caplog):
+    client, records = _client(monkeypatch, caplog, sample=1.0)
+    try:
+        client.post("/echo", json={"payload": "x"})  # default: no body capture
+    finally:
+        request_logger.logger.removeHandler(records)
+    assert "body=" not in records.lines[0]
+
+    client, records = _client(monkeypatch, caplog, body_bytes=200, sample=1.0)
+    try:
+        client.post("/api/auth/login", json={"username": "admin", "password": "hunter2"})
+        client.post("/echo", json={"username": "admin", "password": "hunter2"})
+    finally:
+        request_logger.logger.removeHandler(records)
+    login, echo = records.lines
+    assert "POST /api/auth/login -> 200" in login and "body=" not in login  # skipped path
+    assert "hunter2" not in echo and '"password":"***"' in echo and '"username":"admin"' in echo
+
+
+def test_queue_handler_leaves_formatting_to_the_listener(monkeypatch):
+    import queue
+
+    formatted = []
+    monkeypatch.setattr(logging.Formatter, "format", lambda self, r: formatted.append(r) or r.getMessage())
+    q = queue.Queue(maxsize=1)
+    handler = request_logger._DroppingQueueHandler(q)
+    handler.setFormatter(logging.Formatter())
+    for i in range(2):
+        handler.handle(logging.LogRecord("ace.http", logging.INFO, __file__, 1, "req %d", (i,), None))
+    record = q.get_nowait()
+    assert formatted == [] and record.args == (0,) and record.getMessage() == "req 0"
+    assert handler.dropped == 1
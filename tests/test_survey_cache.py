@@ -0,0 +1,116 @@
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from app.models.orm import Organization, Survey
+from app.services import survey_cache
+
+FLOW = {"nodes": [{"id": "q1", "choices": [{"title": "Yes", "score": 10}, {"title": "No", "score": -5}]}]}
+
+
+def _db():
+    engine = create_engine("sqlite://")
+    Organization.__table__.create(engine)
+    Survey.__table__.create(engine)
+    queries = []
+    event.listen(engine, "before_cursor_execute", lambda *a: queries.append(a[2]))
+    return sessionmaker(bind=engine)(), queries
+
+
+def test_resolve_is_cached_until_invalidated():
+    db, queries = _db()
+    org = Organization(slug="cache-org", name="Cache Org")
+    db.add(org)
+    db.commit()
+    survey = Survey(organization_id=org.id, name="S", slug="s1", status="draft", flow_json=FLOW)
+    db.add(survey)
+    db.commit()
+    survey_cache.invalidate()
+
+    assert survey_cache.resolve(db, "cache-org", "s1").compiled is None  # not live yet
+    n = len(queries)
+    assert survey_cache.resolve(db, "cache-org", "s1").compiled is None
+    assert len(queries) == n  # miss is cached too
+
+    survey.status = "live"
+    db.commit()
+    survey_cache.invalidate(org_id=org.id, survey_id=survey.id)
+
+    d = survey_cache.resolve(db, "cache-org", "s1")
+    assert d.survey_id == survey.id and d.compiled.answer_score("q1", "Yes") == 10
+    n = len(queries)
+    for _ in range(5):
+        assert survey_cache.resolve(db, "cache-org", "s1") is d
+    assert len(queries) == n  # steady state: no DB reads
+
+    assert survey_cache.invalidate(survey_id=survey.id) == 1
+    assert survey_cache.resolve(None, "cache-org", "s1") is None
+
+
+def test_public_page_served_from_cache_with_etag():
+    import json
+
+    from app.api.public_survey import get_survey_by_slug, get_survey_variant_b
+
+    db, queries = _db()
+    org = Organization(slug="page-org", name="Page Org")
+    db.add(org)
+    db.commit()
+    survey = Survey(organization_id=org.id, name="P", slug="p1", status="live", flow_json=FLOW)
+    db.add(survey)
+    db.commit()
+    survey_cache.invalidate()
+
+    first = get_survey_by_slug("page-org", "p1", sid=None, db=db, if_none_match=None)
+    body = json.loads(first.body)
+    assert body["flow"] == FLOW and body["variant"] is None and body["org_slug"] == "page-org"
+    etag = first.headers["etag"]
+
+    n = len(queries)
+    assert get_survey_by_slug("page-org", "p1", sid=None, db=db, if_none_match=etag).status_code == 304
+    assert get_survey_by_slug("page-org", "p1", sid=None, db=db, if_none_match=None).body == first.body
+    assert len(queries) == n
+
+    survey.status = "archived"
+    db.commit()
+    survey_cache.invalidate(org_id=org.id, survey_id=survey.id)
+    with pytest.raises(HTTPException) as exc:
+        get_survey_variant_b("page-org", "p1", db=db, if_none_match=None)
+    assert exc.value.status_code == 404
+
+
+def test_invalidate_reaches_other_workers_over_the_event_bus():
+    import asyncio
+
+    from app.services import event_bus
+
+    db, queries = _db()
+    org = Organization(slug="bus-org", name="Bus Org")
+    db.add(org)
+    db.commit()
+    survey = Survey(organization_id=org.id, name="B", slug="b1", status="live", flow_json=FLOW)
+    db.add(survey)
+    db.commit()
+    survey_cache.invalidate()
+    assert survey_cache.resolve(db, "bus-org", "b1").survey_id == survey.id
+
+    async def main():
+        await event_bus.start()
+        before = event_bus._seq.get(survey_cache.INVALIDATE_TOPIC, 0)
+        await asyncio.to_thread(survey_cache.invalidate, survey_id=survey.id)  # as from a sync endpoint
+        for _ in range(50):
+            if event_bus._seq.get(survey_cache.INVALIDATE_TOPIC, 0) > before:
+                break
+            await asyncio.sleep(0.01)
+        return event_bus._hist[survey_cache.INVALIDATE_TOPIC].since(before)
+
+    published = asyncio.run(main())
+    assert [e["payload"] for e in published] == [{"org_id": None, "survey_id": survey.id}]
+
+    assert survey_cache.resolve(db, "bus-org", "b1").survey_id == survey.id
+    # another worker's invalidate() arrives as an event on the internal topic
+    seq = event_bus._seq[survey_cache.INVALIDATE_TOPIC] + 1
+    evt = {"type": "survey_cache.invalidate", "payload": {"org_id": None, "survey_id": survey.id}}
+    event_bus._apply([(survey_cache.INVALIDATE_TOPIC, seq, evt, False)])
+    assert survey_cache.resolve(None, "bus-org", "b1") is None
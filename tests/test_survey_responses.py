@@ -0,0 +1,122 @@
+import csv
+import io
+import json
+from datetime import datetime, timedelta
+
+from fastapi import Response
+
+from app.api.surveys import get_survey_responses
+from app.auth.permissions import AuthContext
+from app.core.db import SessionLocal, engine
+from app.models.orm import Organization, Survey, SurveyResponse, SurveyStatsRollup
+from app.services import survey_export
+
+
+def _seed(n):
+    for model in (Organization, Survey, SurveyResponse, SurveyStatsRollup):
+        model.__table__.create(engine, checkfirst=True)
+    db = SessionLocal()
+    slug = f"export-{datetime.utcnow().timestamp():.6f}"
+    org = Organization(slug=slug, name="Export")
+    db.add(org)
+    db.commit()
+    survey = Survey(organization_id=org.id, name="E", slug=slug, status="live")
+    db.add(survey)
+    db.commit()
+    t0 = datetime(2026, 1, 1)
+    # several rows share a created_at, so the id tie-break matters
+    db.add_all(
+        SurveyResponse(survey_id=survey.id, organization_id=org.id, sid=f"s{i}", score=i,
+                       survey_answers={"q1": i}, created_at=t0 + timedelta(seconds=i // 3))
+        for i in range(n)
+    )
+    db.commit()
+    return db, org, survey
+
+
+def test_keyset_pages_cover_every_response_once():
+    db, org, survey = _seed(25)
+    auth = AuthContext(1, "u", org.id, "org_user", db)
+    seen, cursor = [], None
+    while True:
+        resp = Response()
+        page = get_survey_responses(org.id, survey.id, resp, limit=7, cursor=cursor, auth=auth, db=db)
+        seen += [r.sid for r in page]
+        cursor = resp.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    assert len(seen) == 25 and len(set(seen)) == 25
+    assert seen[0] == "s24" and seen[-1] == "s0"
+    db.close()
+
+
+def test_export_streams_csv_and_ndjson():
+    db, org, survey = _seed(12)
+    rows = list(csv.DictReader(io.StringIO("".join(survey_export.iter_csv(survey.id)))))
+    assert [r["sid"] for r in rows] == [f"s{i}" for i in range(12)]
+    assert json.loads(rows[5]["survey_answers"]) == {"q1": 5}
+
+    lines = "".join(survey_export.iter_ndjson(survey.id)).splitlines()
+    assert len(lines) == 12 and json.loads(lines[-1])["score"] == 11
+    db.close()
+
+
+def test_submit_is_one_upsert_per_visitor():
+    from app.api.public_survey import submit_survey_response
+    from app.models.schemas import SurveyResponseCreate
+    from app.services import survey_cache
+
+    db, org, survey = _seed(0)
+    survey.flow_json = {"nodes": [{"id": "q1"}, {"id": "q2"}]}
+    db.commit()
+    survey_cache.invalidate()
+
+    from sqlalchemy import event
+
+    statements = []
+
+    def log(conn, cursor, sql, *args):
+        statements.append(sql)
+
+    first = submit_survey_response(org.slug, survey.slug, SurveyResponseCreate(
+        survey_id=survey.id, sid="v1", survey_answers={"q1": {"score": 40}}, email="a@b.c"), db=db)
+    event.listen(engine, "before_cursor_execute", log)
+    try:
+        again = submit_survey_response(org.slug, survey.slug, SurveyResponseCreate(
+            survey_id=survey.id, sid="v1", survey_answers={"q1": {"score": 40}, "q2": {"score": 100}}), db=db)
+    finally:
+        event.remove(engine, "before_cursor_execute", log)
+    assert [sql.split()[0] for sql in statements if "survey_responses" in sql] == ["WITH"]  # one round-trip
+
+    assert again["id"] == first["id"] and again["created_at"] == first["created_at"]
+    assert again["survey_progress"] == 100 and again["score"] == 85
+    assert again["email"] == "a@b.c"  # not overwritten by an empty value
+    assert db.query(SurveyResponse).filter_by(survey_id=survey.id).count() == 1
+    db.close()
+
+
+def test_resubmit_after_completion_keeps_the_rollup_current():
+    from app.api.public_survey import complete_survey, submit_survey_response
+    from app.models.schemas import SurveyResponseCreate
+    from app.services import survey_cache, survey_stats
+
+    db, org, survey = _seed(0)
+    survey.flow_json = {"nodes": [{"id": "q1"}, {"id": "q2"}]}
+    db.commit()
+    survey_cache.invalidate()
+    assert survey_stats.stats(db, survey.id)["total_responses"] == 0  # builds the rollup
+
+    def submit(sid, answers):
+        return submit_survey_response(org.slug, survey.slug, SurveyResponseCreate(
+            survey_id=survey.id, sid=sid, survey_answers=answers), db=db)
+
+    submit("v1", {"q1": {"score": 40}})
+    complete_survey(survey.slug, "v1", db=db)
+    submit("v1", {"q1": {"score": 40}, "q2": {"score": 100}})  # score of a completed response moves
+    submit("v2", {"q1": {"score": 10}})
+    assert db.query(SurveyStatsRollup).filter_by(survey_id=survey.id).count() == 3  # bumped, not dropped
+
+    st = survey_stats.stats(db, survey.id)
+    assert (st["total_responses"], st["completed_responses"], st["avg_score"]) == (2, 1, 85.0)
+    assert st == survey_stats.stats(db, survey.id, refresh=True)
+    db.close()
@@ -0,0 +1,68 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.models.orm import Organization, Survey, SurveyResponse, SurveyStatsRollup
+from app.services import survey_stats
+
+
+def _db():
+    engine = create_engine("sqlite://")
+    for model in (Organization, Survey, SurveyResponse, SurveyStatsRollup):
+        model.__table__.create(engine)
+    return sessionmaker(bind=engine)()
+
+
+def _row(r):
+    return {c.name: getattr(r, c.name) for c in SurveyResponse.__table__.c}
+
+
+def _response(db, survey, sid, variant, score, minutes=None):
+    start = datetime(2026, 1, 1, 12, 0)
+    r = SurveyResponse(
+        survey_id=survey.id, organization_id=survey.organization_id, sid=sid, variant=variant,
+        score=score, survey_started_at=start,
+        survey_completed_at=start + timedelta(minutes=minutes) if minutes is not None else None,
+    )
+    db.add(r)
+    db.commit()
+    return r
+
+
+def test_rollup_built_once_then_maintained_incrementally():
+    db = _db()
+    org = Organization(slug="stats-org", name="Stats")
+    db.add(org)
+    db.commit()
+    survey = Survey(organization_id=org.id, name="AB", slug="ab", survey_type="ab_test", status="live")
+    db.add(survey)
+    db.commit()
+
+    _response(db, survey, "s1", "a", 80, minutes=4)
+    _response(db, survey, "s2", "a", 40)
+    _response(db, survey, "s3", "b", 60, minutes=2)
+
+    st = survey_stats.stats(db, survey.id)  # first read builds the rollup
+    assert (st["total_responses"], st["completed_responses"], st["avg_score"]) == (3, 2, 70.0)
+    assert st["avg_completion_time_minutes"] == 3.0
+    assert st["variants"]["a"] == {"responses": 2, "avg_score": 80.0}
+
+    # submit + completion go through the record_* hooks
+    r = SurveyResponse(survey_id=survey.id, organization_id=org.id, sid="s4", variant="b", score=20,
+                       survey_started_at=datetime(2026, 1, 1, 12, 0))
+    db.add(r)
+    survey_stats.record_submit(db, _row(r), created=True)
+    db.commit()
+    r.survey_completed_at = datetime(2026, 1, 1, 12, 6)
+    survey_stats.record_completion(db, r)
+    db.commit()
+    old = r.score
+    r.score = 30
+    survey_stats.record_submit(db, _row(r), created=False, old_score=old)
+    db.commit()
+
+    incremental = survey_stats.stats(db, survey.id)
+    assert incremental == survey_stats.stats(db, survey.id, refresh=True)
+    assert incremental["variants"]["b"] == {"responses": 2, "avg_score": 45.0}
+    assert incremental["avg_completion_time_minutes"] == 4.0